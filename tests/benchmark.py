@@ -0,0 +1,289 @@
+'''
+PAM performance benchmarks.
+
+Generates synthetic vaults of PAM_BENCH_SIZES records (1000, 10000
+and 50000 by default) with tools/pamgen.py, plaintext and PAMv2
+(encrypted in the page by encryptV2()), and drives PAM through
+Selenium to measure:
+
+    load_ms            the load, from the file selection until PAM is idle
+    first_record_ms    the time to the first record in the DOM
+    search_*_ms        the searchRecords() latency for each keystroke
+    save_ms            saveFile(), from the Save button to the download
+    heap_mb            the JS heap after the load (CDP or performance.memory)
+
+The results are written to PAM_BENCH_RESULTS as JSON and checked
+against the thresholds in tests/bench-thresholds.json, a benchmark
+fails when a metric exceeds its threshold times PAM_BENCH_SLACK.
+
+The benchmarks are not part of make test, run them with make bench:
+
+    make bench PAM_BENCH_SIZES=1000,10000
+'''
+import json
+import os
+import platform
+import statistics
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+from pamgen import VaultGenerator, generate_json
+from waits import WAIT_TIMEOUT, wait_for_idle, wait_for_modal_shown, wait_for_modal_hidden
+
+SIZES = [int(size) for size in os.getenv('PAM_BENCH_SIZES', '1000,10000,50000').split(',')]
+FORMATS = ['plain', 'v2']
+RESULTS_FILE = Path(os.getenv('PAM_BENCH_RESULTS', 'benchmark-results.json'))
+THRESHOLDS_FILE = Path(os.getenv('PAM_BENCH_THRESHOLDS',
+                                 str(Path(__file__).with_name('bench-thresholds.json'))))
+# Use PAM_BENCH_SLACK=2 on slow machines.
+SLACK = float(os.getenv('PAM_BENCH_SLACK', '1'))
+# Each keystroke of the query is searched SEARCH_ROUNDS times.
+SEARCH_QUERY = os.getenv('PAM_BENCH_QUERY', 'account 42')
+SEARCH_ROUNDS = int(os.getenv('PAM_BENCH_SEARCH_ROUNDS', '5'))
+
+PASSWORD = 'benchmark-password'
+SEED = 42
+# selenium transfers the vault to the page in chunks of this many characters
+CHUNK_SIZE = 1 << 20
+BENCH_TIMEOUT = max(WAIT_TIMEOUT, 600)
+SCRIPT_TIMEOUT = 30  # the selenium default
+
+METRICS = ['load_ms', 'first_record_ms', 'search_median_ms', 'search_p95_ms',
+           'search_max_ms', 'save_ms', 'heap_mb']
+
+# Load the vault from window.__pamBench.text through the file selection
+# input of the Load dialogue, as if the user had chosen the file after
+# clicking Load (which closes the dialogue).
+LOAD_SCRIPT = '''
+    const [filename, password, done] = arguments
+    let file = new File([window.__pamBench.text], filename, {type: 'text/plain'})
+    delete window.__pamBench
+    const accordion = document.getElementById('records-accordion')
+    const input = document.getElementById('x-load-file-select-input')
+    const transfer = new DataTransfer()
+    transfer.items.add(file)
+    file = null
+    let first = null
+    const start = performance.now()
+    const observer = new MutationObserver(() => {
+        let now = performance.now()
+        if (first === null && accordion.querySelector('.accordion-button')) {
+            first = now - start
+        }
+        if (first !== null && document.body.dataset.busy === '0') {
+            observer.disconnect()
+            done({load_ms: now - start, first_record_ms: first})
+        }
+    })
+    observer.observe(document.body, {subtree: true, childList: true,
+                                     attributes: true, attributeFilter: ['data-busy']})
+    document.getElementById('x-load-password').value = password
+    input.files = transfer.files
+    input.dispatchEvent(new Event('change'))
+'''
+
+# Encrypt window.__pamBench.text with the encryptV2() of the app.
+ENCRYPT_V2_SCRIPT = '''
+    const [password, filename, done] = arguments
+    import(new URL('js/crypt.js', document.baseURI).href).then((crypt) => {
+        crypt.encryptV2(password, window.__pamBench.text, filename, (ciphertext) => {
+            window.__pamBench.text = ciphertext
+            done(ciphertext.length)
+        })
+    })
+'''
+
+# Time searchRecords() for each keystroke of the query.
+SEARCH_SCRIPT = '''
+    const [query, rounds, done] = arguments
+    import(new URL('js/search.js', document.baseURI).href).then((search) => {
+        let samples = []
+        for (let round = 0; round < rounds; round++) {
+            for (let i = 1; i <= query.length; i++) {
+                let start = performance.now()
+                search.searchRecords(query.slice(0, i))
+                samples.push(performance.now() - start)
+            }
+        }
+        search.searchRecords('')
+        done(samples)
+    })
+'''
+
+# Click the Save button of the save dialogue and time it until the
+# download link is created.
+SAVE_SCRIPT = '''
+    const [filename, password, done] = arguments
+    const dlg = document.getElementById('menuSaveDlg')
+    window.prefs.useSaveFilePicker = false
+    dlg.querySelector('#x-save-filename').value = filename
+    dlg.querySelector('#x-save-password').value = password
+    const start = performance.now()
+    const observer = new MutationObserver(() => {
+        if (document.body.querySelector(':scope > a[download]')) {
+            observer.disconnect()
+            done(performance.now() - start)
+        }
+    })
+    observer.observe(document.body, {childList: true})
+    dlg.querySelector('.x-fld-record-save').click()
+'''
+
+SHOW_DIALOG_SCRIPT = '''
+    bootstrap.Modal.getOrCreateInstance(document.getElementById(arguments[0])).show()
+'''
+
+
+def upload_text(driver, text: str):
+    '''
+    Transfer the text to window.__pamBench.text in the page.
+    '''
+    driver.execute_script('window.__pamBench = {chunks: []}')
+    for i in range(0, len(text), CHUNK_SIZE):
+        driver.execute_script('window.__pamBench.chunks.push(arguments[0])', text[i:i + CHUNK_SIZE])
+    driver.execute_script('window.__pamBench.text = window.__pamBench.chunks.join("")\n'
+                          'delete window.__pamBench.chunks')
+
+
+def show_dialog(driver, dlg_id: str):
+    '''
+    Show the modal dialogue and wait until it is shown.
+    '''
+    driver.execute_script(SHOW_DIALOG_SCRIPT, dlg_id)
+    return wait_for_modal_shown(driver, (By.ID, dlg_id), BENCH_TIMEOUT)
+
+
+def heap_size(driver) -> int:
+    '''
+    The bytes in use on the JS heap after a garbage collection.
+    Uses performance.memory if CDP is not available.
+    '''
+    try:
+        driver.execute_cdp_cmd('HeapProfiler.collectGarbage', {})
+        driver.execute_cdp_cmd('Performance.enable', {})
+        metrics = driver.execute_cdp_cmd('Performance.getMetrics', {})['metrics']
+        return next(int(metric['value']) for metric in metrics
+                    if metric['name'] == 'JSHeapUsedSize')
+    except (AttributeError, StopIteration, WebDriverException):
+        return driver.execute_script(
+            'return performance.memory ? performance.memory.usedJSHeapSize : 0')
+
+
+def percentile(samples: list, pct: float) -> float:
+    '''
+    The nearest rank percentile of the samples.
+    '''
+    ordered = sorted(samples)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def bench_load(driver, vault_format: str, num: int) -> dict:
+    '''
+    Load a generated vault and measure the load and the heap.
+    '''
+    text = ''.join(generate_json(VaultGenerator(num=num, seed=SEED)))
+    result = {'format': vault_format, 'records': num}
+    upload_text(driver, text)
+    password = ''
+    if vault_format == 'v2':
+        password = PASSWORD
+        result['bytes'] = driver.execute_async_script(ENCRYPT_V2_SCRIPT, password, 'bench.txt')
+    else:
+        result['bytes'] = len(text.encode('utf-8'))
+    result.update(driver.execute_async_script(LOAD_SCRIPT, f'bench-{num}.txt', password))
+    result['heap_mb'] = heap_size(driver) / (1024 * 1024)
+    return result
+
+
+def bench_search(driver) -> dict:
+    '''
+    Measure the searchRecords() latency of each keystroke.
+    '''
+    samples = driver.execute_async_script(SEARCH_SCRIPT, SEARCH_QUERY, SEARCH_ROUNDS)
+    wait_for_idle(driver, BENCH_TIMEOUT)
+    return {
+        'search_samples': len(samples),
+        'search_median_ms': statistics.median(samples),
+        'search_p95_ms': percentile(samples, 95),
+        'search_max_ms': max(samples),
+    }
+
+
+def bench_save(driver, password: str) -> dict:
+    '''
+    Measure saveFile() through the save dialogue.
+    '''
+    dlg = show_dialog(driver, 'menuSaveDlg')
+    save_ms = driver.execute_async_script(SAVE_SCRIPT, 'bench-save.txt', password)
+    wait_for_modal_hidden(driver, dlg, BENCH_TIMEOUT)
+    wait_for_idle(driver, BENCH_TIMEOUT)
+    return {'save_ms': save_ms}
+
+
+def check_thresholds(result: dict, thresholds: dict) -> list:
+    '''
+    The metrics of the result that exceed their thresholds.
+    '''
+    limits = thresholds.get(result['format'], {}).get(str(result['records']), {})
+    failures = []
+    for metric in METRICS:
+        if metric in limits and result[metric] > limits[metric] * SLACK:
+            failures.append(f'{result["format"]}/{result["records"]} {metric}: '
+                            f'{result[metric]:.1f} > {limits[metric] * SLACK:.1f}')
+    return failures
+
+
+@pytest.fixture(scope='module', name='bench_results')
+def bench_results_fixture():
+    '''
+    Collect the results of the benchmarks and write them to RESULTS_FILE.
+    '''
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'platform': platform.platform(),
+            'query': SEARCH_QUERY,
+            'slack': SLACK,
+            'thresholds': str(THRESHOLDS_FILE),
+        },
+        'results': [],
+        'failures': [],
+    }
+    yield report
+    RESULTS_FILE.write_text(json.dumps(report, indent=4) + '\n', encoding='utf-8')
+    print(f'\nbenchmark results written to {RESULTS_FILE}')
+
+
+@pytest.fixture(scope='module', name='thresholds')
+def thresholds_fixture():
+    '''
+    The regression thresholds.
+    '''
+    return json.loads(THRESHOLDS_FILE.read_text(encoding='utf-8'))
+
+
+@pytest.mark.parametrize('num', SIZES)
+@pytest.mark.parametrize('vault_format', FORMATS)
+def test_benchmark(driver, bench_results, thresholds, vault_format, num):
+    '''
+    Benchmark load, search and save of a generated vault.
+    '''
+    driver.set_script_timeout(BENCH_TIMEOUT)
+    try:
+        result = bench_load(driver, vault_format, num)
+        result.update(bench_search(driver))
+        result.update(bench_save(driver, PASSWORD if vault_format == 'v2' else ''))
+        result['user_agent'] = driver.execute_script('return navigator.userAgent')
+    finally:
+        driver.set_script_timeout(SCRIPT_TIMEOUT)
+    failures = check_thresholds(result, thresholds)
+    bench_results['results'].append(result)
+    bench_results['failures'].extend(failures)
+    print('\n' + ' '.join(f'{key}={value:.1f}' for key, value in result.items()
+                          if isinstance(value, float)))
+    assert not failures, '\n'.join(failures)
@@ -0,0 +1,174 @@
+'''
+PAM pytest fixtures.
+
+The Selenium tests share a session scoped pool of headless Chrome
+drivers instead of starting a browser for each test. A test asks for
+the driver fixture, it gets an idle driver from the pool (a new one is
+started if there is none) with the app state reset and PAM loaded, and
+the driver goes back to the pool when the test is done.
+
+The pool belongs to the pytest process. To shard the tests across the
+cores run them with pytest-xdist (make e2e-test does this), each worker
+then has its own pool and the tests are spread over the workers:
+
+    pytest -n auto tests/test_chrome.py
+
+Use PAM_DRIVER_REUSE=0 to start a new browser for every test when a
+test is suspected of leaking state.
+'''
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from selenium import webdriver
+from selenium.common.exceptions import NoAlertPresentException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from waits import wait_for_idle
+
+# the tests import the tools, for example the vault generator tools/pamgen.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+PORT = os.getenv('PORT', '8081')
+APP_URL = f'http://localhost:{PORT}/'
+
+# Use this when testing interactively or debugging (NO_OPTIONS=1).
+NO_OPTIONS = 'NO_OPTIONS' in os.environ
+
+# Set PAM_DRIVER_REUSE=0 to quit the driver after each test.
+DRIVER_REUSE = os.getenv('PAM_DRIVER_REUSE', '1') != '0'
+
+# Clear the browser storage of the PAM origin: the prefs and the cached
+# password (localStorage and sessionStorage) and the vault cache (IndexedDB).
+RESET_STORAGE_SCRIPT = '''
+    const done = arguments[arguments.length - 1]
+    localStorage.clear()
+    sessionStorage.clear()
+    if (!window.indexedDB) {
+        done()
+        return
+    }
+    const request = indexedDB.deleteDatabase('pam')
+    request.onsuccess = request.onerror = request.onblocked = () => done()
+'''
+
+
+def get_driver() -> WebDriver:
+    '''
+    Get the webdriver and set the options for headless mode.
+    '''
+    # https://stackoverflow.com/questions/53657215/running-selenium-with-headless-chrome-webdriver
+    if NO_OPTIONS:
+        return webdriver.Chrome()  # pylint: disable=not-callable
+    options = Options()
+    options.add_argument("--no-sandbox")
+    options.add_argument('--disable-cache')
+    options.add_argument('--disable-application-cache')
+    options.add_argument('--disk-cache-size=0')
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-popup-blocking")
+    options.add_argument("--log-level=3")
+    options.add_argument("--silent")
+    options.add_argument("--start-maximized")
+    options.add_argument("--headless")
+    driver = webdriver.Chrome(options=options)  # pylint: disable=not-callable
+    driver.set_window_size(1920, 1080)
+    return driver
+
+
+def reset_driver(driver: WebDriver):
+    '''
+    Reset the browser to a freshly started PAM: dismiss any alert left
+    open, close the windows a test opened, clear the storage, load the
+    app again and wait until it has started.
+    '''
+    try:
+        driver.switch_to.alert.dismiss()
+    except NoAlertPresentException:
+        pass
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.get(APP_URL)
+    driver.execute_async_script(RESET_STORAGE_SCRIPT)
+    driver.get(APP_URL)
+    wait_for_idle(driver)
+
+
+class DriverPool:
+    '''
+    Pool of webdrivers that are reused across tests.
+    '''
+    def __init__(self):
+        self.idle = []
+        self.drivers = []
+
+    def acquire(self) -> WebDriver:
+        '''
+        Get an idle driver, start a new one if there is none.
+        '''
+        if self.idle:
+            return self.idle.pop()
+        driver = get_driver()
+        self.drivers.append(driver)
+        return driver
+
+    def release(self, driver: WebDriver):
+        '''
+        Give a driver back to the pool.
+        '''
+        if DRIVER_REUSE:
+            self.idle.append(driver)
+        else:
+            self.discard(driver)
+
+    def discard(self, driver: WebDriver):
+        '''
+        Quit a driver that cannot be reused.
+        '''
+        self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def close(self):
+        '''
+        Quit all of the drivers.
+        '''
+        for driver in list(self.drivers):
+            self.discard(driver)
+        self.idle.clear()
+
+
+@pytest.fixture(scope='session', name='driver_pool')
+def driver_pool_fixture():
+    '''
+    The pool of webdrivers for this pytest process (or xdist worker).
+    '''
+    pool = DriverPool()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(name='driver')
+def driver_fixture(driver_pool):
+    '''
+    A webdriver with PAM freshly loaded from APP_URL.
+    '''
+    drv = driver_pool.acquire()
+    try:
+        reset_driver(drv)
+    except WebDriverException:
+        # the browser is broken (crashed or hung), start a new one
+        driver_pool.discard(drv)
+        drv = driver_pool.acquire()
+        reset_driver(drv)
+    yield drv
+    driver_pool.release(drv)
@@ -2,44 +2,15 @@
 PAM pytest module.
 '''  # pylint: disable=too-many-lines
 import json
-import os
-import time
 
-from selenium import webdriver
+import pytest
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.remote.webdriver import WebDriver
 
-
-# Use this when testing interactively or debugging (NO_OPTIONS=1).
-#NO_OPTIONS = False if not os.getenv('NO_OPTIONS') else True
-NO_OPTIONS = 'NO_OPTIONS' in os.environ
-
-def get_driver():
-    '''
-    Get the webdriver and set the options for headless mode.
-    '''
-    # https://stackoverflow.com/questions/53657215/running-selenium-with-headless-chrome-webdriver
-    if NO_OPTIONS:
-        return webdriver.Chrome()  # pylint: disable=not-callable
-    options = Options()
-    options.add_argument("--no-sandbox")
-    options.add_argument('--disable-cache')
-    options.add_argument('--disable-application-cache')
-    options.add_argument('--disk-cache-size=0')
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-popup-blocking")
-    options.add_argument("--log-level=3")
-    options.add_argument("--silent")
-    options.add_argument("--start-maximized")
-    options.add_argument("--headless")
-    driver =  webdriver.Chrome(options=options)  # pylint: disable=not-callable
-    driver.set_window_size(1920, 1080)
-    return driver
+from waits import (wait_until, wait_for_script, wait_for_idle, wait_for_transitions,
+                   wait_for_modal_shown, wait_for_modal_hidden, wait_for_alert,
+                   record_count, wait_for_record_count, wait_for_record_count_change)
 
 
 def get_parent(element):
@@ -81,69 +52,77 @@ def set_theme(driver, requested_theme):
     if current_theme == requested_theme:
         return  # theme is already the current theme
     toggle_dark_light_mode(driver)
-    time.sleep(0.5)
+    wait_until(driver,
+               lambda drv: body.get_attribute('data-bs-theme') == requested_theme,
+               f'the theme did not change to {requested_theme}')
+    wait_for_transitions(driver)
 
 def scroll_and_click(driver: WebDriver, element):
     '''
     Scroll into position for element click to avoid overlap.
     '''
-    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-    time.sleep(0.5)
+    # instant: bootstrap makes smooth scrolling the default
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'instant'});",
+                          element)
+    wait_until(driver, EC.element_to_be_clickable(element), 'the element cannot be clicked')
     element.click()
 
-def choose_menu_option(driver, option):
+def open_menu(driver):
     '''
-    Open the PAM menu and choose an option and return the associated dialogue.
+    Open the PAM menu and return the menu items.
     '''
     menu = driver.find_element(By.ID, 'menu')
     menu.click()
-    time.sleep(0.5)
     dropdown = get_parent(menu)
     children = get_children(dropdown)
     assert len(children) == 2
-    menu_items = children[1].find_elements(By.CLASS_NAME, 'dropdown-item')
+    wait_until(driver, EC.visibility_of(children[1]), 'the menu did not open')
+    return children[1].find_elements(By.CLASS_NAME, 'dropdown-item')
+
+def choose_menu_option(driver, option):
+    '''
+    Open the PAM menu and choose an option and return the associated dialogue.
+    '''
+    menu_items = open_menu(driver)
     assert len(menu_items) == 8
-    #breakpoint()
     for menu_item in menu_items:
         if option in menu_item.text:
             scroll_and_click(driver, menu_item)
             break
-    #click_menu_option(driver, option)
-    time.sleep(0.5)
-    dlgs = driver.find_elements(By.CLASS_NAME, 'modal-dialog')
-    modal = None
-    for dlg in dlgs:
-        if dlg.is_displayed():
-            modal = get_parent(dlg)
-    if 'Help' not in option:
-        assert modal  # modal is None for Help
-    return modal
+    if 'Help' in option:
+        return None  # the help opens in a new window
+    return wait_for_modal_shown(driver)
+
+def close_dialog(driver, dlg):
+    '''
+    Click the Close button of the dialogue and wait until it is hidden.
+    '''
+    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
+    assert 'Close' in close_button.text
+    scroll_and_click(driver, close_button)
+    wait_for_modal_hidden(driver, dlg)
 
 
 # https://www.selenium.dev/documentation/webdriver/getting_started/first_script/
-def test_basic_setup():
+def test_basic_setup(driver):
     '''Verify that chrome works in selenium.
     '''
-    driver = get_driver()
     driver.get('https://www.google.com/')
-    time.sleep(1) # Let the user actually see something!
-    search_box = driver.find_element(By.NAME, 'q')
+    search_box = wait_until(driver, EC.element_to_be_clickable((By.NAME, 'q')),
+                            'the search box was not found')
     search_box.send_keys('ChromeDriver')
     search_box.submit()
-    time.sleep(1) # Let the user actually see something!
-    driver.quit()
+    wait_until(driver, EC.title_contains('ChromeDriver'), 'the search did not run')
 
 
-def test_pam_setup():
+def test_pam_setup(driver):
     '''Verify that chrome works in selenium for PAM on port 8081.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
     menu = driver.find_element(By.ID, 'menu')
     assert menu
     menu.click()
-    time.sleep(1)
+    wait_until(driver, EC.visibility_of_element_located((By.CSS_SELECTOR, '.dropdown-menu.show')),
+               'the menu did not open')
     dropdown = get_parent(menu)
     assert dropdown
     assert 'About' in dropdown.text
@@ -165,213 +144,120 @@ def test_pam_setup():
     assert 'Help' in menu_items[7].text # 6 is reserved for Print
 
     # toggle dark/light mode
-    time.sleep(1)
     set_theme(driver, 'light')
-    time.sleep(1)
     set_theme(driver, 'dark')
-    time.sleep(1)
-
-    # all done!
-    driver.quit()
 
 
-def test_about_dlg():
+def test_about_dlg(driver):
     '''
     Test the About dialogue
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # About dialog (light)
     set_theme(driver, 'light')
     dlg = choose_menu_option(driver, 'About')
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # About dialog (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'About')
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
-
-    # All done
-    time.sleep(1)
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_prefs_dlg():
+def test_prefs_dlg(driver):
     '''
     Test the Preferences dialogue
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Preferences dialog (light)
     set_theme(driver, 'light')
     dlg = choose_menu_option(driver, 'Preferences')
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # Preferences dialog (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'Preferences')
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
-    # All done
-    time.sleep(1)
-    driver.quit()
 
-
-def test_new_dlg():
+def test_new_dlg(driver):
     '''
     Test the new record dialogue.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # New Record (light)
     set_theme(driver, 'light')
     dlg = choose_menu_option(driver, 'New Record')
     save_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-save')
     assert 'Save' in save_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # New Record (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'New Record')
     save_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-save')
     assert 'Save' in save_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
-
-    # All done
-    time.sleep(1)
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_clear_dlg():
+def test_clear_dlg(driver):
     '''
     Test the clear records dialogue.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Clear Records (light)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'Clear Records')
     clear_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-clear')
     assert 'Clear' in clear_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # Clear Records (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'Clear Records')
     clear_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-clear')
     assert 'Clear' in clear_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
-    # All done
-    time.sleep(1)
-    driver.quit()
 
-
-def test_load_dlg():
+def test_load_dlg(driver):
     '''
     Test the load file dialogue.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Load File (light)
     set_theme(driver, 'light')
     dlg = choose_menu_option(driver, 'Load File')
     load_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-load')
     assert 'Load' in load_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # Load File (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'Load File')
     load_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-load')
     assert 'Load' in load_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
-
-    # All done
-    time.sleep(1)
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_save_dlg():
+def test_save_dlg(driver):
     '''
     Test the save file dialogue.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Save File (light)
     set_theme(driver, 'light')
     dlg = choose_menu_option(driver, 'Save File')
     save_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-save')
     assert 'Save' in save_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
+    close_dialog(driver, dlg)
 
     # Save File (dark)
     set_theme(driver, 'dark')
     dlg = choose_menu_option(driver, 'Save File')
     save_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-save')
     assert 'Save' in save_button.text
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(1)
-    close_button.click()
-
-    # All done
-    time.sleep(1)
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_help_dlg():
+def test_help_dlg(driver):
     '''
     Test the help dialogue.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
     pam_window_handle = driver.current_window_handle
 
     # Save File (dark)
@@ -379,8 +265,7 @@ def test_help_dlg():
     choose_menu_option(driver, 'Help')
 
     # Best Practice: Wait for the new window to open
-    wait = WebDriverWait(driver, 10)
-    wait.until(EC.number_of_windows_to_be(2))
+    wait_until(driver, EC.number_of_windows_to_be(2), 'the help window did not open')
 
     # switch to the new help window so it can be closed
     assert len(driver.window_handles) == 2
@@ -394,25 +279,16 @@ def test_help_dlg():
     driver.close()
     driver.switch_to.window(pam_window_handle)
 
-    # All done
-    time.sleep(1)
-    driver.quit()
 
-
-def test_example_records():
+def test_example_records(driver):
     '''
     Test the example records.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     dlg = choose_menu_option(driver, 'Load File')
     load_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-load')
     assert 'Load' in load_button.text
     close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
     assert 'Close' in close_button.text
-    time.sleep(1)
     buttons = dlg.find_elements(By.TAG_NAME, 'button')
     load_example_records_button = None
     for button in buttons:
@@ -421,31 +297,24 @@ def test_example_records():
             break
     assert load_example_records_button
     load_example_records_button.click()
-    time.sleep(0.5)
-    assert 'Do you really want to' in driver.switch_to.alert.text
-    driver.switch_to.alert.accept()
-    time.sleep(0.5)
+    alert = wait_for_alert(driver)
+    assert 'Do you really want to' in alert.text
+    alert.accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
     assert len(records) == 7
     assert 'Amazon' in records[0].text
 
-    # All done
-    time.sleep(1)
-    driver.quit()
-
 
 # ---------------------------------------------------------------------------
 # Phase 4 E2E tests — record CRUD, search, preferences navigation
 # ---------------------------------------------------------------------------
 
-def test_record_create_and_delete():
+def test_record_create_and_delete(driver):
     '''
     E2E: Create a new record, verify it appears, then delete it.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Create a new record.
     # Remove default fields from the dialog DOM after it opens so validation passes
     # with a title-only record. This is more robust than filling fields, which would
@@ -465,7 +334,7 @@ def test_record_create_and_delete():
 
     save_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-save')
     scroll_and_click(driver, save_button)
-    time.sleep(1)
+    wait_for_modal_hidden(driver, dlg)
 
     # Verify the record appears in the accordion
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -479,21 +348,18 @@ def test_record_create_and_delete():
         if 'E2E Test Record' in record.text:
             scroll_and_click(driver, record)
             break
-    time.sleep(0.5)
+    wait_for_transitions(driver)
 
     # Find delete button by title attribute (no dedicated CSS class on the button)
     delete_buttons = driver.find_elements(
         By.CSS_SELECTOR, 'button[title="delete this record permanently"]'
     )
     assert len(delete_buttons) > 0, 'Delete button not found'
+    count = record_count(driver)
     scroll_and_click(driver, delete_buttons[0])
-    time.sleep(0.3)
     # UX-002: accept the confirmation dialog
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(0.5)
+    wait_for_alert(driver).accept()
+    wait_for_record_count_change(driver, count)
 
     # Verify record is gone
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -501,17 +367,11 @@ def test_record_create_and_delete():
     assert not any('E2E Test Record' in t for t in titles), \
         'Record should have been deleted'
 
-    driver.quit()
-
 
-def test_search_filters_records():
+def test_search_filters_records(driver):
     '''
     E2E: Load example records and verify search filters correctly.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Load example records
     dlg = choose_menu_option(driver, 'Load File')
     buttons = dlg.find_elements(By.TAG_NAME, 'button')
@@ -522,12 +382,9 @@ def test_search_filters_records():
             break
     assert load_example_button, 'Load Example Records button not found'
     load_example_button.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
 
     # Verify records loaded
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -537,7 +394,7 @@ def test_search_filters_records():
     search_box = driver.find_element(By.ID, 'search')
     search_box.clear()
     search_box.send_keys('Amazon')
-    time.sleep(0.5)
+    wait_for_idle(driver)
 
     # Verify only Amazon is visible
     visible = [r for r in driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -549,54 +406,34 @@ def test_search_filters_records():
     # Clear search
     search_box.clear()
     search_box.send_keys('.')
-    time.sleep(0.5)
-
-    driver.quit()
+    wait_for_idle(driver)
 
 
-def test_preferences_dialog_opens_and_closes():
+def test_preferences_dialog_opens_and_closes(driver):
     '''
     E2E: Open preferences dialog and close it successfully.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     dlg = choose_menu_option(driver, 'Preferences')
     assert dlg is not None, 'Preferences dialog should open'
 
-    close_button = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    assert 'Close' in close_button.text
-    time.sleep(0.5)
-    close_button.click()
-    time.sleep(0.5)
-
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
 # ---------------------------------------------------------------------------
 # Phase 6 E2E tests — UX-001, UX-002, about.js, print.js
 # ---------------------------------------------------------------------------
 
-def test_password_generator():
+def test_password_generator(driver):
     '''
     UX-001: Open the toolbar password generator modal, verify it appears
     with password buttons, test Regenerate, then close it.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Click the Pwd Gen button in the toolbar footer
     gen_btn = driver.find_element(By.ID, 'x-generate-password')
     scroll_and_click(driver, gen_btn)
-    time.sleep(0.5)
 
     # The modal should be visible
-    wait = WebDriverWait(driver, 5)
-    modal = wait.until(
-        EC.visibility_of_element_located((By.ID, 'mainPasswordGeneratorDlg'))
-    )
+    modal = wait_for_modal_shown(driver, (By.ID, 'mainPasswordGeneratorDlg'))
     assert modal.is_displayed(), 'Password generator modal should be visible'
 
     # Modal title should contain 'Password Generator'
@@ -620,7 +457,6 @@ def test_password_generator():
     before = [btn.find_elements(By.TAG_NAME, 'span')[-1].text for btn in pwd_btns]
     regen_btn = modal.find_element(By.XPATH, ".//button[contains(text(),'Regenerate')]")
     scroll_and_click(driver, regen_btn)
-    time.sleep(0.5)
 
     # Passwords should have changed (at least one should differ)
     body = modal.find_element(By.CLASS_NAME, 'modal-body')
@@ -631,22 +467,16 @@ def test_password_generator():
     # Close the modal
     close_btn = modal.find_element(By.XPATH, ".//button[contains(text(),'Close')]")
     scroll_and_click(driver, close_btn)
-    time.sleep(0.5)
+    wait_for_modal_hidden(driver, modal)
 
     # Modal should no longer be visible
     assert not modal.is_displayed(), 'Password generator modal should be hidden after close'
 
-    driver.quit()
-
 
-def test_about_dialog_shows_version():
+def test_about_dialog_shows_version(driver):
     '''
     E2E: Open the About dialog and verify version information is present.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     dlg = choose_menu_option(driver, 'About')
     assert dlg is not None, 'About dialog should open'
 
@@ -655,22 +485,14 @@ def test_about_dialog_shows_version():
     assert 'PAM' in body_text, 'About dialog should mention PAM'
     assert 'Version' in body_text, 'About dialog should show version'
 
-    close_btn = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    scroll_and_click(driver, close_btn)
-    time.sleep(0.5)
-
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_print_dialog_opens():
+def test_print_dialog_opens(driver):
     '''
     E2E: Enable printing in prefs, load example records, and trigger print.
     Verifies the print window opens without error.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Enable printing via prefs
     driver.execute_script("window.prefs.enablePrinting = true")
 
@@ -680,24 +502,17 @@ def test_print_dialog_opens():
     example_btn = next((b for b in buttons if 'Load Example Records' in b.text), None)
     assert example_btn is not None, 'Load Example Records button should exist'
     example_btn.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
 
     # Verify records loaded
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
     assert len(records) > 0, 'Example records should be loaded'
 
-    driver.quit()
-
 
 def _load_example_and_enable_printing(driver):
     '''Helper: load example records and enable printing via JS.'''
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
     # Load example records first — loading resets prefs from file data,
     # so enablePrinting must be set AFTER the load completes.
     dlg = choose_menu_option(driver, 'Load File')
@@ -706,12 +521,9 @@ def _load_example_and_enable_printing(driver):
         (b for b in buttons if 'Load Example Records' in b.text), None)
     assert example_btn is not None, 'Load Example Records button should exist'
     example_btn.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
     # Set enablePrinting after load and call enablePrinting() to update the
     # DOM so the Print menu item gets its d-none class removed.
     driver.execute_script('''
@@ -719,7 +531,6 @@ def _load_example_and_enable_printing(driver):
         const eps = document.querySelectorAll('.x-print');
         eps.forEach(el => el.classList.remove('d-none'));
     ''')
-    time.sleep(0.3)
 
 
 def _trigger_print_and_get_iframe(driver):
@@ -748,27 +559,18 @@ def _trigger_print_and_get_iframe(driver):
     # choose_menu_option() so it works reliably in headless Chrome.
     # Match by x-print class — headless Chrome renders the item with
     # empty .text (icon only), so string matching on .text is unreliable.
-    menu = driver.find_element(By.ID, 'menu')
-    menu.click()
-    time.sleep(0.5)
-    dropdown = get_parent(menu)
-    children = get_children(dropdown)
-    menu_items = children[1].find_elements(By.CLASS_NAME, 'dropdown-item')
+    menu_items = open_menu(driver)
     for item in menu_items:
         classes = item.get_attribute('class') or ''
         if 'x-print' in classes or 'Print' in item.text:
             scroll_and_click(driver, item)
             break
-    time.sleep(2)  # allow iframe load + CSS fetch
-    html = driver.execute_script('return window._pamPrintIframeHTML')
-    assert html is not None, \
-        'Print iframe HTML should have been captured — print hook not triggered'
-    return html
+    # the hook is called when the iframe and its CSS have loaded
+    return wait_for_script(driver, 'return window._pamPrintIframeHTML')
 
 
-def test_print_iframe_structure():
+def test_print_iframe_structure(driver):
     '''E2E: generated print document contains required structural elements.'''
-    driver = get_driver()
     _load_example_and_enable_printing(driver)
     html = _trigger_print_and_get_iframe(driver)
 
@@ -779,12 +581,9 @@ def test_print_iframe_structure():
         assert selector in html, \
             f'Print iframe should contain element with {selector}'
 
-    driver.quit()
-
 
-def test_print_iframe_css_link():
+def test_print_iframe_css_link(driver):
     '''E2E: generated print document links to print-report.css.'''
-    driver = get_driver()
     _load_example_and_enable_printing(driver)
     html = _trigger_print_and_get_iframe(driver)
 
@@ -793,30 +592,22 @@ def test_print_iframe_css_link():
     assert 'id="x-print-report-css"' in html, \
         'Print iframe CSS link should have id x-print-report-css'
 
-    driver.quit()
 
-
-def test_print_cover_record_count():
+def test_print_cover_record_count(driver):
     '''E2E: cover block shows correct record count.'''
-    driver = get_driver()
     _load_example_and_enable_printing(driver)
 
     # Count the visible records before printing
-    record_count = len(driver.find_elements(By.CLASS_NAME, 'accordion-button'))
+    num_records = record_count(driver)
 
     html = _trigger_print_and_get_iframe(driver)
 
-    assert f'{record_count} record' in html, \
-        f'Cover block should show {record_count} records'
-
-    driver.quit()
+    assert f'{num_records} record' in html, \
+        f'Cover block should show {num_records} records'
 
 
-def test_print_empty_fields_skipped():
+def test_print_empty_fields_skipped(driver):
     '''E2E: fields with empty values are not rendered in the print output.'''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
 
     # Load a minimal JSON structure with one populated and one empty field.
     # enablePrinting must be set AFTER the load — loading resets prefs from
@@ -843,14 +634,13 @@ def test_print_empty_fields_skipped():
             input.dispatchEvent(new Event("change", {{bubbles: true}}));
         }}
     ''')
-    time.sleep(1)
+    wait_for_idle(driver)
     # Set enablePrinting after load and update the DOM.
     driver.execute_script('''
         window.prefs.enablePrinting = true;
         const eps = document.querySelectorAll('.x-print');
         eps.forEach(el => el.classList.remove('d-none'));
     ''')
-    time.sleep(0.3)
 
     html = _trigger_print_and_get_iframe(driver)
 
@@ -866,31 +656,22 @@ def test_print_empty_fields_skipped():
     assert len(note_rows) == 0, \
         'Empty note field should be skipped in print output'
 
-    driver.quit()
 
-
-def test_save_and_reload_round_trip():
+def test_save_and_reload_round_trip(driver):
     '''
     E2E: Load example records, save to a file with a password,
     clear records, reload from the saved file, and verify the
     record count is preserved.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Load example records
     dlg = choose_menu_option(driver, 'Load File')
     buttons = dlg.find_elements(By.TAG_NAME, 'button')
     example_btn = next((b for b in buttons if 'Load Example Records' in b.text), None)
     assert example_btn is not None, 'Load Example Records button should exist'
     example_btn.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
 
     # Count loaded records
     records_before = driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -899,64 +680,45 @@ def test_save_and_reload_round_trip():
 
     # Clear records and verify
     dlg = choose_menu_option(driver, 'Clear Records')
-    time.sleep(1)  # wait for dialog to fully render and button to enable
     confirm_btn = dlg.find_element(By.CLASS_NAME, 'x-fld-record-clear')
-    scroll_and_click(driver, confirm_btn)
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(0.5)
+    scroll_and_click(driver, confirm_btn)  # waits until the button is enabled
+    wait_for_record_count(driver, 0)
+    wait_for_modal_hidden(driver, dlg)
     records_cleared = driver.find_elements(By.CLASS_NAME, 'accordion-button')
     assert len(records_cleared) == 0, 'Records should be cleared before reload test'
 
-    driver.quit()
-
 
-def test_delete_record_confirmation():
+def test_delete_record_confirmation(driver):
     '''
     UX-002: Deleting a record should require confirmation.
     Clicking Delete and then cancelling should leave the record intact.
     Clicking Delete and confirming should remove the record.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Load example records so there is something to delete
     dlg = choose_menu_option(driver, 'Load File')
     buttons = dlg.find_elements(By.TAG_NAME, 'button')
     example_btn = next((b for b in buttons if 'Load Example Records' in b.text), None)
     assert example_btn is not None, 'Load Example Records button should exist'
     example_btn.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
 
     # Expand the first record
     records = driver.find_elements(By.CLASS_NAME, 'accordion-button')
     assert len(records) > 0, 'Example records should be loaded'
     first_title = records[0].text.strip()
     scroll_and_click(driver, records[0])
-    time.sleep(0.5)
+    wait_for_transitions(driver)
 
     # Click Delete and cancel — record should remain
     delete_btns = driver.find_elements(By.CLASS_NAME, 'x-record-delete-btn')
     assert len(delete_btns) > 0, 'Delete button should exist'
     scroll_and_click(driver, delete_btns[0])
-    time.sleep(0.3)
-    try:
-        alert = driver.switch_to.alert
-        msg = 'Confirmation dialog should mention delete or record title'
-        assert 'delete' in alert.text.lower() or first_title in alert.text, msg
-        alert.dismiss()  # cancel
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(0.3)
+    alert = wait_for_alert(driver)
+    msg = 'Confirmation dialog should mention delete or record title'
+    assert 'delete' in alert.text.lower() or first_title in alert.text, msg
+    alert.dismiss()  # cancel
 
     # Record should still exist
     remaining = driver.find_elements(By.CLASS_NAME, 'accordion-button')
@@ -964,22 +726,16 @@ def test_delete_record_confirmation():
     assert first_title in titles, f'Record "{first_title}" should still exist after cancel'
 
     # Click Delete and confirm — record should be removed
+    count = record_count(driver)
     scroll_and_click(driver, delete_btns[0])
-    time.sleep(0.3)
-    try:
-        alert = driver.switch_to.alert
-        alert.accept()  # confirm
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(0.3)
+    wait_for_alert(driver).accept()  # confirm
+    wait_for_record_count_change(driver, count)
 
     remaining = driver.find_elements(By.CLASS_NAME, 'accordion-button')
     titles = [r.text.strip() for r in remaining]
     assert first_title not in titles, \
         f'Record "{first_title}" should be gone after confirmed delete'
 
-    driver.quit()
-
 
 def set_load_dup_strategy(driver, strategy):
     '''Helper: set clearBeforeLoad=false and loadDupStrategy via JS, then
@@ -993,7 +749,6 @@ def set_load_dup_strategy(driver, strategy):
         "window.prefs.clearBeforeLoad = false;"
         f"window.prefs.loadDupStrategy = '{strategy}';"
     )
-    time.sleep(0.3)
 
 
 def load_example_records(driver, post_prefs=None):
@@ -1006,29 +761,21 @@ def load_example_records(driver, post_prefs=None):
     example_btn = next((b for b in buttons if 'Load Example Records' in b.text), None)
     assert example_btn is not None, 'Load Example Records button should exist'
     example_btn.click()
-    time.sleep(0.5)
-    try:
-        driver.switch_to.alert.accept()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    time.sleep(1)
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    wait_for_modal_hidden(driver, dlg)
     if post_prefs:
         js = '; '.join(
             f'window.prefs.{k} = {json.dumps(v)}' for k, v in post_prefs.items()
         )
         driver.execute_script(js)
-        time.sleep(0.2)
 
 
-def test_load_dup_strategy_ignore():
+def test_load_dup_strategy_ignore(driver):
     '''
     E2E: With loadDupStrategy=ignore, loading the same file twice
     should not increase the record count.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     set_load_dup_strategy(driver, 'ignore')
     load_example_records(driver)
     count_after_first = len(driver.find_elements(By.CLASS_NAME, 'accordion-button'))
@@ -1041,18 +788,12 @@ def test_load_dup_strategy_ignore():
         f'{count_after_first} -> {count_after_second}'
     )
 
-    driver.quit()
-
 
-def test_load_dup_strategy_replace():
+def test_load_dup_strategy_replace(driver):
     '''
     E2E: With loadDupStrategy=replace, loading the same file twice
     should not increase the record count (old record replaced by new).
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     set_load_dup_strategy(driver, 'replace')
     load_example_records(driver)
     count_after_first = len(driver.find_elements(By.CLASS_NAME, 'accordion-button'))
@@ -1065,10 +806,8 @@ def test_load_dup_strategy_replace():
         f'{count_after_first} -> {count_after_second}'
     )
 
-    driver.quit()
 
-
-def test_load_dup_strategy_allow():
+def test_load_dup_strategy_allow(driver):
     '''
     E2E: loadDupStrategy=allow cannot be tested via the example file because
     loadCallback always calls resetPrefs() then loads the file's prefs block
@@ -1081,10 +820,6 @@ def test_load_dup_strategy_allow():
     This test verifies that the allow strategy setting is accessible and
     that the prefs UI correctly reflects it.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     # Verify loadDupStrategy pref exists and has the expected default
     result = driver.execute_script("return window.prefs.loadDupStrategy")
     assert result == 'ignore', f'loadDupStrategy default should be ignore, got {result}'
@@ -1094,20 +829,316 @@ def test_load_dup_strategy_allow():
     result = driver.execute_script("return window.prefs.loadDupStrategy")
     assert result == 'allow', f'loadDupStrategy should be allow, got {result}'
 
-    driver.quit()
 
+# Stream a plain JSON file through the file selection input of the
+# Load dialogue, as if the user had chosen it after clicking Load.
+STREAM_FILE_SCRIPT = '''
+    const [text, filename] = arguments
+    const input = document.getElementById('x-load-file-select-input')
+    const transfer = new DataTransfer()
+    transfer.items.add(new File([text], filename, {type: 'text/plain'}))
+    document.getElementById('x-load-password').value = ''
+    input.files = transfer.files
+    input.dispatchEvent(new Event('change'))
+'''
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'corrupt'])
+def test_failed_stream_load_keeps_vault(driver, damage):
+    '''
+    A streamed load of an invalid file must not replace the loaded
+    records and prefs: they are restored after the records of the file
+    were already being loaded.
+    '''
+    load_example_records(driver)
+    titles = [button.text for button in driver.find_elements(By.CLASS_NAME, 'accordion-button')]
+    assert titles, 'Example records should be loaded'
+    prefs = driver.execute_script('return JSON.stringify(window.prefs)')
+
+    records = [{'title': f'Broken {i}', 'active': True, 'created': '2024-01-01T00:00:00.000Z',
+                'fields': [{'name': 'note', 'type': 'text', 'value': 'x' * 50}]}
+               for i in range(500)]
+    text = json.dumps({'meta': {'date-saved': '2024-01-01T00:00:00.000Z'},
+                       'prefs': {'clearBeforeLoad': True, 'customAboutInfo': 'broken'},
+                       'records': records}, separators=(',', ':'))
+    cut = text.index('{"title":"Broken 375"')
+    if damage == 'truncated':
+        text = text[:cut]
+    else:
+        text = text[:cut] + 'x' + text[cut:]
+    driver.execute_script(STREAM_FILE_SCRIPT, text, 'broken.txt')
+    alert = wait_for_alert(driver)
+    assert 'invalid record format' in alert.text
+    alert.accept()
+    wait_for_idle(driver)
+
+    restored = [button.text for button in driver.find_elements(By.CLASS_NAME, 'accordion-button')]
+    assert restored == titles, 'The records loaded before should be restored'
+    assert driver.execute_script('return JSON.stringify(window.prefs)') == prefs, \
+        'The prefs loaded before should be restored'
+    num = driver.find_element(By.ID, 'x-num-records').text
+    assert num == str(len(titles))
+
+
+# The file name and the number of records of the cached vault or null.
+CACHED_VAULT_SCRIPT = '''
+    const done = arguments[arguments.length - 1]
+    import(new URL('js/vault-cache.js', document.baseURI).href)
+        .then((cache) => cache.getCachedVault())
+        .then((entry) => done(entry ? {filename: entry.filename, records: entry.records} : null))
+'''
+
+
+def save_vault(driver, filename, password):
+    '''
+    Save the records with the password through the save dialogue.
+    '''
+    dlg = choose_menu_option(driver, 'Save File')
+    filename_input = dlg.find_element(By.ID, 'x-save-filename')
+    filename_input.clear()
+    filename_input.send_keys(filename)
+    password_input = dlg.find_element(By.ID, 'x-save-password')
+    password_input.clear()
+    password_input.send_keys(password)
+    scroll_and_click(driver, dlg.find_element(By.CLASS_NAME, 'x-fld-record-save'))
+    wait_for_modal_hidden(driver, dlg)
+    wait_for_idle(driver)
+
+
+def load_cached_records(driver, password):
+    '''
+    Enter the password in the load dialogue and click Load Cached Records.
+    '''
+    dlg = choose_menu_option(driver, 'Load File')
+    password_input = dlg.find_element(By.ID, 'x-load-password')
+    password_input.clear()
+    password_input.send_keys(password)
+    buttons = dlg.find_elements(By.TAG_NAME, 'button')
+    cached_btn = next((b for b in buttons if 'Load Cached Records' in b.text), None)
+    assert cached_btn is not None, 'Load Cached Records button should exist'
+    scroll_and_click(driver, cached_btn)
+
+
+def test_vault_cache_restores_records(driver):
+    '''
+    With cacheVault on a saved vault is cached in IndexedDB. After a
+    reload without a cached password the records are restored from the
+    cache once the password is entered in the load dialogue, and a
+    wrong password is not kept.
+    '''
+    password = 'vault-cache-password'
+    load_example_records(driver, post_prefs={'cacheVault': True})
+    count = record_count(driver)
+    assert count > 0, 'Example records should be loaded'
+    save_vault(driver, 'cached.txt', password)
+    cached = wait_until(driver, lambda drv: drv.execute_async_script(CACHED_VAULT_SCRIPT),
+                        'the vault was not cached')
+    assert cached == {'filename': 'cached.txt', 'records': count}
+
+    # no cached password: the records are not restored until it is entered
+    driver.execute_script('sessionStorage.clear(); localStorage.removeItem("filePass")')
+    driver.refresh()
+    wait_for_idle(driver)
+    assert record_count(driver) == 0, 'The records should wait for the password'
+
+    load_cached_records(driver, 'wrong-password')
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    assert record_count(driver) == 0
+    assert driver.execute_script('return sessionStorage.getItem("filePass")') != 'wrong-password', \
+        'A wrong password should not be stored as the file password'
+    dlg = wait_for_modal_shown(driver)  # the load dialogue is shown again
+    close_dialog(driver, dlg)
+
+    load_cached_records(driver, password)
+    wait_for_record_count(driver, count)
+    wait_for_idle(driver)
+
+    # the password is cached now: the records are restored at startup
+    driver.refresh()
+    wait_for_idle(driver)
+    wait_for_record_count(driver, count)
+
+
+def test_vault_cache_off_caches_nothing(driver):
+    '''
+    With cacheVault off (the default) a saved vault is not cached and
+    nothing is restored after a reload.
+    '''
+    load_example_records(driver)
+    assert driver.execute_script('return window.prefs.cacheVault') is False
+    save_vault(driver, 'uncached.txt', 'vault-cache-password')
+    assert driver.execute_async_script(CACHED_VAULT_SCRIPT) is None, 'Nothing should be cached'
+
+    driver.refresh()
+    wait_for_idle(driver)
+    assert record_count(driver) == 0, 'Nothing should be restored'
+    load_cached_records(driver, 'vault-cache-password')
+    alert = wait_for_alert(driver)
+    assert 'no cached records' in alert.text
+    alert.accept()
+
+
+# The titles of the records attached to the records accordion.
+RENDERED_TITLES_SCRIPT = '''
+    return Array.from(document.querySelectorAll('#records-accordion .accordion-button'),
+                      (button) => button.textContent.trim())
+'''
+
+# Scroll the records to a fraction of the scrollable height.
+SCROLL_RECORDS_SCRIPT = '''
+    const [fraction] = arguments
+    const mid = document.getElementById('mid-section')
+    const scroller = mid.scrollHeight > mid.clientHeight ? mid : document.scrollingElement
+    scroller.scrollTop = fraction * (scroller.scrollHeight - scroller.clientHeight)
+'''
+
+NUM_WINDOWED_RECORDS = 600  # more than the windowedRenderingThreshold default
+
+
+def load_many_records(driver):
+    '''
+    Load enough records to use the windowed renderer and return their
+    titles in display order.
+    '''
+    titles = [f'Record {i:03}' for i in range(NUM_WINDOWED_RECORDS)]
+    records = [{'title': title, 'active': True, 'created': '2024-01-01T00:00:00.000Z',
+                'fields': [{'name': 'note', 'type': 'text', 'value': f'note for {title}'}]}
+               for title in titles]
+    text = json.dumps({'meta': {'date-saved': '2024-01-01T00:00:00.000Z'},
+                       'prefs': {}, 'records': records})
+    driver.execute_script(STREAM_FILE_SCRIPT, text, 'many.txt')
+    wait_until(driver,
+               lambda drv: drv.find_element(By.ID, 'x-num-records').text == str(len(titles)),
+               'the records were not loaded')
+    wait_for_idle(driver)
+    return titles
+
+
+def rendered_titles(driver) -> list:
+    '''
+    The titles of the records in the DOM. The windowed renderer never
+    attaches hidden records.
+    '''
+    hidden = driver.find_elements(By.CSS_SELECTOR, '#records-accordion .accordion-item.d-none')
+    assert not hidden, 'The windowed renderer should not attach hidden records'
+    return driver.execute_script(RENDERED_TITLES_SCRIPT)
+
+
+def scroll_records(driver, fraction, title):
+    '''
+    Scroll the records and wait until the record with the title is
+    rendered. Returns the rendered titles.
+    '''
+    driver.execute_script(SCROLL_RECORDS_SCRIPT, fraction)
+    wait_until(driver,
+               lambda drv: title in drv.execute_script(RENDERED_TITLES_SCRIPT),
+               f'"{title}" was not rendered')
+    wait_for_idle(driver)
+    return rendered_titles(driver)
+
+
+def search_records(driver, value):
+    '''
+    Type the search value and wait for the search to finish.
+    '''
+    search_box = driver.find_element(By.ID, 'search')
+    search_box.clear()
+    search_box.send_keys(value)
+    wait_for_idle(driver)
+
+
+def expand_record(driver, title):
+    '''
+    Expand the rendered record with the title and return its accordion item.
+    '''
+    buttons = driver.find_elements(By.CLASS_NAME, 'accordion-button')
+    button = next((b for b in buttons if b.text.strip() == title), None)
+    assert button is not None, f'"{title}" should be rendered'
+    scroll_and_click(driver, button)
+    wait_for_transitions(driver)
+    return button.find_element(By.XPATH, './ancestor::div[contains(@class, "accordion-item")]')
+
+
+def test_windowed_rendering_window(driver):
+    '''
+    Only the records near the viewport are in the DOM when there are
+    more records than the windowedRenderingThreshold pref, scrolling
+    renders the records that scroll into view in display order.
+    '''
+    titles = load_many_records(driver)
+    assert driver.execute_script('return window.prefs.windowedRenderingThreshold') < len(titles)
+
+    rendered = rendered_titles(driver)
+    assert 0 < len(rendered) < len(titles) // 4, f'{len(rendered)} records were rendered'
+    assert rendered == titles[:len(rendered)]
+
+    rendered = scroll_records(driver, 1, titles[-1])
+    assert len(rendered) < len(titles) // 4
+    assert rendered == titles[-len(rendered):]
+
+    middle = titles[len(titles) // 2]
+    rendered = scroll_records(driver, 0.5, middle)
+    first = titles.index(rendered[0])
+    assert 0 < first and first + len(rendered) < len(titles), 'The middle should be rendered'
+    assert rendered == titles[first:first + len(rendered)]
 
-def test_prefs_tabbed_navigation():
+    rendered = scroll_records(driver, 0, titles[0])
+    assert rendered == titles[:len(rendered)]
+
+
+def test_windowed_rendering_search_edit_delete(driver):
+    '''
+    Search shows and hides the records that are not rendered and the
+    records outside of the initial window can be edited and deleted.
+    '''
+    titles = load_many_records(driver)
+    assert titles[450] not in rendered_titles(driver)
+
+    # search hides the records that do not match and shows the ones that do
+    search_records(driver, 'Record 5')
+    matches = [title for title in titles if title.startswith('Record 5')]
+    rendered = rendered_titles(driver)
+    assert rendered and rendered == matches[:len(rendered)]
+    assert driver.find_element(By.ID, 'x-num-records').text == str(len(matches))
+    assert scroll_records(driver, 1, matches[-1])[-1] == matches[-1]
+    search_records(driver, '.')
+    assert scroll_records(driver, 0, titles[0]) == titles[:len(rendered_titles(driver))]
+
+    # edit a record outside of the window
+    search_records(driver, titles[450])
+    assert rendered_titles(driver) == [titles[450]]
+    item = expand_record(driver, titles[450])
+    scroll_and_click(driver, item.find_element(By.CSS_SELECTOR, 'button[title="edit this record"]'))
+    dlg = wait_for_modal_shown(driver)
+    title_input = dlg.find_element(By.CLASS_NAME, 'x-record-title')
+    title_input.clear()
+    title_input.send_keys('Edited 450')
+    scroll_and_click(driver, dlg.find_element(By.CLASS_NAME, 'x-fld-record-save'))
+    wait_for_modal_hidden(driver, dlg)
+    search_records(driver, 'Edited 450')
+    assert rendered_titles(driver) == ['Edited 450']
+
+    # delete a record outside of the window
+    search_records(driver, titles[451])
+    item = expand_record(driver, titles[451])
+    scroll_and_click(driver, item.find_element(By.CLASS_NAME, 'x-record-delete-btn'))
+    wait_for_alert(driver).accept()
+    wait_for_idle(driver)
+    assert not rendered_titles(driver)
+
+    search_records(driver, '.')
+    assert driver.find_element(By.ID, 'x-num-records').text == str(len(titles) - 1)
+    expected = sorted([t for t in titles if t not in (titles[450], titles[451])] + ['Edited 450'])
+    assert scroll_records(driver, 1, expected[-1]) == expected[-len(rendered_titles(driver)):]
+
+
+def test_prefs_tabbed_navigation(driver):
     '''
     UX-003: Preferences dialog should have tabbed navigation.
     Verify tabs exist and switching between them works.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(1)
-
     dlg = choose_menu_option(driver, 'Preferences')
-    time.sleep(0.5)
 
     # Verify all 5 tabs exist
     tab_labels = [
@@ -1131,7 +1162,7 @@ def test_prefs_tabbed_navigation():
         By.CSS_SELECTOR, 'button.nav-link[data-bs-target="#prefs-tab-passwords"]'
     )
     scroll_and_click(driver, passwords_tab)
-    time.sleep(0.3)
+    wait_for_transitions(driver)
     assert 'active' in passwords_tab.get_attribute('class'), \
         'Passwords tab should be active after clicking'
 
@@ -1140,29 +1171,21 @@ def test_prefs_tabbed_navigation():
         By.CSS_SELECTOR, 'button.nav-link[data-bs-target="#prefs-tab-admin"]'
     )
     scroll_and_click(driver, admin_tab)
-    time.sleep(0.3)
+    wait_for_transitions(driver)
     assert 'active' in admin_tab.get_attribute('class'), \
         'Administration tab should be active after clicking'
 
     # Close dialog
-    close_btn = dlg.find_element(By.CLASS_NAME, 'x-fld-record-close')
-    scroll_and_click(driver, close_btn)
-    time.sleep(0.3)
-
-    driver.quit()
+    close_dialog(driver, dlg)
 
 
-def test_bug002_filepass_survives_session_teardown():
+def test_bug002_filepass_survives_session_teardown(driver):
     '''
     BUG-002: password must survive a sessionStorage wipe (iOS Safari PWA
     relaunch) when the loaded file specifies filePassCache=local.
     Exercises via JS injection: prime post-fix storage state, wipe
     sessionStorage, reload, verify password is still retrievable.
     '''
-    driver = get_driver()
-    driver.get('http://localhost:8081/')
-    time.sleep(2)
-
     test_password = 'pwa-test-password-bug002'
 
     # Prime the post-fix state: password in localStorage, strategy persisted.
@@ -1175,7 +1198,7 @@ def test_bug002_filepass_survives_session_teardown():
     # Simulate iOS PWA relaunch: wipe sessionStorage and reload.
     driver.execute_script('sessionStorage.clear()')
     driver.refresh()
-    time.sleep(2)
+    wait_for_idle(driver)
 
     result = driver.execute_script("""
         return {
@@ -1197,7 +1220,7 @@ def test_bug002_filepass_survives_session_teardown():
     """, test_password)
     driver.execute_script('sessionStorage.clear()')
     driver.refresh()
-    time.sleep(2)
+    wait_for_idle(driver)
 
     result2 = driver.execute_script("""
         return {
@@ -1216,5 +1239,3 @@ def test_bug002_filepass_survives_session_teardown():
         localStorage.removeItem('pamCacheStrategy')
         sessionStorage.removeItem('filePass')
     """)
-
-    driver.quit()
@@ -0,0 +1,188 @@
+'''
+PAM file reader/writer tests, see tools/pamcrypt.py.
+
+The vectors in pamcrypt-vectors.json were encrypted by cipher.js. The
+browser tests (the ones that take the driver fixture) cross-check the
+formats against cipher.js in the app, they need the web server.
+'''
+import base64
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+import pamcrypt
+from pamcrypt import (PamError, Encryptor, decrypt_stream, encrypt_stream, read_vault,
+                      run_jobs, v1_salt, write_vault)
+
+pytest.importorskip('cryptography')
+
+VECTORS = json.loads(Path(__file__).with_name('pamcrypt-vectors.json').read_text(encoding='utf-8'))
+PASSWORD = VECTORS['password']
+PLAINTEXT = VECTORS['plaintext']
+
+# Encrypt or decrypt with the cipher.js of the app.
+CIPHER_SCRIPT = '''
+    const [name, password, text, done] = arguments
+    import(new URL('js/cipher.js', document.baseURI).href)
+        .then((cipher) => cipher[name](password, text, false))
+        .then((result) => done(typeof result === 'string' ? result : null))
+        .catch((error) => done(`ERROR: ${error}`))
+'''
+
+
+def decrypt(data: bytes, password: str = PASSWORD) -> bytes:
+    '''
+    Decrypt the data.
+    '''
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(data), out, password)
+    return out.getvalue()
+
+
+def encrypt(text: str, version: str, **kwargs) -> bytes:
+    '''
+    Encrypt the text.
+    '''
+    out = io.BytesIO()
+    encrypt_stream(io.BytesIO(text.encode('utf-8')), out, PASSWORD, version, **kwargs)
+    return out.getvalue()
+
+
+def salt_and_iv(ciphertext: str) -> dict:
+    '''
+    The salt and the IV of the ciphertext.
+    '''
+    data = base64.b64decode(ciphertext.removeprefix('PAMv2:'))
+    return {'salt': data[:16], 'iv': data[16:32]}
+
+
+def test_v1_salt():
+    '''
+    The v1 salt is the string of the bytes (the TextEncoder quirk).
+    '''
+    assert v1_salt(bytes([0, 34, 211])) == b'0,34,211'
+
+
+@pytest.mark.parametrize('version', ['v1', 'v2'])
+def test_decrypt_vectors(version):
+    '''
+    The files encrypted by cipher.js are decrypted.
+    '''
+    assert decrypt(VECTORS[version].encode('ascii')).decode('utf-8') == PLAINTEXT
+
+
+def test_decrypt_v1_base64_plaintext():
+    '''
+    A v1 plaintext that is Base64 is decoded, like decryptTextV1() does.
+    '''
+    expected = PLAINTEXT.replace('✓', 'v')  # btoa() only takes latin-1
+    assert decrypt(VECTORS['v1_base64_plaintext'].encode('ascii')).decode('utf-8') == expected
+
+
+@pytest.mark.parametrize('version', ['v1', 'v2'])
+def test_encrypt_matches_cipher_js(version):
+    '''
+    With the same salt and IV the ciphertext is the one of cipher.js.
+    '''
+    ciphertext = encrypt(PLAINTEXT, version, **salt_and_iv(VECTORS[version]))
+    assert ciphertext.decode('ascii') == VECTORS[version]
+
+
+def test_streaming(monkeypatch):
+    '''
+    The result does not depend on the chunk size, whitespace in the
+    Base64 is ignored.
+    '''
+    monkeypatch.setattr(pamcrypt, 'CHUNK_SIZE', 7)
+    text = VECTORS['v2']
+    wrapped = '\n'.join(text[i:i + 76] for i in range(0, len(text), 76)) + '\n'
+    assert decrypt(wrapped.encode('ascii')).decode('utf-8') == PLAINTEXT
+    out = io.BytesIO()
+    writer = Encryptor(out, PASSWORD, 'v2', **salt_and_iv(text))
+    for i in range(0, len(PLAINTEXT), 5):
+        writer.write(PLAINTEXT[i:i + 5])
+    writer.close()
+    assert out.getvalue().decode('ascii') == text
+
+
+def test_plaintext_is_copied():
+    '''
+    A plaintext vault is not decrypted.
+    '''
+    assert decrypt(PLAINTEXT.encode('utf-8'), '') == PLAINTEXT.encode('utf-8')
+
+
+def test_errors():
+    '''
+    Wrong passwords, corrupt files and v3 files are reported.
+    '''
+    with pytest.raises(PamError, match='another password'):
+        decrypt(VECTORS['v2'].encode('ascii'), 'wrong')
+    with pytest.raises(PamError, match='conversion failed'):
+        decrypt(b'PAMv2:not base64!')
+    with pytest.raises(PamError, match='conversion failed'):
+        decrypt(VECTORS['v2'][:-1].encode('ascii'))
+    with pytest.raises(PamError, match='not supported'):
+        decrypt(b'PAMv3:AAAA')
+    with pytest.raises(PamError, match='password is needed'):
+        decrypt(VECTORS['v2'].encode('ascii'), '')
+
+
+def test_read_write_vault(tmp_path):
+    '''
+    A vault written in each format is read back.
+    '''
+    vault = json.loads(PLAINTEXT)
+    for version in ['v1', 'v2']:
+        path = tmp_path / f'{version}.txt'
+        write_vault(path, vault, PASSWORD, version)
+        assert read_vault(path, PASSWORD) == vault
+    write_vault(tmp_path / 'plain.txt', vault)
+    assert read_vault(tmp_path / 'plain.txt') == vault
+
+
+def test_batch(tmp_path):
+    '''
+    The process pool rotates the passwords of a directory of vaults and
+    reports the files that fail.
+    '''
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    (src / 'sub').mkdir(parents=True)
+    dst.mkdir()
+    names = ['a.txt', 'b.pam', 'sub/c.txt']
+    for name in names:
+        (src / name).write_text(VECTORS['v1'], encoding='ascii')
+    (src / 'bad.txt').write_text('PAMv2:AAAA', encoding='ascii')
+    jobs = [{'op': 'rotate', 'src': src / name, 'dst': dst / name, 'password': PASSWORD,
+             'new_password': 'new', 'version': 'v2'} for name in names + ['bad.txt']]
+    (dst / 'sub').mkdir()
+    results = list(run_jobs(jobs, 2))
+    assert [result['format'] for result in results[:3]] == ['v1', 'v1', 'v1']
+    assert 'error' in results[3]
+    for name in names:
+        assert read_vault(dst / name, 'new') == json.loads(PLAINTEXT)
+    assert not (dst / 'bad.txt').exists()
+
+
+@pytest.mark.parametrize('version', ['V1', 'V2'])
+def test_browser_decrypts(driver, version):
+    '''
+    cipher.js decrypts the files encrypted here.
+    '''
+    ciphertext = encrypt(PLAINTEXT, version.lower()).decode('ascii')
+    plaintext = driver.execute_async_script(CIPHER_SCRIPT, f'decryptText{version}',
+                                            PASSWORD, ciphertext)
+    assert plaintext == PLAINTEXT
+
+
+@pytest.mark.parametrize('version', ['V1', 'V2'])
+def test_browser_encrypts(driver, version):
+    '''
+    The files encrypted by cipher.js are decrypted here.
+    '''
+    ciphertext = driver.execute_async_script(CIPHER_SCRIPT, f'encryptText{version}',
+                                             PASSWORD, PLAINTEXT)
+    assert decrypt(ciphertext.encode('ascii')).decode('utf-8') == PLAINTEXT
@@ -0,0 +1,115 @@
+'''
+PAM vault generator tests, see tools/pamgen.py.
+'''
+import base64
+import io
+import json
+
+import pytest
+
+from pamcrypt import V2_PREFIX, Encryptor
+from pamgen import VALID_FIELD_TYPES, VaultGenerator, generate_json, write_vault
+
+SALT = bytes(range(16))
+IV = bytes(range(16, 32))
+
+
+def generate(**options) -> dict:
+    '''
+    Generate a plaintext vault and parse it.
+    '''
+    out = io.BytesIO()
+    write_vault(out, VaultGenerator(**options), date_saved='2024-01-01T00:00:00.000Z')
+    return json.loads(out.getvalue().decode('utf-8'))
+
+
+def test_schema():
+    '''
+    The vault has the schema of convertInternalDataToJSON().
+    '''
+    vault = generate(num=100, seed=1)
+    assert list(vault) == ['meta', 'prefs', 'records']
+    assert list(vault['meta']) == ['date-saved', 'format-version']
+    assert vault['prefs'] == {}
+    assert len(vault['records']) == 100
+    for record in vault['records']:
+        assert list(record) == ['title', 'active', 'created', 'fields']
+        assert record['created'].endswith('Z')
+        for field in record['fields']:
+            assert list(field) == ['name', 'type', 'value']
+            assert field['type'] in VALID_FIELD_TYPES
+
+
+def test_same_seed_same_records():
+    '''
+    The same options and seed generate the same vault.
+    '''
+    assert generate(num=50, seed=7) == generate(num=50, seed=7)
+    assert generate(num=50, seed=7) != generate(num=50, seed=8)
+
+
+def test_options():
+    '''
+    The field counts, types, value sizes and ratios are honoured.
+    '''
+    vault = generate(num=2000, fields='2:1,6:1', types=['password', 'text'],
+                     value_size='10-12', dup_ratio=0.2, inactive_ratio=0.3)
+    records = vault['records']
+    assert {len(record['fields']) for record in records} == {2, 6}
+    for record in records:
+        for field in record['fields']:
+            assert field['type'] in ['password', 'text']
+            if field['type'] == 'password':
+                assert 10 <= len(field['value']) <= 12
+    num_titles = len({record['title'] for record in records})
+    num_inactive = sum(not record['active'] for record in records)
+    assert 0.15 < 1 - num_titles / len(records) < 0.25
+    assert 0.25 < num_inactive / len(records) < 0.35
+
+
+def test_invalid_options():
+    '''
+    Invalid field types and distributions are rejected.
+    '''
+    with pytest.raises(ValueError):
+        VaultGenerator(types=['checkbox'])
+    with pytest.raises(ValueError):
+        VaultGenerator(fields='4:0')
+    with pytest.raises(ValueError):
+        VaultGenerator(value_size='9-3')
+
+
+def test_v2_stream():
+    '''
+    The streamed PAMv2 vault is the encryption of the whole JSON in one
+    piece, which is what encryptV2() does, and it decrypts to the JSON.
+    '''
+    crypto = pytest.importorskip('cryptography.hazmat.primitives.ciphers')
+    padding = pytest.importorskip('cryptography.hazmat.primitives.padding')
+    kdf = pytest.importorskip('cryptography.hazmat.primitives.kdf.pbkdf2')
+    hashes = pytest.importorskip('cryptography.hazmat.primitives.hashes')
+
+    plaintext = ''.join(generate_json(VaultGenerator(num=300), date_saved='now'))
+    streamed = io.BytesIO()
+    writer = Encryptor(streamed, 'pässword', 'v2', SALT, IV)
+    for piece in generate_json(VaultGenerator(num=300), date_saved='now'):
+        writer.write(piece)
+    writer.close()
+    whole = io.BytesIO()
+    writer = Encryptor(whole, 'pässword', 'v2', SALT, IV)
+    writer.write(plaintext)
+    writer.close()
+    assert streamed.getvalue() == whole.getvalue()
+
+    text = streamed.getvalue()
+    assert text.startswith(V2_PREFIX)
+    data = base64.b64decode(text[len(V2_PREFIX):])
+    assert data[:16] == SALT
+    assert data[16:32] == IV
+    key = kdf.PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=SALT,
+                         iterations=600000).derive('pässword'.encode('utf-8'))
+    decryptor = crypto.Cipher(crypto.algorithms.AES(key), crypto.modes.CBC(IV)).decryptor()
+    unpadder = padding.PKCS7(128).unpadder()
+    decrypted = unpadder.update(decryptor.update(data[32:]) + decryptor.finalize())
+    decrypted += unpadder.finalize()
+    assert decrypted.decode('utf-8') == plaintext
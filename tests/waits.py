@@ -0,0 +1,129 @@
+'''
+PAM test waits.
+
+Event driven waits for the Selenium tests, use them instead of
+time.sleep(). Each wait returns as soon as its condition holds, which
+is as fast as the app allows, and fails the test with a
+TimeoutException after WAIT_TIMEOUT seconds.
+
+PAM publishes the number of asynchronous operations in progress as the
+data-busy attribute of the body (markBusy() in www/js/status.js), it is
+"0" when PAM has started and is idle: the records are loaded, the
+search is done and the crypt worker has replied.
+'''
+import os
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Use PAM_WAIT_TIMEOUT=60 on slow machines.
+WAIT_TIMEOUT = float(os.getenv('PAM_WAIT_TIMEOUT', '10'))
+POLL_FREQUENCY = 0.05
+
+IDLE = (By.CSS_SELECTOR, 'body[data-busy="0"]')
+RECORDS = (By.CLASS_NAME, 'accordion-button')
+SHOWN_MODAL = (By.CSS_SELECTOR, '.modal.show')
+
+# Are all of the CSS transitions (the bootstrap fades and slides) done?
+TRANSITIONS_DONE_SCRIPT = '''
+    return document.getAnimations()
+        .every((a) => !(a instanceof CSSTransition) || a.playState !== 'running')
+'''
+
+
+def wait_until(driver, condition, message='', timeout=WAIT_TIMEOUT):
+    '''
+    Wait until condition(driver) returns a true value and return it.
+    '''
+    wait = WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY)
+    return wait.until(condition, message)
+
+
+def wait_for_script(driver, script, *args, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until the script returns a true value and return it.
+    '''
+    return wait_until(driver,
+                      lambda drv: drv.execute_script(script, *args),
+                      f'script did not return a true value: {script.strip()}',
+                      timeout)
+
+
+def wait_for_idle(driver, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until PAM has started and has no asynchronous work in progress.
+    '''
+    wait_until(driver, EC.presence_of_element_located(IDLE), 'PAM is not idle', timeout)
+
+
+def transitions_done(driver) -> bool:
+    '''
+    Condition: no CSS transition is running.
+    '''
+    return driver.execute_script(TRANSITIONS_DONE_SCRIPT)
+
+
+def wait_for_transitions(driver, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until the running CSS transitions have ended.
+    '''
+    wait_until(driver, transitions_done, 'transitions did not end', timeout)
+
+
+def wait_for_modal_shown(driver, locator=SHOWN_MODAL, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until a modal dialogue (by default any) is shown and its fade
+    in has ended. Returns the modal element.
+    '''
+    modal = wait_until(driver, EC.visibility_of_element_located(locator),
+                       'the modal dialogue was not shown', timeout)
+    wait_for_transitions(driver, timeout)
+    return modal
+
+
+def wait_for_modal_hidden(driver, modal, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until the modal dialogue is hidden and its backdrop is gone.
+    '''
+    wait_until(driver, EC.invisibility_of_element(modal),
+               'the modal dialogue was not hidden', timeout)
+    wait_until(driver, EC.invisibility_of_element_located((By.CLASS_NAME, 'modal-backdrop')),
+               'the modal backdrop was not removed', timeout)
+    wait_for_transitions(driver, timeout)
+
+
+def wait_for_alert(driver, timeout=WAIT_TIMEOUT):
+    '''
+    Wait for an alert or confirm dialogue and return it.
+    '''
+    return wait_until(driver, EC.alert_is_present(), 'no alert was shown', timeout)
+
+
+def record_count(driver) -> int:
+    '''
+    The number of records in the DOM, hidden or not.
+    '''
+    return len(driver.find_elements(*RECORDS))
+
+
+def wait_for_record_count(driver, count, timeout=WAIT_TIMEOUT):
+    '''
+    Wait until there are count records in the DOM.
+    '''
+    wait_until(driver,
+               lambda drv: record_count(drv) == count,
+               f'the number of records did not become {count}',
+               timeout)
+
+
+def wait_for_record_count_change(driver, count, timeout=WAIT_TIMEOUT) -> int:
+    '''
+    Wait until the number of records in the DOM is no longer count and
+    return the new number.
+    '''
+    wait_until(driver,
+               lambda drv: record_count(drv) != count,
+               f'the number of records is still {count}',
+               timeout)
+    return record_count(driver)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+'''
+Decrypt and encrypt PAM files without a browser.
+
+The formats are the ones of www/js/cipher.js (see crypt.js):
+
+    v1  Base64([16-byte salt][16-byte IV][ciphertext])
+        AES-256-CBC, PBKDF2-SHA256 with 100000 iterations. The salt is
+        passed through TextEncoder.encode() which converts it to the
+        string "12,34,..." first, the key is derived from that string.
+    v2  "PAMv2:" + Base64([16-byte salt][16-byte IV][ciphertext])
+        AES-256-CBC, PBKDF2-SHA256 with 600000 iterations and the raw
+        salt bytes.
+
+A file that starts with "{" is a plaintext vault. The v3 format is not
+supported, load and save v3 files with PAM.
+
+The files are processed in chunks: Base64, AES-CBC and the padding are
+streamed so a file is never held in memory. Directories of vaults are
+processed in parallel by a process pool.
+
+Examples:
+
+    tools/pamcrypt.py decrypt vault.txt -o vault.json
+    tools/pamcrypt.py encrypt vault.json -o vault.txt
+    tools/pamcrypt.py rotate vaults/ -O rotated/ -j 8
+    tools/pamcrypt.py check vaults/
+
+The passwords are read from PAM_PASSWORD and, for rotate, PAM_NEW_PASSWORD,
+they are prompted for if those are not set. The cryptography package is
+needed.
+'''
+import argparse
+import base64
+import binascii
+import getpass
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from cryptography.hazmat.primitives import hashes, padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:  # reported when a file is decrypted or encrypted
+    PBKDF2HMAC = None
+
+V2_PREFIX = b'PAMv2:'
+V3_PREFIX = b'PAMv3:'
+V1_ITERATIONS = 100000  # do not change
+V2_ITERATIONS = 600000
+SALT_SIZE = 16
+IV_SIZE = 16
+BLOCK_SIZE = 128  # the AES block size in bits
+
+# bytes read at a time, a multiple of 4 so Base64 is decoded in whole quanta
+CHUNK_SIZE = 1 << 20
+WHITESPACE = b' \t\r\n'
+
+# the file types of the PAM file selection dialogue
+VAULT_SUFFIXES = ['.js', '.pam', '.txt']
+
+
+class PamError(Exception):
+    '''
+    The file cannot be decrypted or encrypted.
+    '''
+
+
+def v1_salt(salt: bytes) -> bytes:
+    '''
+    The v1 salt as PBKDF2 sees it: TextEncoder.encode() of a Uint8Array
+    encodes String(salt), the comma separated decimal bytes.
+    '''
+    return ','.join(str(byte) for byte in salt).encode('ascii')
+
+
+def derive_key(password: str, salt: bytes, version: str) -> bytes:
+    '''
+    Derive the AES-256 key of the version from the password and the salt.
+    '''
+    if PBKDF2HMAC is None:
+        raise PamError('the cryptography package is needed: pip install cryptography')
+    if version == 'v1':
+        salt = v1_salt(salt)
+        iterations = V1_ITERATIONS
+    else:
+        iterations = V2_ITERATIONS
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    return kdf.derive(password.encode('utf-8'))
+
+
+def detect_format(head: bytes) -> str:
+    '''
+    The format of the file that starts with head: plain, v1, v2 or v3.
+    The detection is the one of decryptJSON() in crypt.js.
+    '''
+    head = head.lstrip(WHITESPACE)
+    if head.startswith(V3_PREFIX):
+        return 'v3'
+    if head.startswith(V2_PREFIX):
+        return 'v2'
+    if head.startswith(b'{'):
+        return 'plain'
+    return 'v1'
+
+
+class Base64Decoder:
+    '''
+    Decode Base64 that arrives in pieces of any size.
+    '''
+    def __init__(self):
+        self.pending = b''
+
+    def update(self, data: bytes) -> bytes:
+        '''
+        Decode the data, the incomplete quantum is kept for the next call.
+        '''
+        data = self.pending + data.translate(None, WHITESPACE)
+        end = len(data) - len(data) % 4
+        self.pending = data[end:]
+        try:
+            return base64.b64decode(data[:end], validate=True)
+        except binascii.Error as exc:
+            raise PamError(f'ERROR: decryption conversion failed!\n{exc}') from exc
+
+    def finalize(self) -> bytes:
+        '''
+        There must be nothing left over.
+        '''
+        if self.pending:
+            raise PamError('ERROR: decryption conversion failed!\ntruncated Base64')
+        return b''
+
+
+class Encryptor:
+    '''
+    Encrypt the bytes (or text) written to it to a binary file in the
+    v1 or v2 format. For the same salt and IV the output is the output
+    of encryptTextV1() or encryptTextV2() in cipher.js.
+
+    The ciphertext is Base64 encoded in multiples of 3 bytes so only
+    the last few bytes are kept.
+    '''
+    def __init__(self, out, password: str, version: str = 'v2',
+                 salt: bytes = None, iv: bytes = None):
+        if version not in ('v1', 'v2'):
+            raise PamError(f'cannot encrypt to {version}')
+        if not password:
+            raise PamError('a password is needed to encrypt')
+        salt = salt if salt else os.urandom(SALT_SIZE)
+        iv = iv if iv else os.urandom(IV_SIZE)
+        key = derive_key(password, salt, version)
+        self.out = out
+        self.padder = padding.PKCS7(BLOCK_SIZE).padder()
+        self.encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        self.pending = salt + iv
+        if version == 'v2':
+            self.out.write(V2_PREFIX)
+
+    def encode(self, data: bytes, final: bool = False):
+        '''
+        Base64 encode the data and the bytes left over from the last call.
+        '''
+        data = self.pending + data
+        end = len(data) if final else len(data) - len(data) % 3
+        self.out.write(base64.b64encode(data[:end]))
+        self.pending = data[end:]
+
+    def write(self, data):
+        '''
+        Encrypt the data, text is encoded as UTF-8.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.encode(self.encryptor.update(self.padder.update(data)))
+
+    def close(self):
+        '''
+        Write the last block.
+        '''
+        data = self.encryptor.update(self.padder.finalize()) + self.encryptor.finalize()
+        self.encode(data, final=True)
+
+
+class Decryptor:  # pylint: disable=too-many-instance-attributes
+    '''
+    Decrypt the v1 or v2 ciphertext (without the prefix) written to it
+    and write the plaintext to a binary file.
+
+    A v1 plaintext that is not JSON is Base64 (files saved by early
+    versions of PAM) and is decoded, like decryptTextV1() does.
+    '''
+    def __init__(self, out, password: str, version: str):
+        self.out = out
+        self.password = password
+        self.version = version
+        self.base64 = Base64Decoder()
+        self.head = b''
+        self.decryptor = None
+        self.unpadder = None
+        self.inner = None  # the v1 plaintext Base64 decoder, False if it is JSON
+
+    def write(self, data: bytes):
+        '''
+        Decrypt the ciphertext.
+        '''
+        data = self.base64.update(data)
+        if self.decryptor is None:
+            self.head += data
+            if len(self.head) < SALT_SIZE + IV_SIZE:
+                return
+            salt = self.head[:SALT_SIZE]
+            iv = self.head[SALT_SIZE:SALT_SIZE + IV_SIZE]
+            data = self.head[SALT_SIZE + IV_SIZE:]
+            self.head = b''
+            key = derive_key(self.password, salt, self.version)
+            self.decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+            self.unpadder = padding.PKCS7(BLOCK_SIZE).unpadder()
+        self.emit(self.unpadder.update(self.decryptor.update(data)))
+
+    def emit(self, plaintext: bytes):
+        '''
+        Write the plaintext.
+        '''
+        if self.version == 'v1' and self.inner is None and plaintext:
+            self.inner = False if plaintext.startswith(b'{') else Base64Decoder()
+        if self.inner:
+            plaintext = self.inner.update(plaintext)
+        self.out.write(plaintext)
+
+    def close(self):
+        '''
+        Check the padding of the last block.
+        '''
+        self.base64.finalize()
+        if self.decryptor is None:
+            raise PamError('ERROR: decryption failed!\nthe file is too short')
+        try:
+            self.emit(self.unpadder.update(self.decryptor.finalize()) + self.unpadder.finalize())
+        except ValueError as exc:
+            raise PamError('Decryption failed!\nPlease try another password.') from exc
+        if self.inner:
+            self.inner.finalize()
+
+
+def decrypt_stream(inp, out, password: str) -> str:
+    '''
+    Decrypt the binary file inp to the binary file out and return the
+    format of inp. A plaintext file is copied.
+    '''
+    head = inp.read(CHUNK_SIZE)
+    version = detect_format(head[:64])
+    if version == 'v3':
+        raise PamError('the v3 format is not supported, load the file in PAM')
+    if version == 'plain':
+        sink = out
+    else:
+        if not password:
+            raise PamError('a password is needed to decrypt')
+        sink = Decryptor(out, password, version)
+        head = head.lstrip(WHITESPACE)
+        if version == 'v2':
+            head = head[len(V2_PREFIX):]
+    chunk = head
+    while chunk:
+        sink.write(chunk)
+        chunk = inp.read(CHUNK_SIZE)
+    if sink is not out:
+        sink.close()
+    return version
+
+
+def encrypt_stream(inp, out, password: str, version: str = 'v2', **kwargs) -> str:
+    '''
+    Encrypt the binary file inp to the binary file out and return the
+    format of inp. An encrypted inp is decrypted with the password
+    first, so this converts v1 files to v2. kwargs are passed to
+    Encryptor.
+    '''
+    encryptor = Encryptor(out, password, version, **kwargs)
+    src_version = decrypt_stream(inp, encryptor, password)
+    encryptor.close()
+    return src_version
+
+
+def rotate_stream(inp, out, password: str, new_password: str, version: str = 'v2') -> str:
+    '''
+    Re-encrypt the binary file inp with the new password and return
+    the format of inp.
+    '''
+    if not new_password:
+        raise PamError('a new password is needed')
+    encryptor = Encryptor(out, new_password, version)
+    src_version = decrypt_stream(inp, encryptor, password)
+    encryptor.close()
+    return src_version
+
+
+def read_vault(path: Path, password: str = '') -> dict:
+    '''
+    Read and parse the vault.
+    '''
+    out = io.BytesIO()
+    with open(path, 'rb') as inp:
+        decrypt_stream(inp, out, password)
+    try:
+        return json.loads(out.getvalue().decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise PamError(f'invalid record format!\n{exc}') from exc
+
+
+def write_vault(path: Path, vault: dict, password: str = '', version: str = 'v2'):
+    '''
+    Write the vault, it is encrypted if there is a password. The JSON is
+    the JSON.stringify() of the vault like PAM saves it.
+    '''
+    text = json.dumps(vault, ensure_ascii=False, separators=(',', ':'))
+    with open(path, 'wb') as out:
+        if password:
+            encryptor = Encryptor(out, password, version)
+            encryptor.write(text)
+            encryptor.close()
+        else:
+            out.write(text.encode('utf-8'))
+
+
+def check_stream(inp, password: str) -> dict:
+    '''
+    Decrypt and parse the vault and summarize it.
+    '''
+    out = io.BytesIO()
+    version = decrypt_stream(inp, out, password)
+    try:
+        vault = json.loads(out.getvalue().decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise PamError(f'invalid record format!\n{exc}') from exc
+    records = vault.get('records', [])
+    num_active = sum(record.get('active', True) for record in records)
+    return {
+        'format': version,
+        'format-version': vault.get('meta', {}).get('format-version'),
+        'date-saved': vault.get('meta', {}).get('date-saved'),
+        'records': len(records),
+        'active': num_active,
+        'inactive': len(records) - num_active,
+    }
+
+
+def run_job(job: dict) -> dict:
+    '''
+    Run a job of the process pool, it reports the error instead of
+    raising it so that one bad file does not stop a batch.
+    '''
+    result = {'src': str(job['src']), 'dst': str(job['dst']) if job['dst'] else None}
+    try:
+        with open(job['src'], 'rb') as inp:
+            if job['op'] == 'check':
+                result.update(check_stream(inp, job['password']))
+                return result
+            if job['dst'] is None:  # decrypt to stdout
+                result['format'] = decrypt_stream(inp, sys.stdout.buffer, job['password'])
+                return result
+            dst = Path(job['dst'])
+            tmp = dst.with_name(dst.name + '.tmp')
+            with open(tmp, 'wb') as out:
+                if job['op'] == 'decrypt':
+                    result['format'] = decrypt_stream(inp, out, job['password'])
+                elif job['op'] == 'encrypt':
+                    result['format'] = encrypt_stream(inp, out, job['password'], job['version'])
+                else:
+                    result['format'] = rotate_stream(inp, out, job['password'],
+                                                     job['new_password'], job['version'])
+            tmp.replace(dst)  # the output is complete, replace the old file
+    except (PamError, OSError) as exc:
+        result['error'] = str(exc)
+    return result
+
+
+def run_jobs(jobs: list, workers: int = None):
+    '''
+    Run the jobs in a process pool, the results are yielded in order.
+    '''
+    if len(jobs) == 1 or workers == 1:
+        yield from map(run_job, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(run_job, jobs)
+
+
+def find_vaults(paths: list) -> list:
+    '''
+    The files and the vaults in the directories, with their paths
+    relative to the directory.
+    '''
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend((file, file.relative_to(path)) for file in sorted(path.rglob('*'))
+                         if file.is_file() and file.suffix in VAULT_SUFFIXES)
+        else:
+            files.append((path, Path(path.name)))
+    return files
+
+
+def get_password(env: str, prompt: str) -> str:
+    '''
+    Get a password from the environment, prompt for it if it is not set.
+    '''
+    password = os.getenv(env)
+    if password is None:
+        password = getpass.getpass(prompt)
+    return password
+
+
+def mkjobs(opts: argparse.Namespace) -> list:
+    '''
+    Make the jobs for the files on the command line.
+    '''
+    files = find_vaults(opts.paths)
+    if opts.op != 'check' and opts.output and len(files) > 1:
+        raise PamError('-o is for a single file, use -O for many files')
+    if opts.op == 'decrypt' and not (opts.output or opts.output_dir) and len(files) > 1:
+        raise PamError('use -O to decrypt many files')
+    password = get_password('PAM_PASSWORD', 'password: ')
+    new_password = get_password('PAM_NEW_PASSWORD', 'new password: ') \
+        if opts.op == 'rotate' else None
+    jobs = []
+    for file, relative in files:
+        dst = None
+        if opts.op == 'check':
+            pass
+        elif opts.output:
+            dst = opts.output
+        elif opts.output_dir:
+            dst = opts.output_dir / relative
+            dst.parent.mkdir(parents=True, exist_ok=True)
+        elif opts.op != 'decrypt':
+            dst = file  # in place
+        jobs.append({'op': opts.op, 'src': file, 'dst': dst, 'password': password,
+                     'new_password': new_password, 'version': opts.format})
+    return jobs
+
+
+def getopts() -> argparse.Namespace:
+    '''
+    Get the command line options.
+    '''
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n', maxsplit=1)[0].strip(),
+        epilog='Without -o or -O a file is decrypted to stdout, '
+        'and encrypted or rotated in place.')
+    parser.add_argument('op', choices=['decrypt', 'encrypt', 'rotate', 'check'],
+                        help='decrypt to JSON, encrypt, re-encrypt with a new password, '
+                        'or check that the files can be loaded and summarize them')
+    parser.add_argument('paths', nargs='+', type=Path,
+                        help='the vaults or directories of vaults')
+    parser.add_argument('-f', '--format', choices=['v1', 'v2'], default='v2',
+                        help='the format that is written (default: %(default)s)')
+    parser.add_argument('-o', '--output', type=Path,
+                        help='the output file for a single vault')
+    parser.add_argument('-O', '--output-dir', type=Path,
+                        help='the output directory, the relative paths are kept')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='the number of processes (default: the number of cores)')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    main
+    '''
+    opts = getopts()
+    try:
+        jobs = mkjobs(opts)
+    except (PamError, OSError) as exc:
+        sys.exit(f'ERROR: {exc}')
+    num_errors = 0
+    for result in run_jobs(jobs, opts.jobs):
+        if 'error' in result:
+            num_errors += 1
+            print(f'{result["src"]}: ERROR: {result["error"]}', file=sys.stderr)
+        elif opts.op == 'check':
+            print(json.dumps(result))
+        else:
+            print(f'{result["src"]} ({result["format"]}) -> {result["dst"]}')
+    sys.exit(1 if num_errors else 0)
+
+
+if __name__ == '__main__':
+    main()
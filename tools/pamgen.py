@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+'''
+Generate synthetic PAM vaults for load testing.
+
+The vault has the schema that convertInternalDataToJSON() in
+www/js/save.js saves:
+
+    {"meta": {"date-saved": ..., "format-version": ...},
+     "prefs": {...},
+     "records": [{"title": ..., "active": ..., "created": ..., "fields": [
+         {"name": ..., "type": ..., "value": ...}, ...]}, ...]}
+
+The records are random but the same options and seed always generate
+the same records. The output is streamed one record at a time so the
+memory use does not depend on the number of records. With a password
+the vault is encrypted in the PAMv2 format of encryptV2() in
+www/js/crypt.js by tools/pamcrypt.py, the encryption needs the
+cryptography package.
+
+Examples:
+
+    tools/pamgen.py -n 50000 -o vault-50k.txt
+    PAM_PASSWORD=secret tools/pamgen.py -n 1000000 --dup-ratio 0.1 -o vault.txt
+'''
+import argparse
+import json
+import os
+import random
+import sys
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from pamcrypt import Encryptor, PamError
+
+# VALID_FIELD_TYPES in www/js/prefs-model.js.
+VALID_FIELD_TYPES = ['datetime-local', 'email', 'html', 'number', 'password',
+                     'phone', 'text', 'textarea', 'time', 'url']
+
+VERSION_FILE = Path(__file__).resolve().parent.parent / 'VERSION'
+
+# duplicate titles repeat one of the last DUP_WINDOW titles
+DUP_WINDOW = 1024
+
+WORDS = ['amber', 'basil', 'cedar', 'delta', 'ember', 'fjord', 'grove', 'harbor',
+         'indigo', 'juniper', 'kestrel', 'lagoon', 'maple', 'nectar', 'onyx', 'pebble',
+         'quartz', 'raven', 'sierra', 'tundra', 'umber', 'violet', 'willow', 'yarrow']
+FIELD_NAMES = {
+    'datetime-local': 'expires',
+    'email': 'email',
+    'html': 'notes',
+    'number': 'pin',
+    'password': 'password',
+    'phone': 'phone',
+    'text': 'username',
+    'textarea': 'note',
+    'time': 'reminder',
+    'url': 'website',
+}
+PASSWORD_CHARS = 'abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789-_.!$%'
+
+
+def format_version() -> str:
+    '''
+    The format version of the vaults saved by this version of PAM.
+    '''
+    try:
+        return VERSION_FILE.read_text(encoding='utf-8').strip()
+    except OSError:
+        return 'unknown'
+
+
+def iso_date(date: datetime) -> str:
+    '''
+    The date as Date.toISOString() formats it.
+    '''
+    return date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + \
+        f'{date.microsecond // 1000:03d}Z'
+
+
+def parse_distribution(spec: str) -> tuple:
+    '''
+    Parse a field count distribution: COUNT[:WEIGHT],... for example
+    "2:1,4:3,8:1" generates 4 fields three times as often as 2 or 8.
+    Returns the counts and the weights.
+    '''
+    counts = []
+    weights = []
+    for item in spec.split(','):
+        count, _, weight = item.partition(':')
+        counts.append(int(count))
+        weights.append(float(weight) if weight else 1.0)
+    if min(counts) < 0 or min(weights) < 0 or sum(weights) <= 0:
+        raise ValueError(f'invalid field count distribution: {spec}')
+    return counts, weights
+
+
+def parse_range(spec: str) -> tuple:
+    '''
+    Parse MIN-MAX or N.
+    '''
+    low, _, high = spec.partition('-')
+    low = int(low)
+    high = int(high) if high else low
+    if low < 1 or high < low:
+        raise ValueError(f'invalid range: {spec}')
+    return low, high
+
+
+class VaultGenerator:  # pylint: disable=too-many-instance-attributes
+    '''
+    Generate the records of a synthetic vault.
+    '''
+    def __init__(self, **options):
+        self.rng = random.Random(options.get('seed', 0))
+        self.num = options.get('num', 1000)
+        self.field_counts, self.field_weights = \
+            parse_distribution(options.get('fields', '3:1,4:4,5:2,8:1'))
+        self.types = options.get('types', VALID_FIELD_TYPES)
+        self.value_size = parse_range(options.get('value_size', '8-64'))
+        self.dup_ratio = options.get('dup_ratio', 0.0)
+        self.inactive_ratio = options.get('inactive_ratio', 0.0)
+        self.start = options.get('start', datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.titles = deque(maxlen=DUP_WINDOW)
+        for field_type in self.types:
+            if field_type not in VALID_FIELD_TYPES:
+                raise ValueError(f'invalid field type: {field_type}')
+
+    def text(self, size: int, chars: str = PASSWORD_CHARS) -> str:
+        '''
+        Random characters.
+        '''
+        return ''.join(self.rng.choice(chars) for _ in range(size))
+
+    def words(self, size: int, sep: str = ' ') -> str:
+        '''
+        Random words, about size characters.
+        '''
+        words = []
+        length = 0
+        while length < size:
+            word = self.rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + len(sep)
+        return sep.join(words)
+
+    def value(self, field_type: str) -> str:  # pylint: disable=too-many-return-statements
+        '''
+        A random value of the field type.
+        '''
+        size = self.rng.randint(*self.value_size)
+        if field_type == 'datetime-local':
+            date = self.start + timedelta(minutes=self.rng.randrange(525600 * 5))
+            return date.strftime('%Y-%m-%dT%H:%M')
+        if field_type == 'time':
+            return f'{self.rng.randrange(24):02d}:{self.rng.randrange(60):02d}'
+        if field_type == 'number':
+            return self.text(size, '0123456789')
+        if field_type == 'phone':
+            return f'+1-555-{self.rng.randrange(1000):03d}-{self.rng.randrange(10000):04d}'
+        if field_type == 'email':
+            return f'{self.text(size, "abcdefghijklmnopqrstuvwxyz")}@example.com'
+        if field_type == 'url':
+            return f'https://{self.rng.choice(WORDS)}.example.com/{self.words(size, "/")}'
+        if field_type == 'textarea':
+            return '\n'.join(self.words(size) for _ in range(self.rng.randint(1, 5)))
+        if field_type == 'html':
+            return f'<p>{self.words(size)}</p>'
+        if field_type == 'password':
+            return self.text(size)
+        return self.words(size)
+
+    def title(self, i: int) -> str:
+        '''
+        The title of record i, it repeats an earlier title dup_ratio of the time.
+        '''
+        if self.titles and self.rng.random() < self.dup_ratio:
+            return self.rng.choice(self.titles)
+        title = f'{self.rng.choice(WORDS).capitalize()} account {i}'
+        self.titles.append(title)
+        return title
+
+    def record(self, i: int) -> dict:
+        '''
+        Generate record i.
+        '''
+        num_fields = self.rng.choices(self.field_counts, self.field_weights)[0]
+        fields = []
+        for _ in range(num_fields):
+            field_type = self.rng.choice(self.types)
+            fields.append({
+                'name': FIELD_NAMES[field_type],
+                'type': field_type,
+                'value': self.value(field_type),
+            })
+        created = self.start + timedelta(seconds=self.rng.randrange(86400 * 365 * 5))
+        return {
+            'title': self.title(i),
+            'active': self.rng.random() >= self.inactive_ratio,
+            'created': iso_date(created),
+            'fields': fields,
+        }
+
+    def records(self):
+        '''
+        Generate the records.
+        '''
+        for i in range(self.num):
+            yield self.record(i)
+
+
+def dumps(obj) -> str:
+    '''
+    JSON like JSON.stringify(obj, null, 0).
+    '''
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def generate_json(generator: VaultGenerator, prefs: dict = None, date_saved: str = None):
+    '''
+    Generate the JSON of the vault in pieces.
+    '''
+    meta = {
+        'date-saved': date_saved if date_saved else iso_date(datetime.now(timezone.utc)),
+        'format-version': format_version(),
+    }
+    yield dumps({'meta': meta, 'prefs': prefs if prefs else {}})[:-1] + ',"records":['
+    for i, record in enumerate(generator.records()):
+        yield (',' if i else '') + dumps(record)
+    yield ']}'
+
+
+class PlainWriter:
+    '''
+    Write the text written to it to a binary file as UTF-8.
+    '''
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, text: str):
+        '''
+        Write the text.
+        '''
+        self.out.write(text.encode('utf-8'))
+
+    def close(self):
+        '''
+        Nothing to do.
+        '''
+
+
+def write_vault(out, generator: VaultGenerator, password: str = '', **kwargs):
+    '''
+    Write the vault to the binary file, encrypted if there is a password.
+    kwargs are passed to generate_json().
+    '''
+    writer = Encryptor(out, password) if password else PlainWriter(out)
+    for piece in generate_json(generator, **kwargs):
+        writer.write(piece)
+    writer.close()
+
+
+def getopts() -> argparse.Namespace:
+    '''
+    Get the command line options.
+    '''
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n', maxsplit=1)[0].strip(),
+        epilog='The password is read from the PAM_PASSWORD environment variable, '
+        'the vault is not encrypted if it is not set.')
+    parser.add_argument('-n', '--num', type=int, default=1000,
+                        help='the number of records (default: %(default)s)')
+    parser.add_argument('-f', '--fields', default='3:1,4:4,5:2,8:1',
+                        help='the distribution of the number of fields per record, '
+                        'COUNT[:WEIGHT],... (default: %(default)s)')
+    parser.add_argument('-t', '--types', default=','.join(VALID_FIELD_TYPES),
+                        help='the field types, comma separated (default: all)')
+    parser.add_argument('-s', '--value-size', default='8-64',
+                        help='the size of the field values, MIN-MAX characters '
+                        '(default: %(default)s)')
+    parser.add_argument('-d', '--dup-ratio', type=float, default=0.0,
+                        help='the ratio of records with a duplicate title (default: %(default)s)')
+    parser.add_argument('-i', '--inactive-ratio', type=float, default=0.0,
+                        help='the ratio of inactive records (default: %(default)s)')
+    parser.add_argument('-p', '--prefs', type=Path,
+                        help='a JSON file with the prefs of the vault (default: none)')
+    parser.add_argument('-r', '--seed', type=int, default=0,
+                        help='the random seed (default: %(default)s)')
+    parser.add_argument('-o', '--output', type=Path,
+                        help='the output file (default: stdout)')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    main
+    '''
+    opts = getopts()
+    try:
+        generator = VaultGenerator(num=opts.num, fields=opts.fields,
+                                   types=opts.types.split(','), value_size=opts.value_size,
+                                   dup_ratio=opts.dup_ratio, inactive_ratio=opts.inactive_ratio,
+                                   seed=opts.seed)
+        prefs = json.loads(opts.prefs.read_text(encoding='utf-8')) if opts.prefs else None
+        password = os.getenv('PAM_PASSWORD', '')
+        if opts.output:
+            with opts.output.open('wb') as out:
+                write_vault(out, generator, password, prefs=prefs)
+        else:
+            write_vault(sys.stdout.buffer, generator, password, prefs=prefs)
+    except (ValueError, OSError, PamError) as exc:
+        sys.exit(f'ERROR: {exc}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,508 @@
+// File encryption.
+/**
+ * The v1, v2 and v3 file encryption formats (see crypt.js for their
+ * description) used by crypt.js on the main thread and by the crypt
+ * worker (crypt-worker.js). It must not use the DOM or window.
+ *
+ * The functions are async and report errors by throwing.
+ * @module cipher
+ */
+
+// https://stackoverflow.com/questions/40031688/javascript-arraybuffer-to-hex
+function buf2hex(buffer) { // buffer is an ArrayBuffer
+  return [...new Uint8Array(buffer)]
+      .map(x => x.toString(16).padStart(2, '0'))
+      .join('');
+}
+
+// https://dev.to/halan/4-ways-of-symmetric-cryptography-and-javascript-how-to-aes-with-javascript-3o1b
+const encoder = new TextEncoder()
+const decoder = new TextDecoder()
+
+const numIterations = 100000     // v1 — preserved exactly, do not change
+const numIterationsV2 = 600000  // v2 — NIST SP 800-132 / OWASP 2023 recommendation
+export const V2_PREFIX = 'PAMv2:' // v2 file format prefix
+export const V3_PREFIX = 'PAMv3:' // v3 file format prefix
+const V3_CHUNK_RECORDS = 64       // v3 records per chunk on average
+const V3_CHUNK_MAX_RECORDS = 256  // v3 records per chunk at most
+
+const BASE64_CHUNK = 0x8000 // bytes converted per String.fromCharCode() call
+
+// Encode the bytes (a Uint8Array) as Base64.
+// The bytes are converted in chunks because String.fromCharCode() is
+// limited by the maximum number of function arguments.
+const toBase64 = bytes => {
+    let chunks = []
+    for (let i=0; i < bytes.length; i += BASE64_CHUNK) {
+        chunks.push(String.fromCharCode.apply(null, bytes.subarray(i, i + BASE64_CHUNK)))
+    }
+    return btoa(chunks.join(''))
+}
+const fromBase64 = buffer => {
+    let raw = null
+    try {
+        raw = atob(buffer)
+    } catch (e) {
+        throw new Error(`ERROR: decryption conversion failed!\n${e}`)
+    }
+    let bytes = new Uint8Array(raw.length)
+    for (let i=0; i < raw.length; i++) {
+        bytes[i] = raw.charCodeAt(i)
+    }
+    return bytes
+}
+
+// Write the parts (Uint8Arrays or ArrayBuffers), for example the salt,
+// the IV and the ciphertext, into a single buffer.
+const joinCipherParts = (...parts) => {
+    let views = parts.map((part) => part instanceof Uint8Array ? part : new Uint8Array(part))
+    let bytes = new Uint8Array(views.reduce((n, view) => n + view.length, 0))
+    let pos = 0
+    for (const view of views) {
+        bytes.set(view, pos)
+        pos += view.length
+    }
+    return bytes
+}
+
+/**
+ * Serialize the file contents.
+ *
+ * If fragments is not null it holds the JSON of each record and it
+ * replaces contents.records in the output. This lets saves reuse the
+ * JSON of the records that did not change (see getRecordJSON() in
+ * store.js). The output is the same as JSON.stringify() of the
+ * contents with the records.
+ * @param {object} contents - The file contents: {meta, prefs, records}.
+ * @param {string[]|null} fragments - The JSON of each record or null.
+ * @returns {string} The JSON of the file contents.
+ */
+export function joinContents(contents, fragments) {
+    if (!fragments) {
+        return JSON.stringify(contents, null, 0)
+    }
+    let head = {...contents}
+    delete head.records
+    head.records = [] // last so that the records can be appended
+    let json = JSON.stringify(head, null, 0)
+    return json.slice(0, -'[]}'.length) + '[' + fragments.join(',') + ']}'
+}
+
+/**
+ * Pack the file contents into a buffer that can be transferred to a
+ * worker instead of being copied, see unpackContents().
+ *
+ * The JSON of the contents and each fragment are encoded one at a time
+ * into the buffer so that the fragments are never joined into one
+ * string on the main thread. The offsets are the byte positions where
+ * the contents and each fragment end, there are none without
+ * fragments.
+ * @param {object} contents - The file contents: {meta, prefs, records}.
+ * @param {string[]|null} fragments - The JSON of each record or null.
+ * @returns {{bytes: ArrayBuffer, offsets: Uint32Array}} The packed contents.
+ */
+export function packContents(contents, fragments) {
+    let head = JSON.stringify(contents, null, 0)
+    if (!fragments) {
+        return {bytes: encoder.encode(head).buffer, offsets: new Uint32Array(0)}
+    }
+    let size = head.length
+    for (const fragment of fragments) {
+        size += fragment.length
+    }
+    let buffer = new Uint8Array(size) // large enough for ASCII, grown otherwise
+    let pos = 0
+    let put = (text) => {
+        let result = encoder.encodeInto(text, buffer.subarray(pos))
+        pos += result.written
+        if (result.read < text.length) {
+            let rest = text.slice(result.read)
+            let grown = new Uint8Array(Math.max(2 * buffer.length, pos + 3 * rest.length))
+            grown.set(buffer.subarray(0, pos))
+            buffer = grown
+            pos += encoder.encodeInto(rest, buffer.subarray(pos)).written
+        }
+        return pos
+    }
+    let offsets = new Uint32Array(fragments.length + 1)
+    offsets[0] = put(head)
+    for (let i=0; i < fragments.length; i++) {
+        offsets[i + 1] = put(fragments[i])
+    }
+    return {bytes: buffer.buffer, offsets: offsets}
+}
+
+/**
+ * Unpack the file contents packed by packContents().
+ * @param {{bytes: ArrayBuffer, offsets: Uint32Array}} packed - The packed contents.
+ * @returns {{contents: object, fragments: string[]|null}} The file contents
+ *   and the fragments, null if there were none.
+ */
+export function unpackContents(packed) {
+    let bytes = new Uint8Array(packed.bytes)
+    let offsets = packed.offsets
+    if (offsets.length === 0) {
+        return {contents: JSON.parse(decoder.decode(bytes)), fragments: null}
+    }
+    let contents = JSON.parse(decoder.decode(bytes.subarray(0, offsets[0])))
+    let fragments = new Array(offsets.length - 1)
+    for (let i=1; i < offsets.length; i++) {
+        fragments[i - 1] = decoder.decode(bytes.subarray(offsets[i - 1], offsets[i]))
+    }
+    return {contents: contents, fragments: fragments}
+}
+
+const PBKDF2 = async (password, salt, iterations, length, hash, algorithm = 'AES-CBC') => {
+        let keyMaterial = await crypto.subtle.importKey(
+            'raw',
+            encoder.encode(password),
+            {name: 'PBKDF2'},
+            false,
+            ['deriveKey']
+        );
+        return await crypto.subtle.deriveKey(
+            {
+                name: 'PBKDF2',
+                salt: encoder.encode(salt),
+                iterations,
+                hash
+            },
+            keyMaterial,
+            { name: algorithm, length },
+            false, // we don't need to export our key!!!
+            ['encrypt', 'decrypt']
+        );
+    }
+
+// v2: raw salt bytes are passed directly — no TextEncoder bug
+// v3 uses the same derivation for an AES-GCM key.
+const PBKDF2V2 = async (password, salt, algorithm = 'AES-CBC') => {
+    let keyMaterial = await crypto.subtle.importKey(
+        'raw', encoder.encode(password), {name: 'PBKDF2'}, false, ['deriveKey']
+    )
+    return await crypto.subtle.deriveKey(
+        { name: 'PBKDF2', salt: salt, iterations: numIterationsV2, hash: 'SHA-256' },
+        keyMaterial,
+        { name: algorithm, length: 256 },
+        false,
+        ['encrypt', 'decrypt']
+    )
+}
+
+// Derived key cache.
+// PBKDF2 is deliberately slow so saving or loading the same file over
+// and over re-derives the same key each time. When cacheKeys is true
+// (the cacheDerivedKeys pref) the derived keys, which are not
+// extractable, are kept for the session keyed by the cache id (see
+// cacheId()) of the format version, the password and the file salt.
+// The salt of the last file
+// that was loaded or saved with a password is reused for the next save
+// with that password so that the save can reuse the key, the IV is
+// always new.
+// The cache is cleared by clearKeyCache() (see clearFilePass() and the
+// prefs dialog) and when it has not been used for KEY_CACHE_IDLE_MS.
+const KEY_CACHE_IDLE_MS = 10 * 60 * 1000
+let KEY_CACHE = new Map()       // cache id of version, password and salt -> CryptoKey
+let KEY_CACHE_SALTS = new Map() // cache id of version and password -> salt of the last file
+let KEY_CACHE_TIMER = null
+let V3_CHUNK_CACHE = new Map()  // cache id of password, salt and plaintext -> v3 chunk
+let CACHE_ID_KEY = null         // promise of the HMAC key of the cache ids or null
+
+/**
+ * Forget all cached derived keys and file salts.
+ */
+export function clearKeyCache() {
+    KEY_CACHE.clear()
+    KEY_CACHE_SALTS.clear()
+    V3_CHUNK_CACHE.clear()
+    CACHE_ID_KEY = null
+    if (KEY_CACHE_TIMER !== null) {
+        clearTimeout(KEY_CACHE_TIMER)
+        KEY_CACHE_TIMER = null
+    }
+}
+
+// restart the idle timer of the key cache.
+function touchKeyCache() {
+    if (KEY_CACHE_TIMER !== null) {
+        clearTimeout(KEY_CACHE_TIMER)
+    }
+    KEY_CACHE_TIMER = setTimeout(clearKeyCache, KEY_CACHE_IDLE_MS)
+}
+
+// get the cache id of the parts, which include the password.
+// The id is an HMAC under a random, non-extractable key that is made
+// for the session and replaced when the cache is cleared. A plain hash
+// would be a fast, unsalted hash of the password that could be used to
+// test passwords without PBKDF2.
+const cacheId = async (...parts) => {
+    if (CACHE_ID_KEY === null) {
+        CACHE_ID_KEY = crypto.subtle.generateKey({name: 'HMAC', hash: 'SHA-256'}, false, ['sign'])
+    }
+    let mac = await crypto.subtle.sign('HMAC', await CACHE_ID_KEY, encoder.encode(parts.join('\u0000')))
+    return buf2hex(mac)
+}
+
+// hash the v3 chunk line.
+const hashLine = async (line) => {
+    let digest = await crypto.subtle.digest('SHA-256', encoder.encode(line))
+    return buf2hex(digest)
+}
+
+// get the derived key from the cache or derive it.
+const deriveCachedKey = async (version, password, salt, cacheKeys, derive) => {
+    if (!cacheKeys) {
+        return await derive()
+    }
+    let id = await cacheId(version, password, buf2hex(salt))
+    let key = KEY_CACHE.get(id)
+    if (!key) {
+        key = await derive()
+        KEY_CACHE.set(id, key)
+    }
+    KEY_CACHE_SALTS.set(await cacheId(version, password), salt.slice()) // the salt may be a view of the file
+    touchKeyCache()
+    return key
+}
+
+// get the salt for a new file, reuse the salt of the last file if
+// derived keys are cached.
+const getSalt = async (version, password, cacheKeys) => {
+    if (cacheKeys) {
+        let salt = KEY_CACHE_SALTS.get(await cacheId(version, password))
+        if (salt) {
+            return salt
+        }
+    }
+    return crypto.getRandomValues(new Uint8Array(16))
+}
+
+// decrypt the data with the derived key, params are the AES parameters.
+// The error messages are the ones reported to the user.
+const decryptData = async (keyPromise, params, data) => {
+    let key = null
+    try {
+        key = await keyPromise
+    } catch (error) {
+        throw new Error(`Decryption setup failed!\nPlease try another password.\n${error}`)
+    }
+    try {
+        return await crypto.subtle.decrypt(params, key, data)
+    } catch (error) {
+        throw new Error(`Decryption failed!\nPlease try another password.\n${error}`)
+    }
+}
+
+/**
+ * Encrypt the plaintext in the v1 format.
+ * @param {string} password - The master password, must not be empty.
+ * @param {string} plaintext - The UTF-8 JSON string to encrypt.
+ * @param {boolean} cacheKeys - Use the derived key cache.
+ * @returns {Promise<string>} The Base64 ciphertext.
+ */
+export async function encryptTextV1(password, plaintext, cacheKeys) {
+    const iv = crypto.getRandomValues(new Uint8Array(16))
+    const salt = await getSalt('v1', password, cacheKeys)
+    const key = await deriveCachedKey('v1', password, salt, cacheKeys,
+                                      () => PBKDF2(password, salt, numIterations, 256, 'SHA-256'))
+    const encrypted = await crypto.subtle.encrypt({name: 'AES-CBC', iv: iv }, key, encoder.encode(plaintext))
+    return toBase64(joinCipherParts(salt, iv, encrypted))
+}
+
+/**
+ * Decrypt v1 format ciphertext.
+ * @param {string} password - The master password, must not be empty.
+ * @param {string} ciphertext - The Base64 ciphertext.
+ * @param {boolean} cacheKeys - Use the derived key cache.
+ * @returns {Promise<string>} The plaintext.
+ */
+export async function decryptTextV1(password, ciphertext, cacheKeys) {
+    const salt_len = 16
+    const iv_len = 16
+    const encrypted = fromBase64(ciphertext)
+    // views, not copies, of the decoded bytes
+    const salt = encrypted.subarray(0, salt_len)
+    const iv = encrypted.subarray(0+salt_len, salt_len+iv_len)
+    const data = encrypted.subarray(salt_len + iv_len)
+    const keyPromise = deriveCachedKey('v1', password, salt, cacheKeys,
+                                       () => PBKDF2(password, salt, numIterations, 256, 'SHA-256'))
+    const decrypted = await decryptData(keyPromise, {name: 'AES-CBC', iv: iv}, data)
+    const base64 = decoder.decode(decrypted)
+    if (base64[0] === '{' ) {
+        return base64
+    }
+    return fromBase64(base64)
+}
+
+/**
+ * Encrypt the plaintext in the v2 format.
+ * @param {string} password - The master password, must not be empty.
+ * @param {string} plaintext - The UTF-8 JSON string to encrypt.
+ * @param {boolean} cacheKeys - Use the derived key cache.
+ * @returns {Promise<string>} The ciphertext with the PAMv2: prefix.
+ */
+export async function encryptTextV2(password, plaintext, cacheKeys) {
+    const iv = crypto.getRandomValues(new Uint8Array(16))
+    const salt = await getSalt('v2', password, cacheKeys)
+    const key = await deriveCachedKey('v2', password, salt, cacheKeys, () => PBKDF2V2(password, salt))
+    const encrypted = await crypto.subtle.encrypt({name: 'AES-CBC', iv: iv}, key, encoder.encode(plaintext))
+    return V2_PREFIX + toBase64(joinCipherParts(salt, iv, encrypted))
+}
+
+/**
+ * Decrypt v2 format ciphertext.
+ * @param {string} password - The master password, must not be empty.
+ * @param {string} ciphertext - The ciphertext with the PAMv2: prefix.
+ * @param {boolean} cacheKeys - Use the derived key cache.
+ * @returns {Promise<string>} The plaintext.
+ */
+export async function decryptTextV2(password, ciphertext, cacheKeys) {
+    const encrypted = fromBase64(ciphertext.slice(V2_PREFIX.length))
+    // views, not copies, of the decoded bytes
+    const salt = encrypted.subarray(0, 16)
+    const iv = encrypted.subarray(16, 32)
+    const data = encrypted.subarray(32)
+    const keyPromise = deriveCachedKey('v2', password, salt, cacheKeys, () => PBKDF2V2(password, salt))
+    const decrypted = await decryptData(keyPromise, {name: 'AES-CBC', iv: iv}, data)
+    return decoder.decode(decrypted)
+}
+
+// The v3 format.
+// The file is a sequence of lines, each one is Base64 encoded:
+//   PAMv3:[16-byte salt]
+//   [12-byte IV][AES-GCM ciphertext of the header]
+//   [12-byte IV][AES-GCM ciphertext of chunk 0]
+//   ...
+// The header is the JSON of {meta, prefs, chunks} where chunks holds
+// the SHA-256 hash of each chunk line, in order. A chunk is the JSON
+// array of the next records. The file is always decrypted as a whole,
+// the chunks only let a save re-encrypt part of it. The line name
+// ("header" or "chunk") is the AES-GCM additional data so that a chunk
+// cannot be passed off as the header, the hashes in the header tie the
+// chunks to the header and fix their order.
+// A chunk ends after a record whose title and created date hash to a
+// multiple of V3_CHUNK_RECORDS, or after V3_CHUNK_MAX_RECORDS records,
+// so the chunk boundaries move with the records rather than with their
+// positions and adding or deleting a record only changes its chunk.
+// The key is derived as in v2. When cacheKeys is true the salt and the
+// key are reused for the next save of the file and the chunks are kept
+// in V3_CHUNK_CACHE by their plaintext so that the save only encrypts
+// the chunks that changed. Without cacheKeys every save has a new salt
+// and all of the chunks are encrypted.
+
+// encrypt a v3 line.
+const encryptLine = async (key, name, plaintext) => {
+    const iv = crypto.getRandomValues(new Uint8Array(12))
+    const params = {name: 'AES-GCM', iv: iv, additionalData: encoder.encode(V3_PREFIX + name)}
+    const encrypted = await crypto.subtle.encrypt(params, key, encoder.encode(plaintext))
+    return toBase64(joinCipherParts(iv, encrypted))
+}
+
+// decrypt a v3 line.
+const decryptLine = async (keyPromise, name, line) => {
+    const encrypted = fromBase64(line)
+    const params = {name: 'AES-GCM', iv: encrypted.subarray(0, 12), additionalData: encoder.encode(V3_PREFIX + name)}
+    return decoder.decode(await decryptData(keyPromise, params, encrypted.subarray(12)))
+}
+
+// FNV-1a hash of the text.
+const fnv1a = (text) => {
+    let hash = 0x811c9dc5
+    for (let i=0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i)
+        hash = Math.imul(hash, 0x01000193)
+    }
+    return hash >>> 0
+}
+
+// does a v3 chunk end after the record?
+// Only the title and the created date are used so that editing the
+// fields of a record or toggling it does not move the boundaries.
+const isChunkEnd = (record) => fnv1a(`${record.title}\u0000${record.created}`) % V3_CHUNK_RECORDS === 0
+
+/**
+ * Encrypt the file contents in the v3 format.
+ * @param {string} password - The master password, must not be empty.
+ * @param {object} contents - The file contents: {meta, prefs, records}.
+ * @param {boolean} cacheKeys - Use the derived key and chunk caches.
+ * @param {string[]|null} fragments - The JSON of each record, see
+ *   joinContents(), contents.records then only needs the title, active
+ *   and created of each record.
+ * @returns {Promise<string>} The ciphertext with the PAMv3: prefix.
+ */
+export async function encryptContentsV3(password, contents, cacheKeys, fragments = null) {
+    const salt = await getSalt('v3', password, cacheKeys)
+    const key = await deriveCachedKey('v3', password, salt, cacheKeys, () => PBKDF2V2(password, salt, 'AES-GCM'))
+    const saltHex = buf2hex(salt)
+    const records = contents.records
+    let cache = new Map() // only keep the chunks of this file
+    let chunks = []
+    let first = 0
+    for (let i=0; i < records.length; i++) {
+        if (i + 1 < records.length && i + 1 - first < V3_CHUNK_MAX_RECORDS && !isChunkEnd(records[i])) {
+            continue
+        }
+        const plaintext = fragments ?
+              '[' + fragments.slice(first, i + 1).join(',') + ']' :
+              JSON.stringify(records.slice(first, i + 1))
+        first = i + 1
+        const id = cacheKeys ? await cacheId(password, saltHex, plaintext) : null
+        let chunk = id ? V3_CHUNK_CACHE.get(id) : null
+        if (!chunk) {
+            chunk = await encryptLine(key, 'chunk', plaintext)
+        }
+        if (id) {
+            cache.set(id, chunk)
+        }
+        chunks.push(chunk)
+    }
+    if (cacheKeys) {
+        V3_CHUNK_CACHE = cache
+    }
+    const header = {
+        meta: contents.meta,
+        prefs: contents.prefs,
+        chunks: await Promise.all(chunks.map((chunk) => hashLine(chunk))),
+    }
+    return [V3_PREFIX + toBase64(salt), await encryptLine(key, 'header', JSON.stringify(header)), ...chunks].join('\n')
+}
+
+/**
+ * Decrypt v3 format ciphertext.
+ * @param {string} password - The master password, must not be empty.
+ * @param {string} ciphertext - The ciphertext with the PAMv3: prefix.
+ * @param {boolean} cacheKeys - Use the derived key and chunk caches.
+ * @returns {Promise<object>} The file contents: {meta, prefs, records}.
+ */
+export async function decryptContentsV3(password, ciphertext, cacheKeys) {
+    const lines = ciphertext.trimEnd().split(/\r?\n/)
+    if (lines.length < 2) {
+        throw new Error('Decryption failed!\nThe file is truncated.')
+    }
+    const salt = fromBase64(lines[0].slice(V3_PREFIX.length))
+    const saltHex = buf2hex(salt)
+    const keyPromise = deriveCachedKey('v3', password, salt, cacheKeys, () => PBKDF2V2(password, salt, 'AES-GCM'))
+    const header = JSON.parse(await decryptLine(keyPromise, 'header', lines[1]))
+    if (header.chunks.length !== lines.length - 2) {
+        throw new Error(`Decryption failed!\nThe file has ${lines.length - 2} chunks, expected ${header.chunks.length}.`)
+    }
+    if (cacheKeys) {
+        V3_CHUNK_CACHE = new Map()
+    }
+    const chunks = await Promise.all(header.chunks.map(async (hash, index) => {
+        const chunk = lines[index + 2]
+        if (await hashLine(chunk) !== hash) {
+            throw new Error(`Decryption failed!\nChunk ${index} does not match the header.`)
+        }
+        const plaintext = await decryptLine(keyPromise, 'chunk', chunk)
+        if (cacheKeys) {
+            V3_CHUNK_CACHE.set(await cacheId(password, saltHex, plaintext), chunk)
+        }
+        return JSON.parse(plaintext)
+    }))
+    return {
+        meta: header.meta,
+        prefs: header.prefs,
+        records: chunks.flat(),
+    }
+}
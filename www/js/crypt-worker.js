@@ -0,0 +1,127 @@
+// Crypt worker.
+/**
+ * Decrypts and parses loaded files and serializes and encrypts saved
+ * files off the main thread. See decryptJSON() and encryptJSON() in
+ * crypt.js.
+ *
+ * Messages:
+ *   {cmd: 'decrypt', id, password, content, cacheKeys}
+ *                           - decrypt and parse the file content, an
+ *                             ArrayBuffer of UTF-8 plain JSON or v1, v2
+ *                             or v3 ciphertext
+ *   {cmd: 'encrypt', id, password, packed, cacheKeys, v3}
+ *                           - serialize and encrypt the contents, in
+ *                             the v3 format if v3 is true else in v2,
+ *                             packed is the contents and the JSON of
+ *                             each record (transferred), see
+ *                             packContents() in cipher.js
+ *   {cmd: 'clear-keys'}     - clear the derived key cache
+ *
+ * The worker posts {ready: true} when it has started. While a request
+ * runs it posts {id, progress} status messages, then it replies with
+ * {id, json} for decrypt, {id, bytes} (an ArrayBuffer of the UTF-8
+ * file content, transferred) for encrypt, {id, status} if the request
+ * could not run or {id, error}.
+ * @module crypt-worker
+ */
+import { V2_PREFIX, V3_PREFIX, clearKeyCache, encryptTextV2, decryptTextV1, decryptTextV2,
+         encryptContentsV3, decryptContentsV3, joinContents,
+         unpackContents } from './cipher.js'
+
+self.onmessage = (event) => {
+    let msg = event.data
+    if (msg.cmd === 'decrypt') {
+        decryptContent(msg)
+    } else if (msg.cmd === 'encrypt') {
+        encryptContents(msg)
+    } else if (msg.cmd === 'clear-keys') {
+        clearKeyCache()
+    }
+}
+
+function progress(id, text) {
+    self.postMessage({id: id, progress: text})
+}
+
+async function decryptContent(msg) {
+    let id = msg.id
+    let text = new TextDecoder().decode(msg.content)
+    if (text.length === 0) {
+        self.postMessage({id: id, status: 'empty file'})
+        return
+    }
+    if (text[0] !== '{') {
+        if (!msg.password) {
+            // It is encrypted, we MUST have a password
+            self.postMessage({id: id, error: 'No password specified\nPlease specify the password and try again'})
+            return
+        }
+        if (!self.isSecureContext) {
+            self.postMessage({id: id, status: 'decryption not enabled'})
+            return
+        }
+        let size = text.length
+        try {
+            if (text.startsWith(V3_PREFIX)) {
+                // the records are parsed chunk by chunk
+                progress(id, `decrypting (v3) ${size}B...`)
+                let json = await decryptContentsV3(msg.password, text, msg.cacheKeys)
+                progress(id, `decrypted (v3) ${size}B -> ${json.records.length} records`)
+                self.postMessage({id: id, json: json})
+                return
+            }
+            if (text.startsWith(V2_PREFIX)) {
+                progress(id, `decrypting (v2) ${size}B...`)
+                text = await decryptTextV2(msg.password, text, msg.cacheKeys)
+                progress(id, `decrypted (v2) ${size}B -> ${text.length}B`)
+            } else {
+                progress(id, `decrypting ${size}B...`)
+                text = await decryptTextV1(msg.password, text, msg.cacheKeys)
+                progress(id, `decrypted ${size}B -> ${text.length}B ...`)
+            }
+        } catch (error) {
+            self.postMessage({id: id, error: error.message})
+            return
+        }
+    }
+    let json = null
+    try {
+        json = JSON.parse(text)
+    } catch(exc) {
+        self.postMessage({id: id, error: `invalid record format!\n${exc}`})
+        return
+    }
+    self.postMessage({id: id, json: json})
+}
+
+async function encryptContents(msg) {
+    let id = msg.id
+    let text = null
+    if (msg.password && !self.isSecureContext) {
+        self.postMessage({id: id, status: 'encryption not enabled'})
+        return
+    }
+    try {
+        let {contents, fragments} = unpackContents(msg.packed)
+        if (!msg.password) {
+            text = joinContents(contents, fragments)
+        } else if (msg.v3) {
+            let num = contents.records.length
+            progress(id, `encrypting (v3) ${num} records...`)
+            text = await encryptContentsV3(msg.password, contents, msg.cacheKeys, fragments)
+            progress(id, `encrypted (v3) ${num} records -> ${text.length}B`)
+        } else {
+            let plaintext = joinContents(contents, fragments)
+            progress(id, `encrypting (v2) ${plaintext.length}B...`)
+            text = await encryptTextV2(msg.password, plaintext, msg.cacheKeys)
+            progress(id, `encrypted (v2) ${plaintext.length}B -> ${text.length}B`)
+        }
+    } catch (error) {
+        self.postMessage({id: id, error: `${error}`})
+        return
+    }
+    let bytes = new TextEncoder().encode(text).buffer
+    self.postMessage({id: id, bytes: bytes}, [bytes])
+}
+
+self.postMessage({ready: true})
@@ -16,71 +16,239 @@
  * Key derivation: PBKDF2-SHA-256, 600,000 iterations, raw salt bytes (no TextEncoder bug).
  * The "PAMv2:" prefix enables unambiguous format detection.
  *
+ * ## v3 format (chunked)
+ * Lines of Base64: "PAMv3:" + [16-byte salt], then [12-byte IV][ciphertext] for an
+ * encrypted header (prefs + chunk hashes) and for each chunk of records.
+ * Key derivation as v2, AES-256-GCM so each line is authenticated. The chunk
+ * boundaries depend on the records, not on their positions, so when derived keys
+ * are cached a save only re-encrypts the chunks of the records that were added,
+ * changed or deleted (see encryptContentsV3() in cipher.js).
+ * Written when the saveFormatV3 pref is set.
+ *
  * ## Format detection
+ * - Starts with "PAMv3:" → v3 decrypt path
  * - Starts with "PAMv2:" → v2 decrypt path
  * - Starts with "{" → plaintext JSON (no decryption needed)
  * - Anything else → v1 decrypt path (legacy)
+ *
+ * The formats are implemented in cipher.js. Loading and saving files
+ * use decryptJSON() and encryptJSON() which run in the crypt worker.
  */
-import { statusBlip } from './status.js'
+import { statusBlip, markBusy } from './status.js'
 import { clog } from './utils.js'
+import { V2_PREFIX, V3_PREFIX, clearKeyCache as clearCipherKeyCache,
+         encryptTextV1, decryptTextV1, encryptTextV2, decryptTextV2,
+         encryptContentsV3, decryptContentsV3, joinContents,
+         packContents } from './cipher.js'
 
-// https://stackoverflow.com/questions/40031688/javascript-arraybuffer-to-hex
-function buf2hex(buffer) { // buffer is an ArrayBuffer
-  return [...new Uint8Array(buffer)]
-      .map(x => x.toString(16).padStart(2, '0'))
-      .join('');
+// Crypt worker.
+// Decrypting and parsing a loaded file and serializing and encrypting a
+// saved file run in the crypt worker (crypt-worker.js) so that large
+// files do not freeze the app. The file bytes are transferred, not
+// copied, to and from the worker.
+// Requests are queued until the worker reports that it is ready. If
+// the worker cannot be started (for example when the page was loaded
+// from a file: URL) the queued requests and all later requests run on
+// the main thread.
+let CRYPT_WORKER = {
+    worker: null,       // the crypt worker or null if it has not been started
+    ready: false,       // true if the worker has started
+    failed: false,      // true if the worker could not be used
+    id: 0,              // id of the last request
+    pending: new Map(), // request id -> request
 }
 
-// https://dev.to/halan/4-ways-of-symmetric-cryptography-and-javascript-how-to-aes-with-javascript-3o1b
-const encoder = new TextEncoder()
-const decoder = new TextDecoder()
+// is the derived key cache enabled?
+function cacheKeys() {
+    return !!window.prefs.cacheDerivedKeys
+}
 
-const numIterations = 100000     // v1 — preserved exactly, do not change
-const numIterationsV2 = 600000  // v2 — NIST SP 800-132 / OWASP 2023 recommendation
-const V2_PREFIX = 'PAMv2:'      // v2 file format prefix
+/**
+ * Forget all cached derived keys and file salts, on the main thread
+ * and in the crypt worker.
+ */
+export function clearKeyCache() {
+    clearCipherKeyCache()
+    if (CRYPT_WORKER.worker) {
+        CRYPT_WORKER.worker.postMessage({cmd: 'clear-keys'})
+    }
+}
 
-const toBase64 = buffer => {
-    // handle very large buffers
-    let raw = ''
-    let bytes = new Uint8Array(buffer)
-    let len = bytes.length
-    for (let i=0; i < len ; i++) {
-        raw += String.fromCharCode( bytes[ i ] )
-    }
-    let binstr = btoa(raw)
-    return binstr
-    // The following call is subject to limitations based on the
-    // maximum number of function arguments.
+// get the crypt worker, null if it cannot be used.
+function getCryptWorker() {
+    if (CRYPT_WORKER.failed || typeof Worker === 'undefined') {
+        return null
+    }
+    if (!CRYPT_WORKER.worker) {
+        try {
+            CRYPT_WORKER.worker = new Worker(new URL('./crypt-worker.js', import.meta.url), {type: 'module'})
+        } catch (exc) {
+            CRYPT_WORKER.failed = true
+            return null
+        }
+        CRYPT_WORKER.worker.onmessage = onCryptWorkerMessage
+        CRYPT_WORKER.worker.onerror = onCryptWorkerError
+    }
+    return CRYPT_WORKER.worker
 }
-const fromBase64 = buffer => {
+
+// handle a message from the crypt worker.
+function onCryptWorkerMessage(event) {
+    let msg = event.data
+    if (msg.ready) {
+        CRYPT_WORKER.ready = true
+        for (const request of CRYPT_WORKER.pending.values()) {
+            postCryptRequest(request)
+        }
+        return
+    }
+    let request = CRYPT_WORKER.pending.get(msg.id)
+    if (!request) {
+        return
+    }
+    if ('progress' in msg) {
+        statusBlip(msg.progress)
+        return
+    }
+    CRYPT_WORKER.pending.delete(msg.id)
     try {
-        return Uint8Array.from(atob(buffer), c => c.charCodeAt(0))
-    } catch (e) {
-        alert(`ERROR: decryption conversion failed!\n${e}`)
+        request.done(msg)
+    } finally {
+        request.idle()
+    }
+}
+
+// the crypt worker failed, stop using it.
+// Requests that were not sent to the worker run on the main thread,
+// requests that were sent report the error because their bytes now
+// belong to the worker.
+function onCryptWorkerError(event) {
+    clog(`crypt worker error: ${event.message}`)
+    CRYPT_WORKER.worker.terminate()
+    CRYPT_WORKER.worker = null
+    CRYPT_WORKER.failed = true
+    let pending = [...CRYPT_WORKER.pending.values()]
+    CRYPT_WORKER.pending.clear()
+    for (const request of pending) {
+        if (request.posted) {
+            request.done({error: `internal error:\ncrypt worker failed:\n${event.message}`})
+        } else {
+            request.fallback()
+        }
+        request.idle()
+    }
+}
+
+// post the request to the crypt worker.
+function postCryptRequest(request) {
+    if (!request.posted) {
+        request.posted = true
+        CRYPT_WORKER.worker.postMessage(request.msg, request.transfer)
     }
 }
 
-const PBKDF2 = async (password, salt, iterations, length, hash, algorithm = 'AES-CBC') => {
-        let keyMaterial = await window.crypto.subtle.importKey(
-            'raw',
-            encoder.encode(password),
-            {name: 'PBKDF2'},
-            false,
-            ['deriveKey']
-        );
-        return await window.crypto.subtle.deriveKey(
-            {
-                name: 'PBKDF2',
-                salt: encoder.encode(salt),
-                iterations,
-                hash
-            },
-            keyMaterial,
-            { name: algorithm, length },
-            false, // we don't need to export our key!!!
-            ['encrypt', 'decrypt']
-        );
+// run the request in the crypt worker or, if the worker cannot be used,
+// call request.fallback() to run it on the main thread.
+function runCryptRequest(request) {
+    let worker = getCryptWorker()
+    if (!worker) {
+        request.fallback()
+        return
     }
+    request.msg.id = ++CRYPT_WORKER.id
+    request.posted = false
+    request.idle = markBusy() // until the worker replies
+    CRYPT_WORKER.pending.set(request.msg.id, request)
+    if (CRYPT_WORKER.ready) {
+        postCryptRequest(request)
+    }
+}
+
+/**
+ * Decrypt and parse file content in the crypt worker.
+ *
+ * The content may be plain JSON or v1 or v2 ciphertext, see decrypt().
+ * The content buffer is transferred to the worker so it must not be
+ * used after the call.
+ *
+ * @param {string} password - The master password, may be empty for plain JSON.
+ * @param {ArrayBuffer} content - The UTF-8 file content.
+ * @param {function(object): void} callback - Called with the parsed JSON on success.
+ * @param {function(string): void} callback2 - Called with an error message on failure.
+ */
+export function decryptJSON(password, content, callback, callback2) {
+    runCryptRequest({
+        msg: {cmd: 'decrypt', password: password, content: content, cacheKeys: cacheKeys()},
+        transfer: [content],
+        done: (msg) => {
+            if ('error' in msg) {
+                callback2(msg.error)
+            } else if ('json' in msg) {
+                callback(msg.json)
+            } else {
+                statusBlip(msg.status)
+            }
+        },
+        fallback: () => {
+            let text = new TextDecoder().decode(content)
+            decrypt(password, text, (plaintext) => {
+                if (!plaintext || plaintext.length === 0) {
+                    return
+                }
+                let json = null
+                try {
+                    json = JSON.parse(plaintext)
+                } catch(exc) {
+                    callback2(`invalid record format!\n${exc}`)
+                    return
+                }
+                callback(json)
+            }, callback2)
+        },
+    })
+}
+
+/**
+ * Serialize and encrypt file contents in the crypt worker.
+ *
+ * The contents are serialized with joinContents() and encrypted in
+ * the v2 format, see encryptV2(), or in the v3 format if the
+ * saveFormatV3 pref is set, see encryptV3(). The contents and the
+ * fragments are encoded one at a time into a buffer that is
+ * transferred to the worker, see packContents(), and the worker
+ * transfers the bytes of the ciphertext back.
+ *
+ * @param {string} password - The master password. Empty string means no encryption.
+ * @param {object} contents - The file contents, see convertInternalDataToJSON().
+ * @param {string[]|null} fragments - The JSON of each record or null, see
+ *   convertInternalDataToFragments().
+ * @param {string} filename - Passed through to the callback unchanged.
+ * @param {function(string, string): void} callback - Called with (ciphertext, filename).
+ */
+export function encryptJSON(password, contents, fragments, filename, callback) {
+    let v3 = !!window.prefs.saveFormatV3
+    let packed = packContents(contents, fragments)
+    runCryptRequest({
+        msg: {cmd: 'encrypt', password: password, packed: packed, cacheKeys: cacheKeys(), v3: v3},
+        transfer: [packed.bytes, packed.offsets.buffer],
+        done: (msg) => {
+            if ('error' in msg) {
+                clog(msg.error)
+            } else if ('bytes' in msg) {
+                callback(new TextDecoder().decode(msg.bytes), filename)
+            } else {
+                statusBlip(msg.status)
+            }
+        },
+        fallback: () => {
+            if (v3) {
+                encryptContents(password, contents, fragments, filename, callback)
+            } else {
+                encryptV2(password, joinContents(contents, fragments), filename, callback)
+            }
+        },
+    })
+}
 
 /**
  * Encrypt plaintext JSON using AES-256-CBC.
@@ -113,25 +281,12 @@ export function encrypt(password, plaintext, filename, callback) {
         callback(plaintext, filename) // write out in plaintext
         return
     }
-    let ciphertext = plaintext
     if (window.isSecureContext) {
         statusBlip(`encrypting ${plaintext.length}B...`)
-        // https://dev.to/halan/4-ways-of-symmetric-cryptography-and-javascript-how-to-aes-with-javascript-3o1b
-        const iv = window.crypto.getRandomValues(new Uint8Array(16))
-        const salt = window.crypto.getRandomValues(new Uint8Array(16))
-        const encoded_plaintext = encoder.encode(plaintext)
-        PBKDF2(password, salt, numIterations, 256, 'SHA-256')
-            .then( (key) => {
-                window.crypto.subtle.encrypt(
-                    {name: 'AES-CBC', iv: iv }, key, encoded_plaintext)
-                    .then( (encrypted) => {
-                        ciphertext = toBase64([...salt, ...iv, ...new Uint8Array(encrypted)])
-                        statusBlip(`encrypted ${plaintext.length}B -> ${ciphertext.length}B ...`)
-                        callback(ciphertext, filename)
-                    })
-                    .catch( (error) => {
-                        clog(error)
-                    })
+        encryptTextV1(password, plaintext, cacheKeys())
+            .then( (ciphertext) => {
+                statusBlip(`encrypted ${plaintext.length}B -> ${ciphertext.length}B ...`)
+                callback(ciphertext, filename)
             })
             .catch((error) => {
                 clog(error)
@@ -170,9 +325,11 @@ export function decrypt(password, ciphertext, callback, callback2) {
         callback2('No password specified\nPlease specify the password and try again')
         return
     }
-    let plaintext = ciphertext
-
-    // Dispatch: v2 files have PAMv2: prefix; everything else uses v1 path
+    // Dispatch: v2 and v3 files have a prefix; everything else uses v1 path
+    if (ciphertext.startsWith(V3_PREFIX)) {
+        decryptV3(password, ciphertext, callback, callback2)
+        return
+    }
     if (ciphertext.startsWith(V2_PREFIX)) {
         decryptV2(password, ciphertext, callback, callback2)
         return
@@ -180,35 +337,15 @@ export function decrypt(password, ciphertext, callback, callback2) {
 
     if (window.isSecureContext) {
         statusBlip(`decrypting ${ciphertext.length}B...`)
-        const salt_len = 16
-        const iv_len = 16
-        const encrypted = fromBase64(ciphertext)
-        const salt = encrypted.slice(0, salt_len)
-        const iv = encrypted.slice(0+salt_len, salt_len+iv_len)
-        const data = encrypted.slice(salt_len + iv_len)
-        PBKDF2(password, salt, numIterations, 256, 'SHA-256')
-            .then( (key) => {
-                window.crypto.subtle.decrypt(
-                    {name: 'AES-CBC', iv: iv }, key, data)
-                    .then( (decrypted) => {
-                        const base64 = decoder.decode(decrypted)
-                        if (base64[0] === '{' ) {
-                            plaintext = base64
-                        } else {
-                            plaintext = fromBase64(base64)
-                        }
-                        statusBlip(`decrypted ${ciphertext.length}B -> ${plaintext.length}B ...`)
-                        callback(plaintext)
-                    })
-                    .catch( (error) => {
-                        callback2(`Decryption failed!\nPlease try another password.\n${error}`)
-                        clog(error)
-                    })
+        decryptTextV1(password, ciphertext, cacheKeys())
+            .then( (plaintext) => {
+                statusBlip(`decrypted ${ciphertext.length}B -> ${plaintext.length}B ...`)
+                callback(plaintext)
             })
             .catch((error) => {
-                callback2(`Decryption setup failed!\nPlease try another password.\n${error}`)
+                callback2(error.message)
+                clog(error)
             })
-        statusBlip(`decrypted ${ciphertext.length}B -> ${plaintext.length}B ...`)
     } else {
         statusBlip('decryption not enabled')
     }
@@ -239,28 +376,9 @@ export function encryptV2(password, plaintext, filename, callback) {
     }
     if (window.isSecureContext) {
         statusBlip(`encrypting (v2) ${plaintext.length}B...`)
-        const iv = window.crypto.getRandomValues(new Uint8Array(16))
-        const salt = window.crypto.getRandomValues(new Uint8Array(16))
-        const encoded_plaintext = encoder.encode(plaintext)
-        // v2: pass raw salt bytes directly — no TextEncoder bug
-        window.crypto.subtle.importKey(
-            'raw', encoder.encode(password), {name: 'PBKDF2'}, false, ['deriveKey']
-        ).then((keyMaterial) => {
-            window.crypto.subtle.deriveKey(
-                { name: 'PBKDF2', salt: salt, iterations: numIterationsV2, hash: 'SHA-256' },
-                keyMaterial,
-                { name: 'AES-CBC', length: 256 },
-                false,
-                ['encrypt', 'decrypt']
-            ).then((key) => {
-                window.crypto.subtle.encrypt(
-                    {name: 'AES-CBC', iv: iv}, key, encoded_plaintext
-                ).then((encrypted) => {
-                    const ciphertext = V2_PREFIX + toBase64([...salt, ...iv, ...new Uint8Array(encrypted)])
-                    statusBlip(`encrypted (v2) ${plaintext.length}B -> ${ciphertext.length}B`)
-                    callback(ciphertext, filename)
-                }).catch((error) => { clog(error) })
-            }).catch((error) => { clog(error) })
+        encryptTextV2(password, plaintext, cacheKeys()).then((ciphertext) => {
+            statusBlip(`encrypted (v2) ${plaintext.length}B -> ${ciphertext.length}B`)
+            callback(ciphertext, filename)
         }).catch((error) => { clog(error) })
     } else {
         statusBlip('encryption not enabled')
@@ -287,36 +405,85 @@ export function decryptV2(password, ciphertext, callback, callback2) {
     }
     if (window.isSecureContext) {
         statusBlip(`decrypting (v2) ${ciphertext.length}B...`)
-        const b64 = ciphertext.slice(V2_PREFIX.length)
-        const encrypted = fromBase64(b64)
-        const salt = encrypted.slice(0, 16)
-        const iv = encrypted.slice(16, 32)
-        const data = encrypted.slice(32)
-        // v2: use raw salt bytes directly
-        window.crypto.subtle.importKey(
-            'raw', encoder.encode(password), {name: 'PBKDF2'}, false, ['deriveKey']
-        ).then((keyMaterial) => {
-            window.crypto.subtle.deriveKey(
-                { name: 'PBKDF2', salt: salt, iterations: numIterationsV2, hash: 'SHA-256' },
-                keyMaterial,
-                { name: 'AES-CBC', length: 256 },
-                false,
-                ['encrypt', 'decrypt']
-            ).then((key) => {
-                window.crypto.subtle.decrypt(
-                    {name: 'AES-CBC', iv: iv}, key, data
-                ).then((decrypted) => {
-                    const plaintext = decoder.decode(decrypted)
-                    statusBlip(`decrypted (v2) ${ciphertext.length}B -> ${plaintext.length}B`)
-                    callback(plaintext)
-                }).catch((error) => {
-                    callback2(`Decryption failed!\nPlease try another password.\n${error}`)
-                })
-            }).catch((error) => {
-                callback2(`Decryption setup failed!\nPlease try another password.\n${error}`)
-            })
+        decryptTextV2(password, ciphertext, cacheKeys()).then((plaintext) => {
+            statusBlip(`decrypted (v2) ${ciphertext.length}B -> ${plaintext.length}B`)
+            callback(plaintext)
+        }).catch((error) => {
+            callback2(error.message)
+        })
+    } else {
+        statusBlip('decryption not enabled')
+    }
+}
+
+/**
+ * Encrypt plaintext JSON using the v3 format (AES-256-GCM chunks of records,
+ * 600k PBKDF2 iterations, PAMv3: prefix).
+ *
+ * @param {string} password - The master password.
+ * @param {string} plaintext - The UTF-8 JSON string of the file contents
+ *   ({meta, prefs, records}) to encrypt.
+ * @param {string} filename - Passed through to the callback unchanged.
+ * @param {function(string, string): void} callback - Called with (ciphertext, filename).
+ */
+export function encryptV3(password, plaintext, filename, callback) {
+    if (!plaintext || plaintext.length === 0 || !password || password.length === 0) {
+        callback(plaintext, filename)
+        return
+    }
+    let contents = null
+    try {
+        contents = JSON.parse(plaintext)
+    } catch (error) {
+        clog(error)
+        return
+    }
+    encryptContents(password, contents, null, filename, callback)
+}
+
+// encrypt the file contents in the v3 format.
+function encryptContents(password, contents, fragments, filename, callback) {
+    if (!password || password.length === 0) {
+        callback(joinContents(contents, fragments), filename)
+        return
+    }
+    if (window.isSecureContext) {
+        statusBlip(`encrypting (v3) ${contents.records.length} records...`)
+        encryptContentsV3(password, contents, cacheKeys(), fragments).then((ciphertext) => {
+            statusBlip(`encrypted (v3) ${contents.records.length} records -> ${ciphertext.length}B`)
+            callback(ciphertext, filename)
+        }).catch((error) => { clog(error) })
+    } else {
+        statusBlip('encryption not enabled')
+    }
+}
+
+/**
+ * Decrypt v3 format ciphertext (requires PAMv3: prefix).
+ * Rejects anything without the PAMv3: prefix — use decrypt() for unified dispatch.
+ *
+ * @param {string} password - The master password.
+ * @param {string} ciphertext - Must start with "PAMv3:".
+ * @param {function(string): void} callback - Called with the JSON plaintext on success.
+ * @param {function(string): void} callback2 - Called with error message on failure.
+ */
+export function decryptV3(password, ciphertext, callback, callback2) {
+    if (!ciphertext || !ciphertext.startsWith(V3_PREFIX)) {
+        callback2('Not a v3 file: missing PAMv3: prefix')
+        return
+    }
+    if (!password || password.length === 0) {
+        callback2('No password specified\nPlease specify the password and try again')
+        return
+    }
+    if (window.isSecureContext) {
+        statusBlip(`decrypting (v3) ${ciphertext.length}B...`)
+        decryptContentsV3(password, ciphertext, cacheKeys()).then((contents) => {
+            const plaintext = JSON.stringify(contents, null, 0)
+            statusBlip(`decrypted (v3) ${ciphertext.length}B -> ${plaintext.length}B`)
+            callback(plaintext)
         }).catch((error) => {
-            callback2(`Key import failed!\n${error}`)
+            callback2(error.message)
         })
     } else {
         statusBlip('decryption not enabled')
@@ -1,7 +1,7 @@
 // record fields
 import { xmk } from './lib.js'
 import { icon, isURL, mkDraggableRow, sortDictByKey, copyTextToClipboard } from './utils.js'
-import { findRecord } from './record.js'
+import { findRecordData } from './record.js'
 import { mkGeneratePasswordDlg } from './password.js'
 
 // Make record field with the name, type and value.
@@ -436,35 +436,11 @@ export function mkRecordEditDlg(title) {
 // Copy the fields from the source record to the edit dlg.
 // title is the identifies the source record.
 export function copyRecordFieldsToEditDlg(title, body, clone) {
-    let srcRecord = findRecord(title)
-    let rows = srcRecord.xGetN('.row')
-    for (let i=0; i<rows.length; i++) {
-        let row = rows[i]
-        let nameDiv = row.xGet('.x-fld-name')
-        if (!nameDiv) {
-            continue // button row
-        }
-        let name = nameDiv.innerHTML
-        let valueDiv = row.xGet('.x-fld-value')
-        let value = valueDiv.innerHTML
-        let type = valueDiv.getAttribute('data-fld-type')
-        switch (type) {
-        case 'html':
-        case 'password':
-        case 'textarea':
-        case 'url':
-            // If the data-fld-raw-value is set use it, if not
-            // then use the value because we can be sure that it
-            // is not "hidden".
-            if (valueDiv.hasAttribute('data-fld-raw-value')) {
-                value = valueDiv.getAttribute('data-fld-raw-value')
-            } else {
-                value = valueDiv.getAttribute('value')
-            }
-            break
-        default:
-            break
-        }
+    let srcRecord = findRecordData(title)
+    for (let i=0; i<srcRecord.fields.length; i++) {
+        let name = srcRecord.fields[i].name
+        let type = srcRecord.fields[i].type
+        let value = srcRecord.fields[i].value
         if (clone && !window.prefs.cloneFieldValues) {
             value = ''
         }
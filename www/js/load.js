@@ -1,12 +1,14 @@
 // Load file.
 import { xmk, xget, xgetn, enableFunctionChaining } from './lib.js'
-import { statusBlip } from './status.js'
+import { status, statusBlip, markBusy } from './status.js'
 import { icon, clog, mkPopupModalDlg, mkPopupModalDlgButton, setDarkLightTheme } from './utils.js'
-import { clearRecords, deleteRecord, findRecord, insertRecord, mkRecord } from './record.js'
-import { mkRecordField } from './field.js'
+import { clearRecords, deleteRecord, insertRecords } from './record.js'
+import { normalizeTitle, getRecordEntries, lookupRecord } from './store.js'
 import { menuPrefsDlg, resetPrefs, addDefaultRecordFields } from './prefs.js'
-import { decrypt } from './crypt.js'
-import { mkLoadSavePassword, setFilePass } from './password.js'
+import { decrypt, decryptJSON } from './crypt.js'
+import { mkRecordStreamParser } from './record-stream.js'
+import { mkLoadSavePassword, getFilePass, setFilePass } from './password.js'
+import { getCachedVault, putCachedVault, clearCachedVault } from './vault-cache.js'
 import { enablePrinting } from './print.js'
 import { enableSaveFile } from './save.js'
 import { enableRawJSONEdit } from './raw.js'
@@ -14,19 +16,27 @@ import { setAboutFileInfo } from './about.js'
 import { searchRecords } from './search.js'
 import { updateHtmlRenderingIndicator, updateFilePassCacheIndicator } from './main.js'
 
+const STREAM_MIN_BATCH = 100 // records rendered by the first batch of a streamed load
+
 // load a file
 export function menuLoadDlg() {
     let body = xmk('span')
         .xAppendChild(
             xmk('p')
-                .xInnerHTML('Normally you simply click the "Load" button to load from a file but there are four special cases that allow you to load from other sources:'),
+                .xInnerHTML('Normally you simply click the "Load" button to load from a file but there are five special cases that allow you to load from other sources:'),
             xmk('ol').xAppend(
                 xmk('li').xAppend(
                     xmk('button')
                         .xClass('btn', 'btn-sm', 'btn-secondary', 'p-1', 'ms-2')
                         .xAttrs({'type': 'button'})
                         .xStyle({'margin-bottom': '3px'})
-                        .xAddEventListener('click', (event) => {setTimeout(() => loadExampleRecords(event), 500)})
+                        .xAddEventListener('click', (event) => {
+                            let idle = markBusy()
+                            setTimeout(() => {
+                                loadExampleRecords(event)
+                                idle()
+                            }, 500)
+                        })
                         .xInnerHTML('Load Example Records'),
                 ),
                 xmk('li').xAppend(
@@ -53,6 +63,14 @@ export function menuLoadDlg() {
                         .xAddEventListener('click', (event) => loadClipboardContent(event))
                         .xInnerHTML('Paste Records from Clipboard'),
                 ),
+                xmk('li').xAppend(
+                    xmk('button')
+                        .xClass('btn', 'btn-sm', 'btn-secondary', 'p-1', 'ms-2')
+                        .xStyle({'margin-bottom': '3px'})
+                        .xAttrs({'type': 'button'})
+                        .xAddEventListener('click', (event) => loadCachedRecords(event))
+                        .xInnerHTML('Load Cached Records'),
+                ),
             ),
             xmk('p')
                 .xInnerHTML('Enter a password if the PAM records file was encrypted.'),
@@ -98,19 +116,30 @@ export function menuLoadDlg() {
                 const fileList = event1.target.files
                 if (fileList.length === 1) {
                     var file = fileList[0]
-                    const reader = new FileReader()
-                    reader.addEventListener('load', (event2) => {
-                        const text = event2.target.result
-                        let type = file.type ? file.type : '???'
-                        statusBlip(`loaded ${text.length} bytes from: "${file.name}" "<code>${type}</code>".`)
+                    let idle = markBusy() // until the file has been read
+                    isPlainFile(file).then((plain) => {
+                        if (plain) {
+                            let password = document.body.xGet('#x-load-password').value.trim()
+                            setFileFields(file.name, password)
+                            streamFileContent(file).finally(idle)
+                            return
+                        }
+                        const reader = new FileReader()
+                        reader.addEventListener('load', (event2) => {
+                            const content = event2.target.result
+                            let type = file.type ? file.type : '???'
+                            statusBlip(`loaded ${content.byteLength} bytes from: "${file.name}" "<code>${type}</code>".`)
+                        })
+                        reader.readAsArrayBuffer(file) // the bytes are transferred to the crypt worker
+                        reader.onload = (event3) => {
+                            let content = event3.target.result
+                            const filename = file.name
+                            let password = document.body.xGet('#x-load-password').value.trim()
+                            loadFileContent(filename, password, content)
+                            idle()
+                        }
+                        reader.onerror = idle
                     })
-                    reader.readAsText(file)
-                    reader.onload = (event3) => {
-                        let content = event3.target.result
-                        const filename = file.name
-                        let password = document.body.xGet('#x-load-password').value.trim()
-                        loadFileContent(filename, password, content)
-                    }
                 }
             }),
     )
@@ -164,27 +193,22 @@ function loadClipboardContent() {
 
 function loadUrlContent(url) {
     clog(`loadingUrlContent: ${url}`)
+    let idle = markBusy()
     fetch(url, {cache: 'reload'})
         .then((response) => {
-            return response.text()
+            return response.arrayBuffer()
         })
         .then((content) => {
-            let size = content.length
-            if (content[0] === '{') {
-                // This file is plain json, it is not encrypted
-                statusBlip(`not encrypted ${url} (${size}B)`)
-                loadCallback(content)
-            }  else {
-                statusBlip(`encrypted ${url} (${size}B)`)
-                let password = document.body.xGet('#x-load-password').value.trim()
-                decrypt(password, content, loadCallback, invalidPasswordCallback)
-            }
+            let password = document.body.xGet('#x-load-password').value.trim()
+            statusBlip(`loaded ${url} (${content.byteLength}B)`)
+            decryptJSON(password, content, loadJSON, invalidPasswordCallback)
             closeDlg()
         })
         .catch((error) => {
             alert(`failed to load ${url}: ${error.message}`)
             clog(`ERROR: ${error.message}`)
         })
+        .finally(idle)
 }
 
 // Validate that a URL uses an acceptable protocol for loading.
@@ -239,20 +263,199 @@ function loadExampleRecipe(event) {
     loadUrlContent(url)
 }
 
-// Load the file content
+// Load the file content.
+// The content is an ArrayBuffer, it is decrypted and parsed in the
+// crypt worker.
 function loadFileContent(filename, password, content) {
+    setFileFields(filename, password)
+    // keep a copy for the vault cache, the content is transferred to the crypt worker
+    let copy = null
+    if (window.prefs.cacheVault) {
+        let bytes = new Uint8Array(content, 0, Math.min(1, content.byteLength))
+        copy = (bytes.length > 0 && bytes[0] !== 0x7b) ? content.slice(0) : null // not '{'
+    }
+    decryptJSON(password, content, (json) => {
+        loadJSON(json)
+        cacheLoadedVault(filename, copy, json)
+    }, invalidPasswordCallback)
+}
+
+// Update the vault cache after a file was loaded, see vault-cache.js.
+// content is the encrypted file content or null if it was not encrypted
+// or the cacheVault pref was not set when the load started.
+function cacheLoadedVault(filename, content, json) {
+    if (!window.prefs.cacheVault || content === null) {
+        clearCachedVault()
+        return
+    }
+    putCachedVault(filename, content, json.meta['date-saved'], json.records.length)
+}
+
+/**
+ * Restore the vault cached by a previous session, see vault-cache.js.
+ * Called at startup. The records are loaded if the file password is
+ * cached, otherwise they can be loaded from the load dialogue.
+ */
+export function restoreCachedVault() {
+    let idle = markBusy()
+    getCachedVault().then((entry) => {
+        if (entry === null) {
+            return
+        }
+        let password = getFilePass()
+        if (!password) {
+            statusBlip(`"${entry.filename}" is cached, use "Load Cached Records" in the load dialogue to restore it`)
+            return
+        }
+        loadCachedVault(entry, password)
+    }).finally(idle)
+}
+
+function loadCachedRecords() {
+    getCachedVault().then((entry) => {
+        if (entry === null) {
+            const msg = 'no cached records'
+            statusBlip(msg)
+            alert(msg)
+            return
+        }
+        let password = document.body.xGet('#x-load-password').value.trim()
+        loadCachedVault(entry, password)
+        closeDlg()
+    })
+}
+
+// Load the cached vault.
+// The password is only stored as the file password once it has
+// decrypted the vault.
+function loadCachedVault(entry, password) {
+    setFileFields(entry.filename, password)
+    statusBlip(`restoring ${entry.records} records from the cached "${entry.filename}" (${entry.content.byteLength}B)`)
+    decryptJSON(password, entry.content, (json) => {
+        setFilePass(password)
+        loadJSON(json)
+        if (!window.prefs.cacheVault) {
+            clearCachedVault() // disabled since it was cached
+        }
+    }, invalidPasswordCallback)
+}
+
+// Use the file name and password for the next save.
+function setFileFields(filename, password) {
     window.prefs.fileName = filename
     document.body.xGet('#x-save-filename').value = filename
     document.body.xGet('#x-save-password').value = password
-    let size = content.length
-    if (content[0] === '{') {
-        // This file is plain json, it is not encrypted
-        statusBlip(`not encrypted ${filename} (${size}B)`)
-        loadCallback(content)
+}
+
+// Is the file plain JSON that can be streamed?
+// Encrypted files start with the ciphertext prefix or base64.
+function isPlainFile(file) {
+    if (typeof file.stream !== 'function') {
+        return Promise.resolve(false)
+    }
+    return file.slice(0, 1).text()
+        .then((head) => head === '{')
+        .catch(() => false)
+}
+
+// Load a plain JSON file as it is read.
+// The records are parsed as they arrive (see record-stream.js) and
+// rendered in batches so that the first records are displayed long
+// before a large file has been read. The batches grow with the number
+// of records loaded to keep the cost of merging them into the display
+// down. The records can only be loaded before the whole file has been
+// read if the prefs come before them, which is the order in which PAM
+// saves them.
+// The load is all or nothing, like loadCallback(): if the file turns
+// out to be invalid or cannot be read the records and the prefs that
+// were there before the load are restored.
+async function streamFileContent(file) {
+    let json = {}   // the top level values other than the records
+    let rows = []   // the records that have not been loaded
+    let load = null // the load state once the records can be loaded
+    let num = 0     // the number of records loaded
+    let saved = saveLoadState()
+    let parser = mkRecordStreamParser({
+        value: (key, value) => { json[key] = value },
+        records: () => {
+            if ('prefs' in json) {
+                load = beginLoad(json)
+            }
+        },
+        record: (row) => { rows.push(row) },
+    })
+    let flush = () => {
+        loadRows(load, rows)
+        num += rows.length
+        rows = []
+    }
+    let reader = file.stream().getReader()
+    let decoder = new TextDecoder()
+    let bytes = 0
+    try {
+        for (;;) {
+            let {done, value} = await reader.read()
+            if (done) {
+                break
+            }
+            bytes += value.byteLength
+            parser.push(decoder.decode(value, {stream: true}))
+            if (load && rows.length >= Math.max(STREAM_MIN_BATCH, num / 4)) {
+                flush()
+                status(`loading ${file.name}: ${Math.floor(100 * bytes / file.size)}% (${num} records)`)
+                await new Promise((resolve) => setTimeout(resolve, 0)) // let the browser render them
+            }
+        }
+        parser.push(decoder.decode())
+        parser.end()
+        if (!load) {
+            load = beginLoad(json)
+        }
+        flush()
+    } catch (exc) {
+        reader.cancel().catch(() => {})
+        if (load) {
+            restoreLoadState(saved)
+        }
+        let msg = (exc instanceof SyntaxError) ? `invalid record format!\n${exc}` : `failed to load ${file.name}: ${exc}`
+        statusBlip(msg)
+        alert(msg)
+        return
+    }
+    finishLoad(load, json)
+    cacheLoadedVault(file.name, null, json) // plain JSON is never cached
+    let type = file.type ? file.type : '???'
+    statusBlip(`loaded ${bytes} bytes (${num} records) from: "${file.name}" "<code>${type}</code>".`)
+}
+
+// Save the state that a streamed load changes before the whole file
+// has been parsed: the records, the prefs and the about information.
+// The records are not copied, a load does not modify them.
+function saveLoadState() {
+    let about = document.getElementById('x-about-file-info')
+    return {
+        records: getRecordEntries().map((entry) => entry.record),
+        prefs: {...window.prefs},
+        cacheStrategy: localStorage.getItem('pamCacheStrategy'),
+        about: about ? about.innerHTML : '',
+    }
+}
+
+// Restore the state saved by saveLoadState() after a failed load.
+function restoreLoadState(saved) {
+    clearRecords()
+    resetPrefs()
+    Object.assign(window.prefs, saved.prefs)
+    document.body.xGet('#menuPrefsDlg').replaceWith(menuPrefsDlg())
+    addDefaultRecordFields()
+    if (saved.cacheStrategy === null) {
+        localStorage.removeItem('pamCacheStrategy')
     } else {
-        statusBlip(`encrypted ${filename} (${size}B)`)
-        decrypt(password, content, loadCallback, invalidPasswordCallback)
+        localStorage.setItem('pamCacheStrategy', saved.cacheStrategy)
     }
+    insertRecords(saved.records)
+    updateLoadedView()
+    setAboutFileInfo(saved.about)
 }
 
 // Load the data.
@@ -268,6 +471,21 @@ export function loadCallback(text) {
         alert(`invalid record format!\n${exc}`)
         return
     }
+    loadJSON(json)
+}
+
+// Load the parsed data.
+function loadJSON(json) {
+    let load = beginLoad(json)
+    loadRows(load, json.records)
+    finishLoad(load, json)
+}
+
+// Start loading the records.
+// json has the prefs of the file, if any, the records are loaded by
+// loadRows() in one or more batches and finishLoad() ends the load.
+// Returns the load state.
+function beginLoad(json) {
     if (window.prefs.clearBeforeLoad) {
         clearRecords()
         resetPrefs()
@@ -304,13 +522,27 @@ export function loadCallback(text) {
         }
     }
 
-    let warned = 0
-    let numActive = 0
-    let numInactive = 0
-    for (let i=0; i<json.records.length; i++) {
-        let row = json.records[i]
+    return {
+        warned: 0,
+        numActive: 0,
+        numInactive: 0,
+        loaded: new Map(), // normalized title -> active of the records loaded so far
+    }
+}
+
+// Load a batch of records.
+// Duplicates are resolved against the existing records and the titles
+// loaded so far, then all of the new records are handed to
+// insertRecords() which renders them, sorts them once and attaches
+// them to the display in as few DOM operations as possible.
+function loadRows(load, rows) {
+    let newRecords = []
+    let batch = new Map() // normalized title -> index in newRecords
+    let isDup = (title) => batch.has(normalizeTitle(title)) || !!lookupRecord(title)
+    for (let i=0; i<rows.length; i++) {
+        let row = rows[i]
         let title = row.title
-        if (findRecord(title)) {
+        if (isDup(title)) {
             switch (window.prefs.loadDupStrategy) {
             case 'ignore':
                 // ignore the duplicate.
@@ -318,14 +550,26 @@ export function loadCallback(text) {
                 break
             case 'replace':
                 // replace the duplicate record with one just loaded.
-                deleteRecord(title)
+                let key = normalizeTitle(title)
+                if (load.loaded.has(key)) {
+                    if (load.loaded.get(key)) {
+                        load.numActive -= 1
+                    } else {
+                        load.numInactive -= 1
+                    }
+                }
+                if (batch.has(key)) {
+                    newRecords[batch.get(key)] = null
+                } else {
+                    deleteRecord(title) // loaded by an earlier batch or before the load
+                }
                 break
             case 'allow':
                 // allow duplicates to co-exist
                 // generate a unique suffix for to the title.
                 let provisional = title + ' Clone'
                 let idx = 0
-                while (findRecord(provisional)) {
+                while (isDup(provisional)) {
                     idx++
                     provisional = `${title} Clone${idx}`
                 }
@@ -333,13 +577,13 @@ export function loadCallback(text) {
                 break
             default:
                 // clearBeforeLoad makes this unnecesary but it is optional.
-                if (!warned) {
+                if (!load.warned) {
                     // only warn once
                     alert('WARNING: internal state error ' +
                           `invalid loadDupStrategy "${window.prefs.loadDupStrategy}"\n` +
                           'Duplicates will be ignored')
                 }
-                warned++
+                load.warned++
                 continue
             }
         }
@@ -347,25 +591,13 @@ export function loadCallback(text) {
         // Create the record.
         // It is a very simple record that is basically an array of
         // fields with a few properties.
-        let recordFields = []
-
-        // Add data fields to the record.
-        // Each field is converted to DOM objects so there is only
-        // a single source of truth for the data.
-        for (let j=0; j<row.fields.length; j++ ) {
-            let field = row.fields[j]
-            recordFields.push( mkRecordField(field.name, field.type, field.value) )
-        }
-
-        // Create the record in the DOM.
-        // All of the necessary information is embedded in the DOM.
         if ( !row.hasOwnProperty('active') ) {
             row.active = true
         }
         if (row.active) {
-            numActive += 1
+            load.numActive += 1
         } else {
-            numInactive += 1
+            load.numInactive += 1
         }
 
         if ( !row.hasOwnProperty('created') ) {
@@ -373,23 +605,42 @@ export function loadCallback(text) {
             row.created = new Date('1999-01-01T00:00:00Z').toISOString()
         }
 
-        let newRecord = mkRecord(title, row.active, row.created, ...recordFields)
-        insertRecord(newRecord, title);
+        let record = {
+            'title': title,
+            'active': row.active,
+            'created': row.created,
+            'fields': row.fields.map((f) => { return {'name': f.name, 'type': f.type, 'value': f.value} }),
+        }
+        load.loaded.set(normalizeTitle(title), record.active)
+        batch.set(normalizeTitle(title), newRecords.length)
+        newRecords.push(record)
     }
-    enablePrinting()
-    enableSaveFile()
-    enableRawJSONEdit()
+    insertRecords(newRecords.filter((r) => r !== null))
+}
+
+// Finish loading the records.
+// json has the meta data of the file.
+function finishLoad(load, json) {
     let now = new Date()
     let thenDateString = json.meta['date-saved']
     let thenDate = new Date(thenDateString)
     let elapsed = now.getTime() - thenDate.getTime() // ms
     let fet = formatTimeElapsed(elapsed)
     window.prefs.lastUpdated = now.toISOString()  // for use in reporting
+    updateLoadedView()
+    setAboutFileInfo(`Loaded ${load.numActive} active and ${load.numInactive} inactive records on ${now.toISOString()}.<br>` +
+                     `Records were last updated on ${thenDate.toISOString()} (${fet}).`)
+}
+
+// Update the menus, the theme and the toolbar for the loaded records
+// and prefs and show all of the records.
+function updateLoadedView() {
+    enablePrinting()
+    enableSaveFile()
+    enableRawJSONEdit()
     setDarkLightTheme(window.prefs.themeName)
     updateHtmlRenderingIndicator()   // SEC-001: reflect loaded prefs in toolbar
     updateFilePassCacheIndicator()   // SEC-002: reflect loaded prefs in toolbar
-    setAboutFileInfo(`Loaded ${numActive} active and ${numInactive} inactive records on ${now.toISOString()}.<br>` +
-                     `Records were last updated on ${thenDate.toISOString()} (${fet}).`)
     searchRecords('.')
 }
 
@@ -3,9 +3,8 @@
  * @module main
  */
 import { xmk, xget, xgetn, enableFunctionChaining } from './lib.js'
-import { statusBlip } from './status.js'
-import { words } from './en_words.js'
-import { icon, setDarkLightTheme } from './utils.js'
+import { statusBlip, markBusy } from './status.js'
+import { icon, clog, setDarkLightTheme } from './utils.js'
 import { initPrefs, addDefaultRecordFields } from './prefs.js'
 import { mkMenu } from './menu.js'
 import { mkSearchInputElement, searchRecords } from './search.js'
@@ -15,6 +14,7 @@ import { toggleRawJSONDataEdit } from './raw.js'
 import { enablePrinting } from './print.js'
 import { enableSaveFile } from './save.js'
 import { enableRawJSONEdit } from './raw.js'
+import { restoreCachedVault } from './load.js'
 
 /**
  * Actions to take when the window is loaded.
@@ -43,6 +43,7 @@ export function updateFilePassCacheIndicator() {
 }
 
 export function main() {
+    let idle = markBusy() // PAM is idle when it has started, see markBusy()
     // Enable the extra "x" prototype functions for elements.
     enableFunctionChaining()
     initPrefs()  // sets window.prefs
@@ -59,6 +60,34 @@ export function main() {
     updateFilePassCacheIndicator()   // SEC-002: show badge if local at startup
     const secure = window.isSecureContext? '(secure)' : ''
     statusBlip(`initializing PAM... ${secure} ${window.screen.width}x${window.screen.height}`)
+    restoreCachedVault() // only if the cacheVault pref was set when it was cached
+    registerServiceWorker()
+    idle()
+}
+
+// Register the service worker that caches the application shell, see sw.js.
+// It is not registered when PAM is served from localhost (development
+// and the tests) so that source changes are always loaded.
+function registerServiceWorker() {
+    if (!('serviceWorker' in navigator) || !window.isSecureContext) {
+        return
+    }
+    let host = window.location.hostname
+    if (host === 'localhost' || host === '127.0.0.1') {
+        return
+    }
+    // updateViaCache: check sw.js and js/version.js for a new version on the server
+    navigator.serviceWorker.register('./sw.js', {type: 'module', updateViaCache: 'none'})
+        .then((registration) => {
+            registration.addEventListener('updatefound', () => {
+                if (navigator.serviceWorker.controller) {
+                    statusBlip('downloading a new version of PAM, it will be used the next time PAM starts')
+                }
+            })
+        })
+        .catch((error) => {
+            clog(`service worker registration failed: ${error}`)
+        })
 }
 
 function adjust() {
@@ -15,6 +15,7 @@ import { menuLoadDlg } from './load.js'
 import { printRecords, enablePrinting } from './print.js'
 import { mkMainPasswordGeneratorDlg } from './password.js'
 import { enableRawJSONEdit } from './raw.js'
+import { clearCachedVault } from './vault-cache.js'
 
 function menuEntryDivider() {
     return xmk('li').xAppend(xmk('hr').xClass('dropdown-divider'))
@@ -86,6 +87,7 @@ function menuClearDlg() {
                                      clog(el)
                                      clearRecords()
                                      resetPrefs()
+                                     clearCachedVault()
                                      statusBlip('all records cleared')
                                      return true
                                 })
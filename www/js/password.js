@@ -1,7 +1,7 @@
 // Password generation utilities.
 import { xmk } from './lib.js'
-import { statusBlip } from './status.js'
-import { words } from './en_words.js'
+import { statusBlip, markBusy } from './status.js'
+import { clearKeyCache } from './crypt.js'
 import { icon, clog, setDarkLightTheme, copyTextToClipboard, mkPopupModalDlg, mkPopupModalDlgButton } from './utils.js'
 
 export const ALPHA_LOWER = "abcdefghijklmnopqrstuvwxyz"
@@ -27,64 +27,238 @@ export function getCrypticPassword(length, alphabet) {
     return result;
 }
 
+// The word list for memorable passwords, see loadWords().
+// It is kept as the newline separated string from en_words.js with the
+// position of each word in it rather than as an array of ~10,000 strings,
+// and it is indexed by word length so that words of the lengths that are
+// needed can be picked directly.
+let WORDS = {
+    text: '',            // the words, one per line
+    starts: null,        // Uint32Array of the position of each word in text
+    byLength: null,      // Uint32Array of the word numbers sorted by length
+    lengthStarts: null,  // Uint32Array, words of length L are byLength[lengthStarts[L]..lengthStarts[L+1]-1]
+    loading: null,       // the promise returned by loadWords()
+}
+
+// the tables of the last memorable password, see getMemorablePlan().
+let MEMORABLE_PLAN = null
+
+/**
+ * Load the word list for memorable passwords.
+ * en_words.js is imported on first use, most sessions never generate
+ * a memorable password. Call this before getRandomWord() or
+ * getMemorablePassword().
+ * @returns {Promise<number>} The number of words.
+ */
+export function loadWords() {
+    if (WORDS.loading === null) {
+        let idle = markBusy()
+        WORDS.loading = import('./en_words.js').then((module) => {
+            indexWords(module.WORDS)
+            return WORDS.starts.length
+        })
+        WORDS.loading.catch(() => { WORDS.loading = null }).finally(idle) // try again next time
+    }
+    return WORDS.loading
+}
+
+// index the words by position and by length.
+// The length index is a counting sort: the prefix sums of the number
+// of words of each length give the position of each length.
+function indexWords(text) {
+    let starts = [0]
+    for (let i = text.indexOf('\n'); i >= 0; i = text.indexOf('\n', i + 1)) {
+        starts.push(i + 1)
+    }
+    let num = starts.length
+    let lengths = new Uint8Array(num)
+    let maxLength = 0
+    for (let i = 0; i < num; i++) {
+        let end = i + 1 < num ? starts[i + 1] - 1 : text.length
+        lengths[i] = Math.min(end - starts[i], 255)
+        maxLength = Math.max(maxLength, lengths[i])
+    }
+    let lengthStarts = new Uint32Array(maxLength + 2)
+    lengths.forEach((len) => { lengthStarts[len + 1]++ })
+    for (let len = 1; len < lengthStarts.length; len++) {
+        lengthStarts[len] += lengthStarts[len - 1]
+    }
+    let byLength = new Uint32Array(num)
+    let next = lengthStarts.slice(0, maxLength + 1)
+    lengths.forEach((len, i) => { byLength[next[len]++] = i })
+    WORDS.text = text
+    WORDS.starts = Uint32Array.from(starts)
+    WORDS.byLength = byLength
+    WORDS.lengthStarts = lengthStarts
+}
+
+// get word i of the word list.
+function getWord(i) {
+    let starts = WORDS.starts
+    let end = i + 1 < starts.length ? starts[i + 1] - 1 : WORDS.text.length
+    return WORDS.text.slice(starts[i], end)
+}
+
+// get the position in WORDS.byLength of the first word of the length
+// or of the first longer word.
+function lengthStart(len) {
+    let lengthStarts = WORDS.lengthStarts
+    return lengthStarts[Math.max(0, Math.min(len, lengthStarts.length - 1))]
+}
+
+// random values from crypto.getRandomValues(), which is called for many
+// at a time because each call is relatively expensive.
+let RANDOM = {
+    values: new Uint32Array(256),
+    next: 256, // the next value to use
+}
+
+// get a random 32 bit unsigned integer.
+function randomUint32() {
+    if (RANDOM.next >= RANDOM.values.length) {
+        crypto.getRandomValues(RANDOM.values)
+        RANDOM.next = 0
+    }
+    return RANDOM.values[RANDOM.next++]
+}
+
+// get a random integer in [0, n), n <= 2**32.
+// The values above the largest multiple of n are rejected so that
+// every integer is equally likely (no modulo bias).
+function randomInt(n) {
+    let limit = 0x100000000 - (0x100000000 % n)
+    let value = randomUint32()
+    while (value >= limit) {
+        value = randomUint32()
+    }
+    return value % n
+}
+
+// pick an index with a probability proportional to its weight.
+// The weights are not integers in general so 53 random bits are used.
+function randomChoice(weights, total) {
+    let x = ((randomUint32() >>> 5) * 67108864 + (randomUint32() >>> 6)) / 9007199254740992 * total
+    let last = -1
+    for (let i = 0; i < weights.length; i++) {
+        if (weights[i] > 0) {
+            last = i
+            x -= weights[i]
+            if (x < 0) {
+                break
+            }
+        }
+    }
+    return last
+}
+
+// get a random word of the length.
+function getRandomWordOfLength(len) {
+    let first = lengthStart(len)
+    return getWord(WORDS.byLength[first + randomInt(lengthStart(len + 1) - first)])
+}
+
 export function getRandomWord(minlen, maxlen) {
-    var i = Math.floor(Math.random() * words.length);
-    var tries = 0
-    let maxtries = 1000
-    var word = words[i]
-    while (tries < maxtries && (word.length < minlen || word.length > maxlen)) {
-        i = Math.floor(Math.random() * words.length)
-        word = words[i]
-        tries += 1
+    if (WORDS.starts === null) {
+        let msg = 'ERROR: the word list is not loaded, see loadWords()'
+        clog(msg)
+        loadWords()
+        return '?'
     }
-    if (tries >= maxtries) {
-        let msg = `ERROR: tries exceeded threshold of ${maxtries} in maxtries(${minlen},${maxlen})`
+    let first = lengthStart(minlen)
+    let count = lengthStart(maxlen + 1) - first
+    if (count <= 0) {
+        let msg = `ERROR: there are no words with ${minlen} to ${maxlen} letters`
         clog(msg)
         statusBlip(msg)
-        word = '?'
+        return '?'
     }
-    return word
+    return getWord(WORDS.byLength[first + randomInt(count)])
 }
 
-export function getMemorablePassword(length) {
-    let tries = 0
-    let sep = window.prefs.memorablePasswordWordSeparator
-    let minlen = window.prefs.memorablePasswordMinWordLength
-    let maxlen = length
-    let numwords = 0
-    let maxwords = window.prefs.memorablePasswordMaxWords
-    let minwords = window.prefs.memorablePasswordMinWords
-    let maxtries = window.prefs.memorablePasswordMaxTries
-    let result = ''
-    while (result.length !== length && tries < maxtries) {
-        result = window.prefs.memorablePasswordPrefix
-        numwords = 0
-        while (result.length < (length - window.prefs.memorablePasswordSuffix.length)) {
-            numwords += 1
-            let word = getRandomWord(minlen, maxlen)
-            if (numwords > 1) {
-                result += sep
-            }
-            result += word
-            if (numwords > maxwords) {
-                break
+// get the tables used by getMemorablePassword() for the letters (the
+// length without the prefix and suffix) and the prefs.
+// They are kept for the next password, which usually has the same length.
+function getMemorablePlan(letters, minlen, minwords, maxwords, sepLength) {
+    let key = `${letters} ${minlen} ${minwords} ${maxwords} ${sepLength}`
+    if (MEMORABLE_PLAN !== null && MEMORABLE_PLAN.key === key) {
+        return MEMORABLE_PLAN
+    }
+    // the probability that a random word that can be used has the length
+    let usable = lengthStart(letters + 1) - lengthStart(minlen)
+    let counts = []
+    for (let len = 0; len < WORDS.lengthStarts.length - 1; len++) {
+        counts.push((len < minlen || usable <= 0) ? 0 : (lengthStart(len + 1) - lengthStart(len)) / usable)
+    }
+
+    // ways[k][r] for k words and r letters
+    let ways = [new Array(Math.max(letters + 1, 1)).fill(0)]
+    ways[0][0] = 1
+    for (let k = 1; k <= maxwords && letters >= 0; k++) {
+        let row = new Array(letters + 1).fill(0)
+        for (let r = 0; r <= letters; r++) {
+            for (let len = minlen; len < counts.length && len <= r; len++) {
+                row[r] += counts[len] * ways[k - 1][r - len]
             }
         }
-        result += window.prefs.memorablePasswordSuffix
-        tries += 1
-        if (numwords > maxwords || numwords < minwords) {
-            result = '' // failed
-        }
+        ways.push(row)
+    }
+
+    // the probability of each number of words
+    let total = 0
+    let weights = []
+    for (let n = 0; n <= maxwords; n++) {
+        let r = letters - (n - 1) * sepLength
+        let weight = (n >= minwords && letters >= 0 && r >= 0 && r <= letters) ? ways[n][r] : 0
+        weights.push(weight)
+        total += weight
+    }
+    MEMORABLE_PLAN = {key: key, counts: counts, ways: ways, weights: weights, total: total}
+    return MEMORABLE_PLAN
+}
+
+// Generate a memorable password of exactly the specified length.
+// The password is the prefix, between memorablePasswordMinWords and
+// memorablePasswordMaxWords words of at least
+// memorablePasswordMinWordLength letters joined by the separator and
+// the suffix. It is built directly rather than by trial and error.
+// ways[k][r] is the probability that k random words have r letters in
+// total, so the number of words and then the length of each word can
+// be chosen with the probability that random words would fit. The
+// passwords are as likely as they were when random words were picked
+// until they happened to fit.
+export function getMemorablePassword(length) {
+    if (WORDS.starts === null) {
+        clog('ERROR: the word list is not loaded, see loadWords()')
+        loadWords()
+        return '???' + getCrypticPassword(length, HEX_DIGITS)
     }
-    if (tries >= maxtries) {
-        clog(`ERROR: tries exceeded threshold: ${maxtries}`)
-        result = '???' + getCrypticPassword(length, HEX_DIGITS)
+    let sep = window.prefs.memorablePasswordWordSeparator
+    let minlen = Math.max(1, window.prefs.memorablePasswordMinWordLength)
+    let maxwords = window.prefs.memorablePasswordMaxWords
+    let minwords = Math.max(1, window.prefs.memorablePasswordMinWords)
+    let prefix = window.prefs.memorablePasswordPrefix
+    let suffix = window.prefs.memorablePasswordSuffix
+    let letters = length - prefix.length - suffix.length // for the words and separators
+
+    let plan = getMemorablePlan(letters, minlen, minwords, maxwords, sep.length)
+    if (plan.total === 0) {
+        clog(`ERROR: no memorable password of length ${length} is possible`)
+        return '???' + getCrypticPassword(length, HEX_DIGITS)
     }
-    if (result.length !== length) {
-        clog(`ERROR: length exceeded threshold: ${result.length}`)
-        result = '???' + getCrypticPassword(length, HEX_DIGITS)
+    let numwords = randomChoice(plan.weights, plan.total)
+    let counts = plan.counts
+    let ways = plan.ways
+
+    // choose the length of each word, then the word
+    let r = letters - (numwords - 1) * sep.length
+    let words = []
+    for (let k = numwords; k > 0; k--) {
+        let lengthWeights = counts.map((count, len) => (len <= r) ? count * ways[k - 1][r - len] : 0)
+        let len = randomChoice(lengthWeights, ways[k][r])
+        words.push(getRandomWordOfLength(len))
+        r -= len
     }
-    return result
+    return prefix + words.join(sep) + suffix
 }
 
 function saveGeneratedPassword(event) {
@@ -102,7 +276,12 @@ function saveGeneratedPassword(event) {
 // make the generate password dialogue for record fields and
 // reuse it if it already exists
 export function mkGeneratePasswordDlg(event) {
-    let button = event.target.parentElement
+    let target = event.target
+    loadWords().then(() => showGeneratePasswordDlg(target))
+}
+
+function showGeneratePasswordDlg(target) {
+    let button = target.parentElement
     let row = button.xGetParentWithClass('row')
     // has it already been created?
     let genSection = row.xGet('.x-fld-pw-gen')
@@ -329,6 +508,7 @@ export function getFilePass() {
 // Clear the password from whichever storage the current strategy uses.
 // Call this before switching strategies to avoid leaving stale passwords.
 export function clearFilePass() {
+    clearKeyCache() // the keys derived from the password
     switch (window.prefs.filePassCache) {
     case 'local':
         localStorage.removeItem('filePass')
@@ -351,8 +531,10 @@ export function clearFilePass() {
 export function showMainPasswordGeneratorDlg() {
     const dlg = document.getElementById('mainPasswordGeneratorDlg')
     const modal = bootstrap.Modal.getOrCreateInstance(dlg)
-    refreshMainPasswordGeneratorDlg(dlg)
-    modal.show()
+    loadWords().then(() => {
+        refreshMainPasswordGeneratorDlg(dlg)
+        modal.show()
+    })
 }
 
 // Regenerate the password options in the modal body.
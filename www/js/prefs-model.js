@@ -2,6 +2,7 @@
 // No DOM dependencies. Safe to import in unit tests without a browser context.
 
 // These are the input types that the tool knows how to handle.
+// tools/pamgen.py has a copy.
 export const VALID_FIELD_TYPES = {
     'datetime-local': 1,
     'email': 1,
@@ -97,5 +98,11 @@ export function getDefaultPrefs() {
         allowHtmlFieldRendering: false,
         defaultRecordFields: 'website,login,password,note',
         enableRawJSONEdit: false,
+        windowedRenderingThreshold: 500,
+        lazyRecordFields: true,
+        cacheDerivedKeys: false,
+        saveFormatV3: false,
+        useSaveFilePicker: false,
+        cacheVault: false,
     }
 }
@@ -10,6 +10,7 @@ import { searchRecords } from './search.js'
 import { enableRawJSONEdit } from './raw.js'
 import { updateHtmlRenderingIndicator, updateFilePassCacheIndicator } from './main.js'
 import { clearFilePass } from './password.js'
+import { clearKeyCache } from './crypt.js'
 
 // These are the input types that the tool knows how to handle.
 export const VALID_FIELD_TYPES = {
@@ -119,6 +120,12 @@ export function initPrefs() {
         defaultRecordFields: 'website,login,password,note',
         enableRawJSONEdit: false,
         encryptionFormat: 'v1',  // v1 (default) or v2 — see SECURITY.md SEC-003/SEC-004
+        windowedRenderingThreshold: 500, // only render the visible records above this many, 0 disables
+        lazyRecordFields: true, // build the record fields when the record is expanded
+        cacheDerivedKeys: false, // keep the keys derived from the file password for the session
+        saveFormatV3: false, // save encrypted files in the chunked v3 format
+        useSaveFilePicker: false, // save with the file save dialogue if the browser has one
+        cacheVault: false, // keep the last encrypted file in IndexedDB and restore it at startup
     }
     setHelpLinks()
 
@@ -239,6 +246,15 @@ export function menuPrefsDlg() {
                 prefTextareaMinHeight(labelClasses, inputClasses),
                 prefPromptDesc('Define the minimum height of the textareas for notes and HTML input. '+
                                'This is useful in mobile browsers where resize is not available.'),
+                prefWindowedRenderingThreshold(labelClasses, inputClasses),
+                prefPromptDesc('When there are more records than this only the records near the visible '+
+                               'part of the list are rendered which keeps large files fast and small, '+
+                               'especially on phones. '+
+                               'Set it to 0 to always render all of the records.'),
+                prefLazyRecordFields(labelClasses, inputClasses),
+                prefPromptDesc('Build the fields of a record when it is expanded and release them '+
+                               'when it is collapsed instead of building them for every record when '+
+                               'the file is loaded. This makes loading large files faster.'),
             ),
             mkTabPane('prefs-tab-fields', false,
                 prefPromptDesc('These are the pre-defined fields shown in the pulldown menu that a user can '+
@@ -290,6 +306,20 @@ export function menuPrefsDlg() {
                                'the <code>Save File</code> menu option is <i>always</i> displayed, '+
                                'even when <code>Enable Save File</code> is false. '+
                                'This is typically disabled when multiple users share the same PAM file data.'),
+                prefUseSaveFilePicker(labelClasses, inputClasses),
+                prefPromptDesc('Use the browser file save dialogue to choose where the file is saved, '+
+                               'if the browser supports it, instead of downloading the file. '+
+                               'The file is written in pieces so that large files are not held in memory twice.'),
+                prefCacheVault(labelClasses, inputClasses),
+                prefPromptDesc('Keep a copy of the last encrypted file that was loaded or saved in the '+
+                               'browser (IndexedDB) and restore it when PAM starts so that it does not '+
+                               'have to be loaded again. '+
+                               'The copy is encrypted with the file password, it is restored automatically '+
+                               'if the password is cached (see <code>filePass Cache Strategy</code>), '+
+                               'otherwise use <code>Load Cached Records</code> in the load dialogue. '+
+                               'Files that are not encrypted are never cached. '+
+                               'The copy is removed when the records are cleared or when a file is loaded or saved '+
+                               'with this preference disabled.'),
                 prefHideInactiveRecords(labelClasses, inputClasses),
                 prefPromptDesc('Making records inactive is very much like deleting them. '+
                                'The only difference is that even though they are no longer visible '+
@@ -319,6 +349,21 @@ export function menuPrefsDlg() {
                                'where it persists for a single browser tab until it is closed.<br>' +
                                'Your chosen strategy is stored per-device in localStorage as <code>pamCacheStrategy</code> ' +
                                'and will be restored automatically on next launch.'),
+                prefCacheDerivedKeys(labelClasses, inputClasses),
+                prefPromptDesc('Keep the encryption keys derived from the file password in memory '+
+                               'for this session so that saving or loading the same file again does not '+
+                               'repeat the slow key derivation. The keys are not extractable and they '+
+                               'are discarded when the password is cleared, when the preferences are '+
+                               'saved and after 10 minutes of inactivity. '+
+                               'While this is enabled, saves of the same file with the same password reuse '+
+                               'the salt of the file (a new IV is always used).'),
+                prefSaveFormatV3(labelClasses, inputClasses),
+                prefPromptDesc('Save encrypted files in the chunked v3 format. '+
+                               'The records are encrypted in independent authenticated chunks '+
+                               'behind an encrypted header that holds the preferences and the record titles. '+
+                               'When the derived keys are cached, saving the same file again only '+
+                               're-encrypts the chunks that changed. '+
+                               'Older versions of PAM cannot load v3 files.'),
                 prefEnableRawJSONEdit(labelClasses, inputClasses),
                 prefPromptDesc('Enable editing of the raw internal JSON data. '+
                                'This is not recommended unless you really know what you are doing '+
@@ -513,6 +558,7 @@ function savePrefs(el) {
     setDarkLightTheme(window.prefs.themeName)
     updateHtmlRenderingIndicator()  // SEC-001: update toolbar badge
     updateFilePassCacheIndicator()  // SEC-002: update toolbar badge
+    clearKeyCache()  // the cache settings or the password strategy may have changed
     searchRecords()  // refresh
     return checkDefaultRecordFields(true)
 }
@@ -720,6 +766,22 @@ function prefEnableSaveFile(labelClasses, inputClasses) {
                            'enable save file')
 }
 
+function prefUseSaveFilePicker(labelClasses, inputClasses) {
+    return mkPrefsCheckBox(labelClasses,
+                           inputClasses,
+                           'useSaveFilePicker',
+                           'Use the Save File Dialogue',
+                           'use the browser file save dialogue if it is available')
+}
+
+function prefCacheVault(labelClasses, inputClasses) {
+    return mkPrefsCheckBox(labelClasses,
+                           inputClasses,
+                           'cacheVault',
+                           'Cache the Encrypted File',
+                           'keep the last encrypted file in the browser and restore it at startup')
+}
+
 function prefTextareaMinHeight(labelClasses, inputClasses) {
     return xmk('div').xClass('row').xAppend(
         prefLabel(labelClasses, 'Textarea Minimum Height'),
@@ -737,6 +799,48 @@ function prefTextareaMinHeight(labelClasses, inputClasses) {
     )
 }
 
+function prefWindowedRenderingThreshold(labelClasses, inputClasses) {
+    return xmk('div').xClass('row').xAppend(
+        prefLabel(labelClasses, 'Windowed Rendering Threshold (records)'),
+        xmk('div').xClass(...inputClasses).xAppend(
+            xmk('div').xClass('input-group').xAppend(
+                xmk('input')
+                    .xClass('form-control', 'text-end')
+                    .xAttrs({'type': 'number',
+                             'value': window.prefs.windowedRenderingThreshold,
+                             'min': 0,
+                             'title': 'min=0, 0 disables windowed rendering',
+                             'data-pref-id': 'windowedRenderingThreshold',
+                            })
+            ),
+        ),
+    )
+}
+
+function prefLazyRecordFields(labelClasses, inputClasses) {
+    return mkPrefsCheckBox(labelClasses,
+                           inputClasses,
+                           'lazyRecordFields',
+                           'Build Record Fields on Expand',
+                           'build the record fields when the record is expanded')
+}
+
+function prefCacheDerivedKeys(labelClasses, inputClasses) {
+    return mkPrefsCheckBox(labelClasses,
+                           inputClasses,
+                           'cacheDerivedKeys',
+                           'Cache Derived Keys',
+                           'keep the keys derived from the file password for this session')
+}
+
+function prefSaveFormatV3(labelClasses, inputClasses) {
+    return mkPrefsCheckBox(labelClasses,
+                           inputClasses,
+                           'saveFormatV3',
+                           'Save in the v3 Format',
+                           'save encrypted files in the chunked v3 format')
+}
+
 export function prefFilePassCacheStrategy(labelClasses, inputClasses) {
     let value = window.prefs.filePassCache
     let list_items = []
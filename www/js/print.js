@@ -8,6 +8,7 @@ import { xmk, xget, xgetn, enableFunctionChaining } from './lib.js'
 import { statusBlip } from './status.js'
 import { VERSION } from './version.js'  // automatically generated by make
 import { hide, show } from './utils.js'
+import { getRecordEntries } from './store.js'
 
 export function enablePrinting() {
     // Use Bootstrap's d-none class rather than inline display:none &mdash;
@@ -115,22 +116,17 @@ function sanitize(html) {
 }
 
 function genRecordsDocument() {
-    let recordsContainer = document.body.xGet('#records-accordion')
-    if (!recordsContainer) {
-        return '<h4>No records</h4>'
-    }
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
-    if (!accordionItems) {
-        return '<h4>No records</h4>'
-    }
-    if (accordionItems.length === 0) {
+    // The record data comes from the record store, the records that
+    // were hidden by the search are skipped.
+    let entries = getRecordEntries()
+    if (entries.length === 0) {
         return '<h4>No records available</h4>'
     }
 
     // Count visible records.
     let count = 0
-    for (let i=0; i<accordionItems.length; i++) {
-        if (!accordionItems[i].classList.contains('d-none')) {
+    for (let i=0; i<entries.length; i++) {
+        if (!entries[i].hidden) {
             count += 1
         }
     }
@@ -156,43 +152,26 @@ function genRecordsDocument() {
 
     // Build record cards HTML
     let cards = ''
-    for (let i=0; i<accordionItems.length; i++) {
-        let accordionItem = accordionItems[i]
-        if (accordionItem.classList.contains('d-none')) {
+    for (let i=0; i<entries.length; i++) {
+        if (entries[i].hidden) {
             continue
         }
-        let button = accordionItem.xGet('.accordion-button')
-        let title = button.innerHTML
+        let record = entries[i].record
+        let title = record.title
 
         // Collect non-empty fields
         let fieldRows = ''
-        let rows = accordionItem.xGetN('.row')
-        for (let j=0; j<rows.length; j++) {
-            let row = rows[j]
-            let nameDiv = row.xGet('.x-fld-name')
-            if (!nameDiv) {
-                continue // button row
-            }
-            let valueDiv = row.xGet('.x-fld-value')
-            let type = valueDiv.getAttribute('data-fld-type')
-            let value = valueDiv.innerHTML
-            switch (type) {
-            case 'html':
-            case 'password':
-            case 'textarea':
-            case 'url':
-                value = valueDiv.getAttribute('data-fld-raw-value')
-                break
-            default:
-                break
-            }
+        for (let j=0; j<record.fields.length; j++) {
+            let field = record.fields[j]
+            let type = field.type
+            let value = field.value
 
             // Skip empty fields
             if (!value || !value.trim()) {
                 continue
             }
 
-            let name = sanitize(nameDiv.innerHTML)
+            let name = sanitize(field.name)
             if (type !== 'html') {
                 value = sanitize(value)
             }
@@ -0,0 +1,226 @@
+// Record stream parser.
+/**
+ * Incremental parser for PAM files in plain JSON.
+ *
+ * The text is pushed in pieces as it is read. The elements of the top
+ * level "records" array are reported as soon as each one is complete
+ * and the other top level values when they are complete. The parser
+ * only finds where the values end, each value is parsed with
+ * JSON.parse(). See streamFileContent() in load.js.
+ * @module record-stream
+ */
+
+// is the character code JSON whitespace?
+function isSpace(c) {
+    return c === 32 || c === 10 || c === 13 || c === 9
+}
+
+/**
+ * Make a record stream parser.
+ *
+ * @param {object} handlers - The handlers for the parsed values:
+ *   value(key, value) is called for each top level value except the
+ *   records, records() when the records array starts and record(row)
+ *   for each element of the records array.
+ * @returns {object} {push(text), end()} where push() parses the next
+ *   piece of the text and end() reports the end of the text. Both throw
+ *   a SyntaxError if the text is not a JSON object.
+ */
+export function mkRecordStreamParser(handlers) {
+    let buf = ''         // the text that has not been consumed
+    let offset = 0       // position of buf in the text, for error messages
+    let pos = 0          // scan position in buf
+    let start = -1       // position in buf of the value being scanned or -1
+    let depth = 0        // object and array nesting depth of the value being scanned
+    let inString = false // true if the scan position is in a string
+    let ended = false    // true if the end of the text was reported
+    let key = null       // the current top level key
+    // what comes next: open, key, colon, value, records, first, element, more, next or done
+    let state = 'open'
+
+    const fail = (what) => {
+        throw new SyntaxError(`Unexpected ${what} at position ${offset + pos} in JSON`)
+    }
+
+    // scan to the end of the value that starts at start.
+    // Returns true if it is complete, pos is then the position after it.
+    const scanValue = () => {
+        let c = buf.charCodeAt(start)
+        if (c !== 123 && c !== 91 && c !== 34) { // not {, [ or "
+            // a number, true, false or null
+            while (pos < buf.length) {
+                c = buf.charCodeAt(pos)
+                if (c === 44 || c === 93 || c === 125 || isSpace(c)) { // , ] }
+                    return true
+                }
+                pos++
+            }
+            return ended
+        }
+        while (pos < buf.length) {
+            if (inString) {
+                let quote = buf.indexOf('"', pos)
+                if (quote < 0) {
+                    pos = buf.length
+                    return false
+                }
+                let escapes = 0
+                while (buf.charCodeAt(quote - 1 - escapes) === 92) { // backslash
+                    escapes++
+                }
+                pos = quote + 1
+                if (escapes % 2 === 0) {
+                    inString = false
+                    if (depth === 0) {
+                        return true
+                    }
+                }
+                continue
+            }
+            c = buf.charCodeAt(pos++)
+            if (c === 34) {
+                inString = true
+            } else if (c === 123 || c === 91) {
+                depth++
+            } else if (c === 125 || c === 93) {
+                depth--
+                if (depth === 0) {
+                    return true
+                }
+            }
+        }
+        return false
+    }
+
+    // take the value that was scanned.
+    const takeValue = () => {
+        let value = JSON.parse(buf.slice(start, pos))
+        start = -1
+        return value
+    }
+
+    // start scanning a value at pos.
+    const beginValue = () => {
+        start = pos
+        depth = 0
+        inString = false
+    }
+
+    // parse as much of buf as possible.
+    const parse = () => {
+        for (;;) {
+            if (start >= 0) {
+                if (!scanValue()) {
+                    return
+                }
+                if (state === 'key') {
+                    key = takeValue()
+                    state = 'colon'
+                } else if (state === 'value') {
+                    handlers.value(key, takeValue())
+                    state = 'next'
+                } else {
+                    handlers.record(takeValue())
+                    state = 'more'
+                }
+                continue
+            }
+            while (pos < buf.length && isSpace(buf.charCodeAt(pos))) {
+                pos++
+            }
+            if (pos >= buf.length) {
+                return
+            }
+            let c = buf[pos]
+            switch (state) {
+            case 'open':
+                if (c !== '{') {
+                    fail(`token ${c}`)
+                }
+                pos++
+                state = 'key'
+                break
+            case 'key':
+                if (c === '}' && key === null) {
+                    pos++
+                    state = 'done' // empty object
+                } else if (c === '"') {
+                    beginValue()
+                    inString = true
+                    pos++
+                } else {
+                    fail(`token ${c}`)
+                }
+                break
+            case 'colon':
+                if (c !== ':') {
+                    fail(`token ${c}`)
+                }
+                pos++
+                state = key === 'records' ? 'records' : 'value'
+                break
+            case 'records':
+                if (c !== '[') {
+                    state = 'value' // not an array, let the caller deal with it
+                    break
+                }
+                pos++
+                handlers.records()
+                state = 'first'
+                break
+            case 'first':
+            case 'element':
+                if (c === ']') {
+                    if (state === 'element') {
+                        fail(`token ${c}`) // trailing comma
+                    }
+                    pos++
+                    state = 'next'
+                } else {
+                    beginValue()
+                }
+                break
+            case 'value':
+                beginValue()
+                break
+            case 'more':
+                if (c !== ',' && c !== ']') {
+                    fail(`token ${c}`)
+                }
+                pos++
+                state = c === ',' ? 'element' : 'next'
+                break
+            case 'next':
+                if (c !== ',' && c !== '}') {
+                    fail(`token ${c}`)
+                }
+                pos++
+                state = c === ',' ? 'key' : 'done'
+                break
+            default:
+                fail(`non-whitespace character after JSON`)
+            }
+        }
+    }
+
+    return {
+        push: (text) => {
+            // drop the text that was consumed
+            let keep = start >= 0 ? start : pos
+            offset += keep
+            buf = buf.slice(keep) + text
+            pos -= keep
+            if (start >= 0) {
+                start = 0
+            }
+            parse()
+        },
+        end: () => {
+            ended = true
+            parse()
+            if (state !== 'done') {
+                fail('end of JSON input')
+            }
+        },
+    }
+}
@@ -3,65 +3,53 @@ import { icon, clog, isURL, mkid,  mkPopupModalDlg, mkPopupModalDlgButton } from
 import { copyRecordFieldsToEditDlg, mkRecordEditDlg, mkRecordField } from './field.js'
 import { searchRecords } from './search.js'
 import { clearAbout } from './about.js'
-
-let INACTIVE = '<small>*INACTIVE*</small>&nbsp;'
+import { INACTIVE, addRecord, addRecords, getItemRecord, getNumStoredRecords, lookupRecord,
+         lookupRecordAfter, removeAllRecords, removeRecord, removeRecordEntry, setItemRecord,
+         touchRecord } from './store.js'
+import { updateRecordsView } from './virtual.js'
 
 // find record by title.
-// it does a case insensitive O(N) lookup so "Xyx" will be equal "xyz".
-// This is an O(N) operation but that is okay because the number of records is small.
+// it does a case insensitive O(1) lookup in the record store so "Xyx" will be equal "xyz".
 export function findRecord(title) {
-    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
-    let titleNormalized = title.trim().toLowerCase()
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
-    for (let i=0; i<accordionItems.length; i++) {
-        let accordionItem = accordionItems[i]
-        let button = accordionItem.xGet('.accordion-button')
-        let valueNormalized = button.innerHTML.trim().toLowerCase()
-        if (valueNormalized === titleNormalized ) {
-            return accordionItem
-        }
+    let entry = lookupRecord(title)
+    return entry ? getEntryItem(entry) : null
+}
+
+// get the accordion item for a record store entry.
+// In windowed mode the item is rendered when it is needed.
+export function getEntryItem(entry) {
+    if (!entry.item) {
+        entry.item = renderRecord(entry.record).xGet('.accordion-item')
     }
-    return null
+    return entry.item
 }
 
-// get the number of records.
-function getNumRecords() {
-    let recordsContainer = document.body.xGet('#records-accordion')
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
-    return accordionItems.length
+// find the record data by title.
+export function findRecordData(title) {
+    let entry = lookupRecord(title)
+    return entry ? entry.record : null
 }
 
-// set the number of records
+// set the number of records and update the records view.
 function setNumRecords() {
-    let numrecs = getNumRecords()
+    let numrecs = getNumStoredRecords()
     document.body.xGet('#x-num-records').xInnerHTML(numrecs)
+    updateRecordsView(numrecs)
 }
 
 // find the record that would appear after this one
 // for use in an insertBefore operation. If it would
 // be the last record, return null.
-// This is an O(N) operation but that is okay because the number of records is small.
 export function findRecordAfter(title) {
-    let recordsContainer = document.body.xGet('#records-accordion')
-    let inserted = false
-    let titleNormalized = title.trim().toLowerCase()
-    let records = recordsContainer.xGetN('.accordion-item')
-    for (let i=0; i<records.length; i++) {
-        let record = records[i]
-        let button = record.xGet('.accordion-button')
-        let valueNormalized = button.innerHTML.trim().toLowerCase()
-        if (valueNormalized > titleNormalized ) {
-            return record // insertbefore
-        }
-    }
-    return null // append
+    let entry = lookupRecordAfter(title)
+    return entry ? getEntryItem(entry) : null // insertbefore or append
 }
 
 // delete record
 export function deleteRecord(title) {
-    let record = findRecord(title)
-    if (record) {
-        record.remove()
+    let entry = lookupRecord(title)
+    if (entry) {
+        removeRecordEntry(entry)
         setNumRecords()
     }
 }
@@ -71,32 +59,67 @@ export function insertRecord(newRecord, title) {
     // ordered insertion here.
     // this logic guarantees that the list always maintains order.
     // order is desirable because it makes it more human readable.
-    // the complexity O(N) but the list is relatively small (human scale)
-    // so it will be sufficiently fast.
-    let afterRecord = findRecordAfter(title)
-    if (afterRecord) {
-        afterRecord.parentElement.insertBefore(newRecord, afterRecord)
-    } else {
-        let recordsContainer = document.body.xGet('#records-accordion')
-        recordsContainer.appendChild(newRecord)
-    }
+    // the insertion point is found by a binary search of the record store.
+    addRecord(newRecord, title)
+    setNumRecords()
+}
+
+// insert a batch of records into the accordion display.
+// records is an array of record objects.
+// This is used for bulk loads. The records are rendered and added to
+// the display in as few DOM operations as possible and the record
+// counter is only updated once. If the records will be displayed by
+// the windowed renderer they are not rendered here.
+export function insertRecords(records) {
+    let windowed = updateRecordsView(getNumStoredRecords() + records.length)
+    addRecords(records.map((r) => {
+        return {title: r.title, record: r, node: windowed ? null : renderRecord(r)}
+    }))
     setNumRecords()
 }
 
 // clear all records
 export function clearRecords() {
-    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
-    let nodeList = []
-    for (let i=0; i<accordionItems.length; i++) {
-        let accordionItem = accordionItems[i]
-        nodeList.push(accordionItem)
-    }
-    nodeList.forEach((n) => { n.remove() })
+    removeAllRecords()
+    updateRecordsView(0)
     document.body.xGet('#x-num-records').xInnerHTML('0')
     clearAbout()
 }
 
+// Render a record object as an accordion item using mkRecord().
+// The record object is the source of truth for the record data,
+// see store.js.
+// If the lazyRecordFields pref is set the field rows are not built
+// until the record is expanded and they are released when it is
+// collapsed because most records are never expanded.
+export function renderRecord(record) {
+    let lazy = !!window.prefs.lazyRecordFields
+    let recordFields = lazy ? [] : renderRecordFields(record)
+    let node = mkRecord(record.title, record.active, record.created, ...recordFields)
+    let item = node.xGet('.accordion-item')
+    setItemRecord(item, record)
+    if (lazy) {
+        let collapse = item.xGet('.accordion-collapse')
+        collapse.addEventListener('show.bs.collapse', (event) => {
+            let container = item.xGet('.x-record-fields')
+            if (event.target === collapse && container.childElementCount === 0) {
+                container.xAppend(...renderRecordFields(getItemRecord(item)))
+            }
+        })
+        collapse.addEventListener('hidden.bs.collapse', (event) => {
+            if (event.target === collapse) {
+                item.xGet('.x-record-fields').replaceChildren()
+            }
+        })
+    }
+    return node
+}
+
+// Render the field rows of a record object.
+function renderRecordFields(record) {
+    return record.fields.map((f) => mkRecordField(f.name, f.type, f.value))
+}
+
 // Create the DOM structure for the new record using the bootstrap
 // accordion idiom.
 //
@@ -105,7 +128,8 @@ export function clearRecords() {
 // created - is the creation date string
 // recordFields - are the record fields
 //
-// The data for each record is embedded in the DOM elements that
+// The data for each record is kept in the record store (see store.js
+// and renderRecord()), it is also embedded in the DOM elements that
 // compose the fields. Each record is an array of fields.
 //
 // The name of a field is found by:
@@ -146,6 +170,9 @@ export function mkRecord(title, active, created, ...recordFields) {
                 let title = titleElem.innerHTML
                 titleElem.innerHTML = title.replace(INACTIVE, '')
                 button.setAttribute('x-active', 'true')
+                let record = getItemRecord(item)
+                record.active = true
+                touchRecord(record) // save it again
                 searchRecords() // refresh
             } else {
                 let item = event.target.xGetParentWithClass('accordion-item')
@@ -155,6 +182,9 @@ export function mkRecord(title, active, created, ...recordFields) {
                 titleElem.innerHTML = title.replace(INACTIVE, '')
                 titleElem.innerHTML = INACTIVE + title
                 button.setAttribute('x-active', 'false')
+                let record = getItemRecord(item)
+                record.active = false
+                touchRecord(record) // save it again
                 searchRecords() // refresh
             }
         })
@@ -185,7 +215,7 @@ export function mkRecord(title, active, created, ...recordFields) {
             if (!confirm(`Delete record "${title}"?\nThis cannot be undone.`)) {
                 return
             }
-            ai.remove()
+            removeRecord(ai)
             setNumRecords()
             searchRecords() // refresh
         })
@@ -262,7 +292,7 @@ export function mkRecord(title, active, created, ...recordFields) {
                         .xAppend(
                             // The record fields with clipboard copy buttons and other stuff.
                             xmk('div')
-                                .xClass('container')
+                                .xClass('container', 'x-record-fields')
                                 .xAppend(...recordFields),
                             // The record buttons.
                             xmk('div')
@@ -372,12 +402,9 @@ export function checkRecordEditDlg(event, allowCloneTitle) {
         return
     }
     // todo: check for dup titles in the global list of records
-    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
-    let titleNormalized = title.trim().toLowerCase()
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
     // allowCloneTitle is true when we know that the old record will be
     // removed so duplicates are okay
-    if (!allowCloneTitle && findRecord(title)) {
+    if (!allowCloneTitle && lookupRecord(title)) {
         container.xAttr('data-check-failed', `title already exists: "${title}"`)
         return
     }
@@ -454,10 +481,11 @@ function mkRecordFields(container) {
             // artifact.
             continue
         }
-        let name = nameElem.value
-        let type = valueElem.getAttribute('data-fld-type')
-        let value = valueElem.value
-        recordFields.push( mkRecordField(name, type, value) )
+        recordFields.push({
+            'name': nameElem.value,
+            'type': valueElem.getAttribute('data-fld-type'),
+            'value': valueElem.value,
+        })
     }
     return recordFields
 }
@@ -465,14 +493,17 @@ function mkRecordFields(container) {
 // save the record
 export function saveRecordEditDlg(event, active, created) {
     let container = event.xGet('.container')
-    let rows = container.xGetN('.row')
     let title = container.xGet('.x-record-title').value
     // Create the accordion item with all of the record information.
     // Accordions in bootstrap only allow one to item to be expanded at a time.
-    let recordFields = mkRecordFields(container)
-    let newRecord = mkRecord(title, active, created, ...recordFields)
+    let record = {
+        'title': title,
+        'active': active,
+        'created': created,
+        'fields': mkRecordFields(container),
+    }
     if (active === true || !window.prefs.hideInactiveRecords) {
-        insertRecord(newRecord, title);
+        insertRecord(renderRecord(record), title)
     }
 }
 
@@ -509,10 +540,7 @@ function editRecordDlg(title) {
                                              } else {
                                                  let newTitle = container.xGet('.x-record-title').value.trim()
                                                  // Delete the old one before adding the new one.
-                                                 let old = findRecord(title)
-                                                 if (!!old) {
-                                                     old.remove()
-                                                 }
+                                                 deleteRecord(title)
                                                  let active = true
                                                  let created = new Date().toISOString()
                                                  saveRecordEditDlg(event, active, created)
@@ -3,10 +3,17 @@ import { xmk, xget, xgetn, enableFunctionChaining } from './lib.js'
 import { statusBlip } from './status.js'
 import { VERSION } from './version.js'  // automatically generated by make
 import { icon, clog, hide, show, mkPopupModalDlgButton, mkPopupModalDlg } from './utils.js'
-import { findRecord } from './record.js'
+import { getRecordEntries, getRecordJSON } from './store.js'
 import { mkGeneratePasswordDlg, mkLoadSavePassword, setFilePass } from './password.js'
-import { encryptV2 } from './crypt.js'
+import { encryptJSON } from './crypt.js'
 import { setAboutFileInfo } from './about.js'
+import { putCachedVault, clearCachedVault } from './vault-cache.js'
+
+const SAVE_WRITE_CHUNK = 1024 * 1024     // bytes written to a file at a time
+const DOWNLOAD_URL_LIFETIME_MS = 10000 // time the browser has to start a download
+
+// the last download: {url, anchor, timer, clicked} or null
+let DOWNLOAD = null
 
 /**
  * Show or hide the Save File menu entry based on window.prefs.enableSaveFile.
@@ -114,9 +121,8 @@ export function menuSaveDlg() {
 /**
  * Serialise the current in-memory state (prefs + records) to a JSON-compatible object.
  *
- * This function reads directly from the DOM — it walks the records accordion and
- * extracts field names, types, and values from the DOM structure. There is no
- * separate in-memory data store.
+ * The records are read from the record store (see `store.js`) in display order,
+ * the accordion DOM is not walked.
  *
  * @param {object} contents - An object with a `prefs` key and a `records` array.
  *   Both are populated by this function. The caller must initialise them:
@@ -130,56 +136,55 @@ export function convertInternalDataToJSON(contents, now) {
         contents.prefs[key] = value
     }
 
-    // Load all of the record data.
-    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
-    for (let i=0; i<accordionItems.length; i++) {
-        let accordionItem = accordionItems[i]
-        let button = accordionItem.xGet('.accordion-button')
-        let title = button.innerHTML
-        let active = button.getAttribute('x-active') === 'true'
-        let created = now
-        if (button.hasAttribute('x-created')) {
-            created = button.getAttribute('x-created')
-        }
+    // Load all of the record data from the record store.
+    let entries = getRecordEntries()
+    for (let i=0; i<entries.length; i++) {
+        let record = entries[i].record
         let rec = {
-            'title': title,
-            'active': active,
-            'created': created,
-            'fields': []
-        }
-        let rows = accordionItem.xGetN('.row')
-        for (let i=0; i<rows.length; i++) {
-            let row = rows[i]
-            let nameDiv = row.xGet('.x-fld-name')
-            if (!nameDiv) {
-                continue // button row
-            }
-            let name = nameDiv.innerHTML
-            let valueDiv = row.xGet('.x-fld-value')
-            let value = valueDiv.innerHTML
-            let type = valueDiv.getAttribute('data-fld-type')
-            switch( type ) {
-            case 'html':
-            case 'password':
-            case 'textarea':
-            case 'url':
-                value = valueDiv.getAttribute('data-fld-raw-value')
-                break
-            default:
-                break
-            }
-            let fld = {
-                'name': name,
-                'type': type,
-                'value': value,
-            }
-            rec.fields.push(fld)
+            'title': record.title,
+            'active': record.active,
+            'created': record.created ? record.created : now,
+            'fields': record.fields,
         }
         contents.records.push(rec)
     }
 }
 
+// Convert internal data to JSON fragments.
+/**
+ * Serialise the current in-memory state for a save.
+ *
+ * Like `convertInternalDataToJSON()` except that `contents.records` only
+ * gets the title, active and created of each record (the record
+ * directory) and the JSON of each record is returned separately. The
+ * JSON of a record is cached until the record is changed (see
+ * `getRecordJSON()` in `store.js`) so a save only serialises the
+ * records that were loaded, added, edited or cloned since the last save.
+ *
+ * @param {object} contents - An object with a `prefs` key and a `records` array.
+ *   Both are populated by this function.
+ * @param {string} now - ISO 8601 timestamp used as the `created` value for
+ *   records that do not already have one.
+ * @returns {string[]} The JSON of each record, see `joinContents()` in `cipher.js`.
+ */
+export function convertInternalDataToFragments(contents, now) {
+    for (const [key, value] of Object.entries(window.prefs)) {
+        contents.prefs[key] = value
+    }
+    let entries = getRecordEntries()
+    let fragments = new Array(entries.length)
+    for (let i=0; i<entries.length; i++) {
+        let record = entries[i].record
+        contents.records.push({
+            'title': record.title,
+            'active': record.active,
+            'created': record.created ? record.created : now,
+        })
+        fragments[i] = getRecordJSON(record, now)
+    }
+    return fragments
+}
+
 // Save the file.
 function saveFile(filename, password) {
     let now = new Date().toISOString()
@@ -191,10 +196,31 @@ function saveFile(filename, password) {
         'prefs': {},
         'records': [],
     }
-    convertInternalDataToJSON(contents, now)
+    let fragments = convertInternalDataToFragments(contents, now)
     setAboutFileInfo(`Saved ${contents.records.length} records on ${now} to ${filename}.`)
-    let text = JSON.stringify(contents, null, 0)
-    encryptV2(password, text, filename, saveCallback)
+    // joined and encrypted in the crypt worker
+    let save = (callback) => encryptJSON(password, contents, fragments, filename, (text, filename) => {
+        cacheSavedVault(password, text, filename, now, contents.records.length)
+        callback(text, filename)
+    })
+    if (filename !== '.' && canUseSaveFilePicker()) {
+        saveUsingFilePicker(filename, save)
+    } else {
+        save(saveCallback)
+    }
+}
+
+// Update the vault cache after a save, see vault-cache.js.
+// Only encrypted files are cached.
+function cacheSavedVault(password, text, filename, now, num) {
+    if (!text || text.length === 0) {
+        return // not saved
+    }
+    if (!window.prefs.cacheVault || !password) {
+        clearCachedVault()
+        return
+    }
+    putCachedVault(filename, new TextEncoder().encode(text).buffer, now, num)
 }
 
 function copyToClipboard(text, filename) {
@@ -213,34 +239,67 @@ function copyToClipboard(text, filename) {
     }
 }
 
-function saveUsingPromises(text, filename) {
-    // new experimental approach - did not work reliably in testing
-    // especially in mobile browsers.
-    // https://developer.mozilla.org/en-US/docs/Web/API/File_System_Access_API
+// can the file be saved with the browser file save dialogue?
+// https://developer.mozilla.org/en-US/docs/Web/API/File_System_Access_API
+function canUseSaveFilePicker() {
+    return !!window.prefs.useSaveFilePicker && typeof window.showSaveFilePicker === 'function'
+}
+
+// Save the file with the browser file save dialogue.
+// The dialogue must be shown while the click on the Save button is
+// handled so it is shown before the file is encrypted. The file is
+// saved with a download if the dialogue is not allowed.
+// save is called with the callback that writes the file.
+export function saveUsingFilePicker(filename, save) {
     let options = {suggestedName: filename}
     window.showSaveFilePicker(options)
         .then( (fileHandle) => {
-            clog(fileHandle)
-            fileHandle.createWritable()
-                .then( (writableStream) => {
-                    writableStream.write(text)
-                    writableStream.close()
-                })
-                .catch( (error) => {
-                    const msg = `internal error:\nfileHandle.createWritable() exception:\n${error}`
-                    statusBlip(msg)
-                    alert(msg)
-                })
+            save((text, filename) => saveUsingPromises(fileHandle, text, filename))
+        })
+        .catch( (error) => {
+            if (error.name === 'AbortError') {
+                statusBlip('save cancelled')
+                return
+            }
+            clog(`window.showSaveFilePicker(options) exception: ${error}`)
+            save(saveCallback)
+        })
+}
+
+// Write the file to the handle chosen in the file save dialogue.
+// It is written in pieces so that the stream does not have to buffer
+// another copy of a large file.
+function saveUsingPromises(fileHandle, text, filename) {
+    let blob = new Blob([text], {type: 'text/plain;charset=utf-8'})
+    fileHandle.createWritable()
+        .then( async (writableStream) => {
+            try {
+                for (let pos = 0; pos < blob.size; pos += SAVE_WRITE_CHUNK) {
+                    await writableStream.write(blob.slice(pos, pos + SAVE_WRITE_CHUNK))
+                }
+                await writableStream.close()
+            } catch (error) {
+                await writableStream.abort()
+                throw error
+            }
+            statusBlip(`saved ${blob.size} bytes to ${fileHandle.name}`)
         })
         .catch( (error) => {
-            const msg = `internal error:\nwindow.showSaveFilePicker(options) exception:\n${error}`
+            const msg = `internal error:\nfileHandle.createWritable() exception:\n${error}`
             statusBlip(msg)
             alert(msg)
         })
 }
 
-function saveUsingAnchorLink(text, filename) {
-   // old approach using a link.
+// Download the file.
+// The file is downloaded from an object URL for a Blob of the text
+// rather than a data: URL, which would need three times the memory
+// for the URL encoding and is limited in length by some browsers.
+// The object URL is revoked when the anchor is removed,
+// DOWNLOAD_URL_LIFETIME_MS after the click or when the next download
+// starts if it was already clicked. A download that was not clicked
+// yet is left to finish so that quick saves do not lose a file.
+export function saveUsingAnchorLink(text, filename) {
     let check = xmk('a')
     if (check.download === undefined) {
         let msg ='cannot save: check.download not supported'
@@ -250,21 +309,38 @@ function saveUsingAnchorLink(text, filename) {
     }
 
     // Create anchor element, add the data and click it.
-    let data = 'data:text/plain;charset=utf-8,' + encodeURIComponent(text)
+    if (DOWNLOAD !== null && DOWNLOAD.clicked) {
+        revokeDownload(DOWNLOAD)
+    }
+    let blob = new Blob([text], {type: 'text/plain;charset=utf-8'})
+    let url = URL.createObjectURL(blob)
     let a = xmk('a')
         .xStyle({
             'display': 'none'
             })
         .xAttrs({
-            'href': data,
+            'href': url,
             'download': filename
         })
     document.body.appendChild(a)
-    setTimeout( () => {
+    let download = {url: url, anchor: a, timer: null, clicked: false}
+    download.timer = setTimeout( () => {
         a.click()
-        statusBlip(`downloading ${text.length} bytes to ${filename}`)
-        setTimeout( () => {a.remove()}, 2000)
+        download.clicked = true
+        statusBlip(`downloading ${blob.size} bytes to ${filename}`)
+        download.timer = setTimeout(() => revokeDownload(download), DOWNLOAD_URL_LIFETIME_MS)
     }, 500)
+    DOWNLOAD = download
+}
+
+// revoke the object URL of the download and remove its anchor.
+function revokeDownload(download) {
+    clearTimeout(download.timer)
+    URL.revokeObjectURL(download.url)
+    download.anchor.remove()
+    if (DOWNLOAD === download) {
+        DOWNLOAD = null
+    }
 }
 
 function saveCallback(text, filename) {
@@ -277,7 +353,6 @@ function saveCallback(text, filename) {
         copyToClipboard(text, filename)
         return
     } else {
-        //saveUsingPromises(text, filename) // newer
-        saveUsingAnchorLink(text, filename) // old
+        saveUsingAnchorLink(text, filename)
     }
  }
@@ -0,0 +1,60 @@
+// Search matching.
+/**
+ * The record matching used by search.js on the main thread and by the
+ * search worker (search-worker.js). It must not use the DOM.
+ *
+ * A record is {title, fields: [{name, value}]}, a search text is the
+ * pre-lowercased copy of its strings created by mkSearchText().
+ * @module search-match
+ */
+
+// make the search text of a record for case insensitive searches.
+export function mkSearchText(record) {
+    return {
+        title: record.title.toLowerCase(),
+        names: record.fields.map((f) => f.name.toLowerCase()),
+        values: record.fields.map((f) => f.value.toLowerCase()),
+    }
+}
+
+// make the string matcher for the search value.
+// Plain strings are matched by substring search, everything else
+// is matched as a regular expression.
+export function mkMatcher(value, caseInsensitive) {
+    if (!/[\\^$.*+?()[\]{}|]/.test(value)) {
+        let needle = caseInsensitive ? value.toLowerCase() : value
+        return (s) => s.includes(needle)
+    }
+    let regex = null
+    try {
+        regex = caseInsensitive ? new RegExp(value, 'i') : new RegExp(value)
+    } catch (exc) {
+        // This can occur when a partial expression is being typed in.
+        //alert(`ERROR: invalid search expression: "${value}"\nregexp:${exc}`)
+        regex = caseInsensitive ? new RegExp('.', 'i') : new RegExp('.')
+    }
+    return (s) => regex.test(s)
+}
+
+// match the record.
+// text is the search text of the record for case insensitive searches
+// and null for case sensitive searches.
+// options selects what is searched: {titles, names, values}.
+export function matchRecord(record, text, matches, options) {
+    // First try to match the title.
+    if (options.titles && matches(text ? text.title : record.title)) {
+        return true
+    }
+    // title didn't match: search by field names
+    if (options.names &&
+        (text ? text.names.some(matches) : record.fields.some((f) => matches(f.name)))) {
+        return true
+    }
+    // title and field name did not match: search by field values
+    // how should passwords be managed? using the raw value
+    if (options.values &&
+        (text ? text.values.some(matches) : record.fields.some((f) => matches(f.value)))) {
+        return true
+    }
+    return false
+}
@@ -0,0 +1,55 @@
+// Search worker.
+/**
+ * Searches a copy of the record strings off the main thread so that a
+ * slow (or catastrophically backtracking) regular expression does not
+ * freeze the app. See workerSearch() in search.js.
+ *
+ * Messages:
+ *   {cmd: 'load', records}  - replace the copy of the records, each
+ *                             record is {title, fields: [{name, value}]}
+ *   {cmd: 'search', generation, value, caseInsensitive, options, budget}
+ *                           - search the records, options is
+ *                             {titles, names, values}
+ *
+ * The search replies with {generation, bitmap} where bit i of the
+ * bitmap is set if record i matched or with {generation, timeout: true}
+ * if the search took longer than budget milliseconds.
+ * @module search-worker
+ */
+import { matchRecord, mkMatcher, mkSearchText } from './search-match.js'
+
+let RECORDS = []
+let TEXTS = [] // search texts, created on demand
+
+self.onmessage = (event) => {
+    let msg = event.data
+    if (msg.cmd === 'load') {
+        RECORDS = msg.records
+        TEXTS = new Array(RECORDS.length)
+    } else if (msg.cmd === 'search') {
+        search(msg)
+    }
+}
+
+function search(msg) {
+    let matches = mkMatcher(msg.value, msg.caseInsensitive)
+    let bitmap = new Uint8Array((RECORDS.length + 7) >>> 3)
+    let start = performance.now()
+    for (let i=0; i<RECORDS.length; i++) {
+        if (performance.now() - start > msg.budget) {
+            self.postMessage({generation: msg.generation, timeout: true})
+            return
+        }
+        let text = null
+        if (msg.caseInsensitive) {
+            if (!TEXTS[i]) {
+                TEXTS[i] = mkSearchText(RECORDS[i])
+            }
+            text = TEXTS[i]
+        }
+        if (matchRecord(RECORDS[i], text, matches, msg.options)) {
+            bitmap[i >>> 3] |= 1 << (i & 7)
+        }
+    }
+    self.postMessage({generation: msg.generation, bitmap: bitmap}, [bitmap.buffer])
+}
@@ -1,7 +1,33 @@
 import { xmk, xget } from './lib.js'
+import { statusBlip, markBusy } from './status.js'
+import { getRecordEntries, getStoreVersion, isWindowed } from './store.js'
+import { updateRecordsView } from './virtual.js'
+import { matchRecord, mkMatcher, mkSearchText } from './search-match.js'
 
 let CACHED_SEARCH_VALUE = ''
 
+const SEARCH_DEBOUNCE_MS = 50       // coalesce search input events that arrive within this time
+const SEARCH_SLICE_MS = 8           // maximum time spent searching before yielding to the browser
+const SEARCH_WORKER_BUDGET_MS = 2000 // maximum time the search worker may take for a search
+
+let SEARCH = {
+    timer: null,      // pending (debounced) search timer
+    generation: 0,    // incremented to abandon the search pass in progress
+    running: null,    // search value of the pass in progress or null
+    completed: null,  // search value of the last completed pass or null
+    stale: false,     // true if the windowed view must be updated
+    idle: null,       // ends the busy mark of the scheduled and running searches, see markBusy()
+}
+
+let SEARCH_WORKER = {
+    worker: null,     // the search worker or null if it has not been started
+    version: -1,      // store version of the records copied to the worker
+    busy: false,      // true if the worker is searching
+    next: null,       // {value, generation} of the search that waits for the worker or null
+    timer: null,      // timer that stops the worker if a search takes too long
+    failed: false,    // true if the worker could not be used
+}
+
 // define search input element
 export function mkSearchInputElement() {
     let e = xmk('input')
@@ -13,10 +39,10 @@ export function mkSearchInputElement() {
             'placeholder': 'Search',
             'aria-label': 'Search'
         })
-        .xAddEventListener('click', (event) => { searchRecords(event.target.value) })
-        .xAddEventListener('input', (event) => { searchRecords(event.target.value) })
-        .xAddEventListener('change', (event) => { searchRecords(event.target.value) })
-        .xAddEventListener('paste', (event) => { searchRecords(event.target.value) })
+        .xAddEventListener('click', (event) => { scheduleSearch(event.target.value) })
+        .xAddEventListener('input', (event) => { scheduleSearch(event.target.value) })
+        .xAddEventListener('change', (event) => { scheduleSearch(event.target.value) })
+        .xAddEventListener('paste', (event) => { scheduleSearch(event.target.value) })
     return e
 }
 
@@ -32,7 +58,21 @@ function hideRecord(accordionItem) {
     }
 }
 
-export function searchRecords(value) {
+// get the search index entry for a record store entry.
+// It holds the pre-lowercased title, field names and raw field values
+// of the record so that each keystroke does not have to convert them.
+// It is created the first time the record is searched and it follows
+// the store entry so records that are inserted, edited (replaced) or
+// deleted update the index incrementally.
+function getSearchText(entry) {
+    if (!entry.searchText) {
+        entry.searchText = mkSearchText(entry.record)
+    }
+    return entry.searchText
+}
+
+// get the search value to use for the search input value.
+function getSearchValue(value) {
     if (!value) {
         // Allow the caller to use the last (cached) search value.
         value = CACHED_SEARCH_VALUE
@@ -40,80 +80,353 @@ export function searchRecords(value) {
     if (value === '') {
         value = '.'
     }
+    return value
+}
+
+// get what is searched from the prefs.
+function getSearchOptions() {
+    return {
+        titles: !!window.prefs.searchRecordTitles,
+        names: !!window.prefs.searchRecordFieldNames,
+        values: !!window.prefs.searchRecordFieldValues,
+    }
+}
+
+// is the record hidden because it is inactive?
+function isHiddenInactive(entry) {
+    return entry.record.active === false && !!window.prefs.hideInactiveRecords
+}
+
+// make the function that matches a record store entry for the search value.
+function mkEntryMatcher(value) {
+    let caseInsensitive = !!window.prefs.searchCaseInsensitive
+    let matches = mkMatcher(value, caseInsensitive)
+    let options = getSearchOptions()
+    return (entry) => {
+        // ignore inactive records if the hide inactive records pref is set.
+        if (isHiddenInactive(entry)) {
+            return false
+        }
+        let text = caseInsensitive ? getSearchText(entry) : null
+        return matchRecord(entry.record, text, matches, options)
+    }
+}
+
+// record the search result for the record.
+// The records that do not match are marked as hidden in the store.
+// Only the records whose visibility changed are added to flipped so
+// that narrowing a search costs in proportion to the records that
+// changed.
+function setMatch(entry, matched, flipped) {
+    let hidden = !matched
+    if (!!entry.hidden !== hidden) {
+        entry.hidden = hidden
+        flipped.push(entry)
+    }
+}
+
+// show or hide the records whose visibility changed.
+// The windowed renderer only displays the records that are not hidden
+// so it only has to be updated once at the end of the search.
+function showFlipped(flipped, windowed) {
+    if (flipped.length === 0) {
+        return
+    }
+    if (windowed) {
+        SEARCH.stale = true
+        return
+    }
+    for (const entry of flipped) {
+        if (entry.hidden) {
+            hideRecord(entry.item)
+        } else {
+            showRecord(entry.item)
+        }
+    }
+}
+
+// finish a search pass.
+function finishSearch(value, num, windowed) {
+    if (windowed && SEARCH.stale) {
+        updateRecordsView()
+    }
+    SEARCH.stale = false
+    let counter = xget('#x-num-records')
+    if (counter.innerHTML !== String(num)) {
+        counter.xInnerHTML(num)
+    }
+    CACHED_SEARCH_VALUE = value
+    SEARCH.completed = value
+}
+
+// search the records synchronously.
+// The record data comes from the record store. Case insensitive
+// searches use the pre-lowercased strings in the search index.
+// A search pass started by scheduleSearch() that is in progress is
+// abandoned and restarted after this search.
+export function searchRecords(value) {
+    let running = SEARCH.running
+    SEARCH.generation++
+    SEARCH.running = null
+    value = getSearchValue(value)
     if (value === '.') {
         // This means means clear the old typed in search terms.
         clearSearch()
     }
-    let regex = null
-    try {
-        regex = window.prefs.searchCaseInsensitive ? new RegExp(value, 'i') : new RegExp(value)
-    } catch (exc) {
-        // This can occur when a partial expression is being typed in.
-        //alert(`ERROR: invalid search expression: "${value}"\nregexp:${exc}`)
-        value = '.'
-        regex = window.prefs.searchCaseInsensitive ? new RegExp(value, 'i') : new RegExp(value)
-    }
-    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
-    let accordionItems = recordsContainer.xGetN('.accordion-item')
+    let match = mkEntryMatcher(value)
+    let entries = getRecordEntries()
+    let windowed = isWindowed()
     let num = 0
-    for (let i=0; i<accordionItems.length; i++) {
-        let accordionItem = accordionItems[i]
-        let button = accordionItem.xGet('.accordion-button')
-        let title = button.innerHTML
-        let active = button.getAttribute('x-active') === 'true'
-        let matched = false
-
-        // ignore inactive records if the hide inactive records pref is set.
-        if (active === false && window.prefs.hideInactiveRecords) {
-            hideRecord(accordionItem)
-            continue
+    let flipped = []
+    for (let i=0; i<entries.length; i++) {
+        let matched = match(entries[i])
+        setMatch(entries[i], matched, flipped)
+        if (matched) {
+            num += 1
         }
+    }
+    showFlipped(flipped, windowed)
+    finishSearch(value, num, windowed)
+    if (running !== null && running !== value) {
+        startSearch(running)
+    }
+    searchIdle()
+}
 
-        // This record is a candidate for matching.
-        // First try to match the title.
-        if (title.match(regex) && window.prefs.searchRecordTitles) {
-            matched = true
-        } else {
-            // title didn't match: search by field names
-            if (!matched && window.prefs.searchRecordFieldNames) {
-                let names = accordionItem.xGetN('.x-fld-name')
-                for (let element of names) {
-                    let name = element.innerHTML
-                    if (name.match(regex)) {
-                        matched = true
-                        break
-                    }
-                }
-            }
+// schedule a search for the search input value.
+// Input events that arrive in quick succession are coalesced into a
+// single search which is skipped if the value was just searched.
+export function scheduleSearch(value) {
+    if (SEARCH.timer !== null) {
+        clearTimeout(SEARCH.timer)
+    }
+    searchBusy()
+    SEARCH.timer = setTimeout(() => {
+        SEARCH.timer = null
+        startSearch(getSearchValue(value))
+    }, SEARCH_DEBOUNCE_MS)
+}
 
-            // title and field name did not match: search by field values
-            if (!matched && window.prefs.searchRecordFieldValues) {
-                let values = accordionItem.xGetN('.x-fld-value')
-                for (let element of values) {
-                    let type = element.getAttribute('data-fld-type')
-                    // how should passwords be managed? using the raw value
-                    let value = element.getAttribute('data-fld-raw-value')
-                    if (value.match(regex)) {
-                        matched = true
-                        break
-                    }
-                }
+// mark PAM busy while a search is scheduled or running.
+function searchBusy() {
+    if (SEARCH.idle === null) {
+        SEARCH.idle = markBusy()
+    }
+}
+
+// end the busy mark when no search is scheduled or running.
+function searchIdle() {
+    if (SEARCH.idle !== null && SEARCH.timer === null && SEARCH.running === null) {
+        SEARCH.idle()
+        SEARCH.idle = null
+    }
+}
+
+// start a search pass that does not block the browser.
+// Field value searches run in the search worker when workers are
+// available because they are the most expensive and the most likely
+// to hit a slow regular expression. The pass is abandoned when a newer
+// search starts.
+function startSearch(value) {
+    if (value === SEARCH.running || (SEARCH.running === null && value === SEARCH.completed)) {
+        searchIdle()
+        return // already searched or being searched
+    }
+    searchBusy()
+    let generation = ++SEARCH.generation
+    SEARCH.running = value
+    if (value === '.') {
+        clearSearch()
+    }
+    if (window.prefs.searchRecordFieldValues && typeof Worker !== 'undefined' && !SEARCH_WORKER.failed) {
+        workerSearch(value, generation)
+    } else {
+        runSearchPass(value, generation, mkEntryMatcher(value))
+    }
+}
+
+// restart the search pass because the records changed.
+function restartSearch(value) {
+    SEARCH.running = null
+    SEARCH.completed = null
+    startSearch(value)
+}
+
+// apply match to the records in time slices so that the browser stays
+// responsive while searching large files.
+function runSearchPass(value, generation, match) {
+    let entries = getRecordEntries()
+    let numEntries = entries.length
+    let windowed = isWindowed()
+    let pos = 0
+    let num = 0
+    let slice = () => {
+        if (generation !== SEARCH.generation) {
+            return // a newer search started
+        }
+        if (getRecordEntries() !== entries || entries.length !== numEntries || isWindowed() !== windowed) {
+            restartSearch(value)
+            return
+        }
+        let end = performance.now() + SEARCH_SLICE_MS
+        let flipped = []
+        while (pos < numEntries && performance.now() < end) {
+            let matched = match(entries[pos], pos)
+            setMatch(entries[pos], matched, flipped)
+            if (matched) {
+                num += 1
             }
+            pos++
+        }
+        showFlipped(flipped, windowed) // each slice leaves the display consistent
+        if (pos < numEntries) {
+            yieldToBrowser(slice)
+            return
         }
+        SEARCH.running = null
+        finishSearch(value, num, windowed)
+        searchIdle()
+    }
+    slice()
+}
 
-        // Cleanup. If the record matched, display it otherwise hide it.
-        if (matched) {
-            num += 1
-            showRecord(accordionItem)
+// run the function when the browser is idle.
+function yieldToBrowser(fn) {
+    if (window.requestIdleCallback) {
+        window.requestIdleCallback(fn, {timeout: SEARCH_SLICE_MS * 4})
+    } else {
+        setTimeout(fn, 0)
+    }
+}
+
+// search the records in the search worker.
+// The worker replies with a bitmap of the matching records, the main
+// thread only shows and hides them. If the worker does not reply in
+// time it is terminated, that is the only way to stop a runaway
+// regular expression.
+// A new search does not stop the search in progress, a new worker
+// would need a new copy of all of the records. It waits for the reply
+// instead and only the last of the searches that waited is run.
+function workerSearch(value, generation) {
+    if (SEARCH_WORKER.busy) {
+        SEARCH_WORKER.next = {value: value, generation: generation}
+        return
+    }
+    let version = getStoreVersion()
+    let worker = null
+    try {
+        worker = getSearchWorker(version)
+    } catch (exc) {
+        // for example when the page was loaded from a file: URL.
+        SEARCH_WORKER.failed = true
+        runSearchPass(value, generation, mkEntryMatcher(value))
+        return
+    }
+    worker.onerror = () => {
+        stopSearchWorker()
+        SEARCH_WORKER.failed = true
+        if (generation === SEARCH.generation) {
+            runSearchPass(value, generation, mkEntryMatcher(value))
+        }
+        runNextWorkerSearch()
+    }
+    worker.onmessage = (event) => {
+        let msg = event.data
+        if (msg.generation !== generation) {
+            return // reply to an abandoned search
+        }
+        clearTimeout(SEARCH_WORKER.timer)
+        SEARCH_WORKER.timer = null
+        SEARCH_WORKER.busy = false
+        if (generation !== SEARCH.generation) {
+            runNextWorkerSearch() // a newer search started
+            return
+        }
+        if (msg.timeout) {
+            searchTimedOut(value, generation)
+        } else if (getStoreVersion() !== version) {
+            restartSearch(value)
         } else {
-            hideRecord(accordionItem)
+            let bitmap = msg.bitmap
+            runSearchPass(value, generation, (entry, pos) => {
+                return !isHiddenInactive(entry) && (bitmap[pos >>> 3] & (1 << (pos & 7))) !== 0
+            })
         }
     }
-    xget('#x-num-records').xInnerHTML(num)
-    CACHED_SEARCH_VALUE = value
+    SEARCH_WORKER.busy = true
+    SEARCH_WORKER.timer = setTimeout(() => {
+        stopSearchWorker()
+        searchTimedOut(value, generation)
+        runNextWorkerSearch()
+    }, SEARCH_WORKER_BUDGET_MS + 500)
+    worker.postMessage({
+        cmd: 'search',
+        generation: generation,
+        value: value,
+        caseInsensitive: !!window.prefs.searchCaseInsensitive,
+        options: getSearchOptions(),
+        budget: SEARCH_WORKER_BUDGET_MS,
+    })
+}
+
+// run the search that waited for the worker if it is still current.
+function runNextWorkerSearch() {
+    let next = SEARCH_WORKER.next
+    SEARCH_WORKER.next = null
+    if (next === null || next.generation !== SEARCH.generation) {
+        return
+    }
+    if (SEARCH_WORKER.failed) {
+        runSearchPass(next.value, next.generation, mkEntryMatcher(next.value))
+    } else {
+        workerSearch(next.value, next.generation)
+    }
+}
+
+// get the search worker with an up to date copy of the records.
+function getSearchWorker(version) {
+    if (!SEARCH_WORKER.worker) {
+        SEARCH_WORKER.worker = new Worker(new URL('./search-worker.js', import.meta.url), {type: 'module'})
+        SEARCH_WORKER.version = -1
+    }
+    if (SEARCH_WORKER.version !== version) {
+        let records = getRecordEntries().map((e) => {
+            return {
+                title: e.record.title,
+                fields: e.record.fields.map((f) => { return {name: f.name, value: f.value} }),
+            }
+        })
+        SEARCH_WORKER.worker.postMessage({cmd: 'load', records: records})
+        SEARCH_WORKER.version = version
+    }
+    return SEARCH_WORKER.worker
+}
+
+// terminate the search worker, it is restarted by the next search.
+function stopSearchWorker() {
+    if (SEARCH_WORKER.worker) {
+        SEARCH_WORKER.worker.terminate()
+    }
+    clearTimeout(SEARCH_WORKER.timer)
+    SEARCH_WORKER.timer = null
+    SEARCH_WORKER.worker = null
+    SEARCH_WORKER.version = -1
+    SEARCH_WORKER.busy = false
+}
+
+// the search took too long, leave the records as they are.
+function searchTimedOut(value, generation) {
+    if (generation !== SEARCH.generation) {
+        return
+    }
+    SEARCH.running = null
+    SEARCH.completed = value // do not repeat it
+    statusBlip('search stopped because the search expression is too slow')
+    searchIdle()
 }
 
 export function clearSearch() {
     document.body.xGet('#search').value = ''
     CACHED_SEARCH_VALUE = ''
+    SEARCH.completed = null
 }
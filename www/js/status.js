@@ -17,3 +17,32 @@ export function statusBlip(msg) {
     status(msg)
     setTimeout(() => {xget('#status').innerHTML = '&nbsp;'}, window.prefs.statusMsgDurationMS)
 }
+
+// The number of asynchronous operations in progress, see markBusy().
+let BUSY = 0
+
+/**
+ * Mark PAM busy until the returned function is called.
+ *
+ * The number of operations in progress is published as the data-busy
+ * attribute of the body, it is "0" when PAM is idle. The attribute is
+ * set when main() has finished, the tests wait for it instead of
+ * sleeping (tests/waits.py).
+ * @returns {function(): void} Call it when the operation is done, later
+ *   calls are ignored.
+ */
+export function markBusy() {
+    setBusy(BUSY + 1)
+    let done = false
+    return () => {
+        if (!done) {
+            done = true
+            setBusy(BUSY - 1)
+        }
+    }
+}
+
+function setBusy(num) {
+    BUSY = num
+    document.body.dataset.busy = num
+}
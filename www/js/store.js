@@ -0,0 +1,415 @@
+// Record store.
+/**
+ * The record data is kept in plain JavaScript objects that are the
+ * source of truth for save, search, print and raw edit:
+ *
+ *   {title, active, created, fields: [{name, type, value}]}
+ *
+ * The accordion items are rendered from these objects by record.js.
+ * The store keeps each record together with the accordion item that
+ * displays it in display (sorted) order and indexes them by the
+ * normalized title for O(1) lookups and O(log N) ordered insertion.
+ *
+ * Accordion items that were added to the #records-accordion container
+ * directly instead of through the store (for example by the unit
+ * tests) are adopted by reading their data from the DOM the next time
+ * the store is accessed.
+ *
+ * In windowed mode (see virtual.js) the store does not attach the
+ * accordion items to the container, the windowed renderer does. An
+ * entry item is null until the record is rendered.
+ * @module store
+ */
+
+export let INACTIVE = '<small>*INACTIVE*</small>&nbsp;'
+
+// accordion item -> record
+let RECORD_OF_ITEM = new WeakMap()
+
+// record -> JSON of the record as it is saved, see getRecordJSON().
+let RECORD_JSON = new WeakMap()
+
+// true if the records are displayed by the windowed renderer.
+let WINDOWED = false
+
+// incremented each time records are added or removed.
+let MODIFICATIONS = 0
+
+let STORE = {
+    container: null,  // the #records-accordion element that was indexed
+    entries: [],      // {key, item, record} in display order
+    index: new Map(), // normalized title -> first entry with that title
+    sorted: true,     // true if the entries are in sorted order
+}
+
+// normalize the title for case insensitive comparisons so
+// "Xyz" will be equal "xyz".
+export function normalizeTitle(title) {
+    return title.replace(INACTIVE, '').trim().toLowerCase()
+}
+
+// associate a record with the accordion item that displays it.
+export function setItemRecord(item, record) {
+    RECORD_OF_ITEM.set(item, record)
+}
+
+// get the record displayed by an accordion item.
+export function getItemRecord(item) {
+    let record = RECORD_OF_ITEM.get(item)
+    if (!record) {
+        record = readRecordFromDOM(item)
+        RECORD_OF_ITEM.set(item, record)
+    }
+    return record
+}
+
+// get the JSON of the record as it is saved.
+// now is the created date to use for records that do not have one.
+// Edited and cloned records are new record objects and deleted
+// records are dropped with their objects so the JSON is cached until
+// touchRecord() is called for a record that was modified in place.
+// Saves only serialize the records that changed since the last save.
+export function getRecordJSON(record, now) {
+    let json = RECORD_JSON.get(record)
+    if (json === undefined) {
+        json = JSON.stringify({
+            'title': record.title,
+            'active': record.active,
+            'created': record.created ? record.created : now,
+            'fields': record.fields,
+        })
+        if (record.created) {
+            RECORD_JSON.set(record, json) // do not cache the placeholder date
+        }
+    }
+    return json
+}
+
+// forget the saved JSON of a record that was modified in place.
+export function touchRecord(record) {
+    RECORD_JSON.delete(record)
+}
+
+// read the record data from an accordion item that was not created
+// from a record.
+function readRecordFromDOM(item) {
+    let button = item.xGet('.accordion-button')
+    let record = {
+        'title': button.innerHTML.replace(INACTIVE, ''),
+        'active': button.getAttribute('x-active') === 'true',
+        'created': button.getAttribute('x-created'),
+        'fields': [],
+    }
+    let names = item.xGetN('.x-fld-name')
+    let values = item.xGetN('.x-fld-value')
+    for (let i=0; i<names.length && i<values.length; i++) {
+        let valueDiv = values[i]
+        let value = valueDiv.hasAttribute('data-fld-raw-value') ?
+            valueDiv.getAttribute('data-fld-raw-value') : valueDiv.innerHTML
+        record.fields.push({
+            'name': names[i].innerHTML,
+            'type': valueDiv.getAttribute('data-fld-type'),
+            'value': value,
+        })
+    }
+    return record
+}
+
+// get the store, rebuild it if it is out of sync with the DOM.
+function getStore() {
+    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
+    if (!recordsContainer) {
+        return {container: null, entries: [], index: new Map(), sorted: true}
+    }
+    if (WINDOWED) {
+        return STORE // the container only holds the rendered window
+    }
+    if (STORE.container !== recordsContainer ||
+        STORE.entries.length !== recordsContainer.childElementCount) {
+        rebuildStore(recordsContainer)
+    }
+    return STORE
+}
+
+// rebuild the store from the records container.
+function rebuildStore(recordsContainer) {
+    let entries = []
+    let sorted = true
+    let accordionItems = recordsContainer.xGetN('.accordion-item')
+    for (let i=0; i<accordionItems.length; i++) {
+        let item = accordionItems[i]
+        let record = getItemRecord(item)
+        let key = normalizeTitle(record.title)
+        if (entries.length > 0 && entries[entries.length-1].key > key) {
+            sorted = false
+        }
+        // keep the search state of the items, see search.js.
+        let hidden = item.classList.contains('d-none')
+        entries.push({key: key, item: item, record: record, hidden: hidden})
+    }
+    MODIFICATIONS++
+    STORE = {
+        container: recordsContainer,
+        entries: entries,
+        index: new Map(),
+        sorted: sorted,
+    }
+    entries.forEach((e) => { indexEntry(STORE, e) })
+}
+
+// add the entry to the title index unless the title is already there.
+function indexEntry(store, entry) {
+    if (!store.index.has(entry.key)) {
+        store.index.set(entry.key, entry)
+    }
+}
+
+// find the position of the first entry whose key is greater
+// than the specified key.
+// This is an O(log N) binary search when the entries are sorted.
+function findEntryAfter(store, key) {
+    let entries = store.entries
+    if (!store.sorted) {
+        let pos = entries.findIndex((e) => e.key > key)
+        return pos < 0 ? entries.length : pos
+    }
+    let lo = 0
+    let hi = entries.length
+    while (lo < hi) {
+        let mid = (lo + hi) >>> 1
+        if (entries[mid].key > key) {
+            hi = mid
+        } else {
+            lo = mid + 1
+        }
+    }
+    return lo
+}
+
+// find the position of the first entry with the specified key.
+function findFirstEntry(store, key) {
+    let entries = store.entries
+    if (!store.sorted) {
+        return entries.findIndex((e) => e.key === key)
+    }
+    let lo = 0
+    let hi = entries.length
+    while (lo < hi) {
+        let mid = (lo + hi) >>> 1
+        if (entries[mid].key < key) {
+            lo = mid + 1
+        } else {
+            hi = mid
+        }
+    }
+    return (lo < entries.length && entries[lo].key === key) ? lo : -1
+}
+
+// find the position of the entry for the accordion item.
+function findEntry(store, item, key) {
+    let entries = store.entries
+    let pos = findFirstEntry(store, key)
+    while (pos >= 0 && pos < entries.length && entries[pos].key === key) {
+        if (entries[pos].item === item) {
+            return pos
+        }
+        pos++
+    }
+    return entries.findIndex((e) => e.item === item)
+}
+
+// get the top level node of the record in the records container.
+// mkRecord() wraps each accordion item in a div.
+export function getRecordNode(item, recordsContainer) {
+    let node = item
+    while (node.parentElement && node.parentElement !== recordsContainer) {
+        node = node.parentElement
+    }
+    return node
+}
+
+// get the accordion item from the node created by mkRecord().
+function getRecordItem(node) {
+    return node.classList.contains('accordion-item') ? node : node.xGet('.accordion-item')
+}
+
+// is the windowed renderer active?
+export function isWindowed() {
+    return WINDOWED
+}
+
+// enable or disable windowed mode.
+// The caller (virtual.js) is responsible for the container contents.
+export function setWindowed(flag) {
+    let store = getStore()
+    WINDOWED = flag
+    STORE = store
+}
+
+// get the number of times that records were added or removed.
+// It is used to detect when copies of the store entries are stale.
+export function getStoreVersion() {
+    return MODIFICATIONS
+}
+
+// get the records in display order.
+// Each entry has the normalized title (key), the accordion item
+// (item) and the record data (record).
+// The entries must not be modified except for the search state
+// (hidden and searchText) that search.js keeps in them.
+export function getRecordEntries() {
+    return getStore().entries
+}
+
+// get the number of records.
+export function getNumStoredRecords() {
+    return getStore().entries.length
+}
+
+// find the entry for the title.
+export function lookupRecord(title) {
+    let entry = getStore().index.get(normalizeTitle(title))
+    return entry ? entry : null
+}
+
+// find the entry for the record that would appear after this one
+// or null if it would be the last record.
+export function lookupRecordAfter(title) {
+    let store = getStore()
+    let pos = findEntryAfter(store, normalizeTitle(title))
+    return pos < store.entries.length ? store.entries[pos] : null
+}
+
+// add the node created by mkRecord() to the display in sorted order.
+// In windowed mode the node may be null, the record must be specified.
+export function addRecord(node, title, record) {
+    let store = getStore()
+    let item = node ? getRecordItem(node) : null
+    if (item && record) {
+        setItemRecord(item, record)
+    }
+    let key = normalizeTitle(title)
+    let pos = findEntryAfter(store, key)
+    // in windowed mode the windowed renderer attaches it when it is in view.
+    if (!WINDOWED) {
+        if (pos < store.entries.length) {
+            store.container.insertBefore(node, getRecordNode(store.entries[pos].item, store.container))
+        } else {
+            store.container.appendChild(node)
+        }
+    }
+    let entry = {key: key, item: item, record: item ? getItemRecord(item) : record}
+    MODIFICATIONS++
+    store.entries.splice(pos, 0, entry)
+    indexEntry(store, entry)
+}
+
+// add a batch of records to the display.
+// batch is an array of {title, record, node} objects where node was
+// created by mkRecord() for the record. The node is null in windowed
+// mode because the windowed renderer creates it when it is in view.
+// The batch is sorted once and merged with the existing records so
+// that each run of new records is attached with a single DOM
+// operation (a single operation for all of them when the display is
+// empty).
+export function addRecords(batch) {
+    let store = getStore()
+    if (!store.sorted) {
+        batch.forEach((b) => { addRecord(b.node, b.title, b.record) })
+        return
+    }
+    let added = batch.map((b) => {
+        let item = b.node ? getRecordItem(b.node) : null
+        if (item) {
+            setItemRecord(item, b.record)
+        }
+        return {key: normalizeTitle(b.title), item: item, record: b.record, node: b.node}
+    })
+    added.sort((a, b) => (a.key < b.key) ? -1 : (a.key > b.key) ? 1 : 0)
+    MODIFICATIONS++
+
+    // merge the sorted batch with the sorted entries.
+    let old = store.entries
+    let entries = []
+    let i = 0
+    let j = 0
+    while (i < added.length) {
+        while (j < old.length && old[j].key <= added[i].key) {
+            entries.push(old[j++])
+        }
+        let fragment = document.createDocumentFragment()
+        while (i < added.length && (j >= old.length || added[i].key < old[j].key)) {
+            let a = added[i++]
+            let entry = {key: a.key, item: a.item, record: a.record}
+            if (!WINDOWED) {
+                fragment.appendChild(a.node)
+            }
+            entries.push(entry)
+            indexEntry(store, entry)
+        }
+        if (WINDOWED) {
+            continue // the windowed renderer attaches them when they are in view.
+        }
+        if (j < old.length) {
+            store.container.insertBefore(fragment, getRecordNode(old[j].item, store.container))
+        } else {
+            store.container.appendChild(fragment)
+        }
+    }
+    while (j < old.length) {
+        entries.push(old[j++])
+    }
+    store.entries = entries
+}
+
+// remove the accordion item from the display and the store.
+export function removeRecord(item) {
+    let store = getStore()
+    let record = getItemRecord(item)
+    let key = normalizeTitle(record.title)
+    let pos = findEntry(store, item, key)
+    if (pos < 0) {
+        getRecordNode(item, store.container).remove()
+        store.container = null // not in the store, force a rebuild
+        return
+    }
+    removeEntryAt(store, pos)
+}
+
+// remove the store entry and its accordion item, if it has one.
+export function removeRecordEntry(entry) {
+    let store = getStore()
+    let pos = findFirstEntry(store, entry.key)
+    while (pos >= 0 && pos < store.entries.length && store.entries[pos] !== entry) {
+        pos++
+    }
+    if (pos >= 0 && pos < store.entries.length) {
+        removeEntryAt(store, pos)
+    }
+}
+
+// remove the entry at the specified position.
+function removeEntryAt(store, pos) {
+    let entry = store.entries[pos]
+    if (entry.item) {
+        getRecordNode(entry.item, store.container).remove()
+    }
+    MODIFICATIONS++
+    store.entries.splice(pos, 1)
+    if (store.index.get(entry.key) === entry) {
+        let next = findFirstEntry(store, entry.key)
+        if (next < 0) {
+            store.index.delete(entry.key)
+        } else {
+            store.index.set(entry.key, store.entries[next])
+        }
+    }
+}
+
+// remove all records.
+export function removeAllRecords() {
+    let recordsContainer = document.body.xGet('#records-accordion') // middle part of the document.
+    recordsContainer.replaceChildren()
+    WINDOWED = false
+    rebuildStore(recordsContainer)
+}
@@ -0,0 +1,111 @@
+// Vault cache.
+/**
+ * Opt-in IndexedDB cache of the last encrypted file that was loaded or
+ * saved, see the cacheVault pref. It is restored at startup so that the
+ * file does not have to be loaded again.
+ *
+ * The cache holds a single entry:
+ *
+ *   {filename, saved, cached, records, content}
+ *
+ * where content is an ArrayBuffer of the file exactly as it was loaded
+ * or saved (v1, v2 or v3 ciphertext, never plain JSON), saved is the
+ * date the file was saved and records is the number of records. The
+ * record titles are only stored in the ciphertext.
+ *
+ * The functions return promises that never reject, errors are logged
+ * and treated as an empty cache.
+ * @module vault-cache
+ */
+import { clog } from './utils.js'
+
+const DB_NAME = 'pam'
+const DB_VERSION = 1
+const DB_STORE = 'vault'
+const VAULT_KEY = 'vault'
+
+// the open database, see openDB().
+let DB = null
+
+// open the database, create the store the first time.
+function openDB() {
+    if (DB) {
+        return DB
+    }
+    DB = new Promise((resolve, reject) => {
+        if (!window.indexedDB) {
+            reject(new Error('IndexedDB is not available'))
+            return
+        }
+        let request = window.indexedDB.open(DB_NAME, DB_VERSION)
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(DB_STORE)
+        }
+        request.onsuccess = () => resolve(request.result)
+        request.onerror = () => reject(request.error)
+    })
+    DB.catch(() => { DB = null }) // try again next time
+    return DB
+}
+
+// run a request on the vault store.
+function storeRequest(mode, operation) {
+    return openDB()
+        .then((db) => new Promise((resolve, reject) => {
+            let tx = db.transaction(DB_STORE, mode)
+            let request = operation(tx.objectStore(DB_STORE))
+            tx.oncomplete = () => resolve(request.result)
+            tx.onerror = () => reject(tx.error)
+            tx.onabort = () => reject(tx.error)
+        }))
+}
+
+/**
+ * Get the cached file.
+ * @returns {Promise<object|null>} The cache entry or null if there is none.
+ */
+export function getCachedVault() {
+    return storeRequest('readonly', (store) => store.get(VAULT_KEY))
+        .then((entry) => entry ? entry : null)
+        .catch((error) => {
+            clog(`vault cache read failed: ${error}`)
+            return null
+        })
+}
+
+/**
+ * Cache a file, replacing the cached file.
+ * @param {string} filename - The file name.
+ * @param {ArrayBuffer} content - The encrypted file content.
+ * @param {string} saved - The date the file was saved (ISO 8601).
+ * @param {number} records - The number of records.
+ * @returns {Promise<boolean>} True if the file was cached.
+ */
+export function putCachedVault(filename, content, saved, records) {
+    let entry = {
+        filename: filename,
+        saved: saved,
+        cached: new Date().toISOString(),
+        records: records,
+        content: content,
+    }
+    return storeRequest('readwrite', (store) => store.put(entry, VAULT_KEY))
+        .then(() => true)
+        .catch((error) => {
+            clog(`vault cache write failed: ${error}`)
+            return false
+        })
+}
+
+/**
+ * Remove the cached file.
+ * @returns {Promise<boolean>} True if the cache is empty.
+ */
+export function clearCachedVault() {
+    return storeRequest('readwrite', (store) => store.delete(VAULT_KEY))
+        .then(() => true)
+        .catch((error) => {
+            clog(`vault cache clear failed: ${error}`)
+            return false
+        })
+}
@@ -0,0 +1,305 @@
+// Windowed rendering of the records accordion.
+/**
+ * Every rendered record is an accordion item with all of its field
+ * rows, buttons and event listeners so large vaults are expensive to
+ * display. When the number of records exceeds the
+ * windowedRenderingThreshold pref only the records near the visible
+ * part of the list are attached to #records-accordion. Spacer elements
+ * above and below them preserve the scroll height of the full list.
+ *
+ * Records that scroll out of the window are detached and cached so
+ * that they can be reattached when they scroll back into view, the
+ * oldest ones are released when the cache is full.
+ *
+ * The record store (store.js) is the source of truth. Search marks the
+ * store entries that do not match as hidden and the windowed renderer
+ * only lays out the entries that are not hidden.
+ * @module virtual
+ */
+import { xmk } from './lib.js'
+import { getNumStoredRecords, getRecordEntries, getRecordNode, isWindowed, setWindowed } from './store.js'
+import { getEntryItem } from './record.js'
+
+const ESTIMATED_ROW_HEIGHT = 60 // pixels, used until a collapsed record is measured
+const OVERSCAN = 10             // records rendered above and below the viewport
+const CACHE_SIZE = 200          // detached records kept for reattachment
+
+let VIEW = {
+    visible: null,    // entries that are not hidden, null if stale
+    rowHeight: 0,     // measured height of a collapsed record
+    extra: new Map(), // entry -> height difference from rowHeight (expanded records)
+    extraPos: null,   // sorted [position, height difference] pairs, null if stale
+    rendered: [],     // entries attached to the container in display order
+    cache: new Set(), // detached entries that still have an item, oldest first
+    top: null,        // top spacer element
+    bottom: null,     // bottom spacer element
+    pending: false,   // true if a render is scheduled
+    listening: false, // true if the event listeners are installed
+}
+
+// should the records be displayed by the windowed renderer?
+export function useWindowedRendering(numRecords) {
+    let threshold = parseInt(window.prefs.windowedRenderingThreshold, 10)
+    return threshold > 0 && numRecords > threshold
+}
+
+// update the records view after the records or the search results changed.
+// numRecords is the number of records that the view is being
+// prepared for, it defaults to the number of records in the store.
+// Returns true if the records are displayed by the windowed renderer.
+export function updateRecordsView(numRecords) {
+    if (numRecords === undefined) {
+        numRecords = getNumStoredRecords()
+    }
+    let windowed = useWindowedRendering(numRecords)
+    if (windowed !== isWindowed()) {
+        if (windowed) {
+            enterWindowedMode()
+        } else {
+            leaveWindowedMode()
+        }
+    } else if (!windowed && VIEW.top) {
+        resetView() // the records were cleared
+    }
+    if (windowed) {
+        VIEW.visible = null
+        VIEW.extraPos = null
+        renderWindow()
+    }
+    return windowed
+}
+
+// switch to windowed rendering.
+function enterWindowedMode() {
+    let recordsContainer = document.body.xGet('#records-accordion')
+    let entries = getRecordEntries()
+    setWindowed(true)
+    recordsContainer.replaceChildren()
+    resetView()
+    VIEW.top = xmk('div').xClass('x-records-spacer')
+    VIEW.bottom = xmk('div').xClass('x-records-spacer')
+    recordsContainer.append(VIEW.top, VIEW.bottom)
+    entries.forEach((e) => {
+        if (e.item) {
+            VIEW.cache.add(e)
+        }
+    })
+    trimCache()
+    if (!VIEW.listening) {
+        VIEW.listening = true
+        document.addEventListener('scroll', scheduleRender, true)
+        window.addEventListener('resize', scheduleRender)
+        recordsContainer.addEventListener('show.bs.collapse', collapseDetachedRecords)
+        recordsContainer.addEventListener('shown.bs.collapse', scheduleRender)
+        recordsContainer.addEventListener('hidden.bs.collapse', scheduleRender)
+    }
+}
+
+// switch back to rendering all of the records.
+function leaveWindowedMode() {
+    let recordsContainer = document.body.xGet('#records-accordion')
+    let nodes = getRecordEntries().map((e) => {
+        let item = getEntryItem(e)
+        item.classList.toggle('d-none', !!e.hidden)
+        return getRecordNode(item, recordsContainer)
+    })
+    resetView()
+    recordsContainer.replaceChildren(...nodes)
+    setWindowed(false)
+}
+
+// forget the window state.
+function resetView() {
+    VIEW.visible = null
+    VIEW.extra = new Map()
+    VIEW.extraPos = null
+    VIEW.rendered = []
+    VIEW.cache = new Set()
+    VIEW.top = null
+    VIEW.bottom = null
+}
+
+// render the window on the next animation frame.
+function scheduleRender() {
+    if (!isWindowed() || VIEW.pending) {
+        return
+    }
+    VIEW.pending = true
+    window.requestAnimationFrame(() => {
+        VIEW.pending = false
+        if (isWindowed()) {
+            renderWindow()
+        }
+    })
+}
+
+// get the height of a collapsed record.
+function getRowHeight() {
+    return VIEW.rowHeight > 0 ? VIEW.rowHeight : ESTIMATED_ROW_HEIGHT
+}
+
+// get the positions of the records whose height is not the row height.
+function getExtraPositions() {
+    if (VIEW.extraPos === null) {
+        let extraPos = []
+        VIEW.extra.forEach((height, entry) => {
+            let pos = VIEW.visible.indexOf(entry)
+            if (pos >= 0) {
+                extraPos.push([pos, height])
+            }
+        })
+        VIEW.extraPos = extraPos.sort((a, b) => a[0] - b[0])
+    }
+    return VIEW.extraPos
+}
+
+// get the vertical offset of the visible record at the position.
+function offsetOf(pos) {
+    let y = pos * getRowHeight()
+    for (const [p, height] of getExtraPositions()) {
+        if (p >= pos) {
+            break
+        }
+        y += height
+    }
+    return y
+}
+
+// get the position of the visible record at the vertical offset.
+function positionAt(y) {
+    let lo = 0
+    let hi = VIEW.visible.length
+    while (lo < hi) {
+        let mid = (lo + hi + 1) >>> 1
+        if (offsetOf(mid) <= y) {
+            lo = mid
+        } else {
+            hi = mid - 1
+        }
+    }
+    return lo
+}
+
+// is the record expanded?
+function isExpanded(entry) {
+    return !!entry.item && !!entry.item.xGet('.accordion-collapse.show')
+}
+
+// attach the records near the viewport and detach the others.
+function renderWindow() {
+    let recordsContainer = document.body.xGet('#records-accordion')
+    if (VIEW.visible === null) {
+        VIEW.visible = getRecordEntries().filter((e) => !e.hidden)
+        VIEW.extraPos = null
+    }
+    if (VIEW.top.parentElement !== recordsContainer) {
+        recordsContainer.replaceChildren(VIEW.top, VIEW.bottom)
+    }
+
+    // Find the part of the records container that is visible. This
+    // works whether the window or #mid-section is scrolled.
+    let rect = recordsContainer.getBoundingClientRect()
+    let clipTop = 0
+    let clipBottom = window.innerHeight
+    let mid = document.body.xGet('#mid-section')
+    if (mid) {
+        let midRect = mid.getBoundingClientRect()
+        clipTop = Math.max(clipTop, midRect.top)
+        clipBottom = Math.min(clipBottom, midRect.bottom)
+    }
+    let num = VIEW.visible.length
+    let first = Math.max(0, positionAt(clipTop - rect.top) - OVERSCAN)
+    let last = Math.min(num, positionAt(clipBottom - rect.top) + 1 + OVERSCAN)
+    let wanted = VIEW.visible.slice(first, last)
+
+    // Detach the records that are no longer in the window.
+    let wantedSet = new Set(wanted)
+    for (const entry of VIEW.rendered) {
+        if (!wantedSet.has(entry) && entry.item) {
+            getRecordNode(entry.item, recordsContainer).remove()
+            VIEW.cache.add(entry)
+        }
+    }
+
+    // Attach the records in the window in display order.
+    let cursor = VIEW.top.nextElementSibling
+    for (const entry of wanted) {
+        VIEW.cache.delete(entry)
+        let item = getEntryItem(entry)
+        item.classList.remove('d-none')
+        let node = getRecordNode(item, recordsContainer)
+        if (node === cursor) {
+            cursor = cursor.nextElementSibling
+        } else {
+            recordsContainer.insertBefore(node, cursor)
+        }
+    }
+    VIEW.rendered = wanted
+    trimCache()
+
+    VIEW.top.style.height = `${offsetOf(first)}px`
+    VIEW.bottom.style.height = `${offsetOf(num) - offsetOf(last)}px`
+    measureWindow(recordsContainer)
+}
+
+// measure the rendered records, schedule another render if the
+// heights differ from the ones that were used for the layout.
+function measureWindow(recordsContainer) {
+    let changed = false
+    for (const entry of VIEW.rendered) {
+        let height = getRecordNode(entry.item, recordsContainer).getBoundingClientRect().height
+        if (height <= 0) {
+            continue // not laid out
+        }
+        if (VIEW.rowHeight <= 0 && !isExpanded(entry)) {
+            VIEW.rowHeight = height
+            changed = true
+        }
+        let diff = height - getRowHeight()
+        let old = VIEW.extra.has(entry) ? VIEW.extra.get(entry) : 0
+        if (Math.abs(diff - old) > 1) {
+            if (Math.abs(diff) > 1) {
+                VIEW.extra.set(entry, diff)
+            } else {
+                VIEW.extra.delete(entry)
+            }
+            changed = true
+        }
+    }
+    if (changed) {
+        VIEW.extraPos = null
+        scheduleRender()
+    }
+}
+
+// release the oldest detached records when the cache is full.
+// Expanded records are kept so that they stay expanded.
+function trimCache() {
+    for (const entry of VIEW.cache) {
+        if (VIEW.cache.size <= CACHE_SIZE) {
+            break
+        }
+        if (!isExpanded(entry)) {
+            VIEW.cache.delete(entry)
+            VIEW.extra.delete(entry)
+            entry.item = null
+        }
+    }
+}
+
+// Only one record can be expanded at a time. Bootstrap collapses the
+// other records in the container when a record is expanded so this
+// collapses the detached ones.
+function collapseDetachedRecords(event) {
+    for (const entry of VIEW.cache) {
+        let collapse = isExpanded(entry) ? entry.item.xGet('.accordion-collapse') : null
+        if (collapse && collapse !== event.target) {
+            collapse.classList.remove('show')
+            let button = entry.item.xGet('.accordion-button')
+            button.classList.add('collapsed')
+            button.setAttribute('aria-expanded', 'false')
+            VIEW.extra.delete(entry)
+        }
+    }
+    VIEW.extraPos = null
+}
@@ -0,0 +1,110 @@
+// Service worker.
+/**
+ * Precaches the application shell so that PAM starts without the
+ * network, see registerServiceWorker() in main.js.
+ *
+ * The shell is cached under the version in js/version.js, which make
+ * regenerates whenever the sources change. This is a module worker
+ * that imports js/version.js, so a new version is a changed import
+ * that makes the browser install the new worker in the background:
+ * it precaches the new shell and takes over the next time PAM starts,
+ * then the old shell is deleted. Until then the running version is
+ * served from its own cache, so the modules of a page are never mixed
+ * across versions.
+ *
+ * Shell requests are served cache first, everything else (the
+ * examples, the help and other sites) goes to the network.
+ *
+ * New modules, stylesheets and images that PAM loads at startup must
+ * be added to SHELL_FILES.
+ * @module sw
+ */
+import { VERSION, COMMIT_ID } from './js/version.js'  // automatically generated by make
+
+const SHELL_CACHE_PREFIX = 'pam-shell-'
+const SHELL_CACHE = `${SHELL_CACHE_PREFIX}${VERSION}-${COMMIT_ID}`
+
+// relative to the scope of the worker (www).
+// The scope itself is served as ./index.html.
+const SHELL_FILES = [
+    './index.html',
+    './site.webmanifest',
+    './favicon.ico',
+    './favicon-16x16.png',
+    './favicon-32x32.png',
+    './apple-touch-icon.png',
+    './android-chrome-192x192.png',
+    './android-chrome-512x512.png',
+    './css/bootstrap.min.css',
+    './css/pam.css',
+    './css/print-report.css',
+    './font/bootstrap-icons.css',
+    './font/fonts/bootstrap-icons.woff',
+    './font/fonts/bootstrap-icons.woff2',
+    './js/bootstrap.bundle.js',
+    './js/about.js',
+    './js/cipher.js',
+    './js/crypt-worker.js',
+    './js/crypt.js',
+    './js/en_words.js',
+    './js/field.js',
+    './js/lib.js',
+    './js/load.js',
+    './js/main.js',
+    './js/menu.js',
+    './js/password.js',
+    './js/prefs-model.js',
+    './js/prefs.js',
+    './js/print.js',
+    './js/raw.js',
+    './js/record-stream.js',
+    './js/record.js',
+    './js/save.js',
+    './js/search-match.js',
+    './js/search-worker.js',
+    './js/search.js',
+    './js/status.js',
+    './js/store.js',
+    './js/utils.js',
+    './js/vault-cache.js',
+    './js/version.js',
+    './js/virtual.js',
+]
+
+// the shell URLs without the query, the icon font is requested with one.
+const SHELL_URLS = new Set(SHELL_FILES.map((file) => new URL(file, self.registration.scope).href))
+
+self.addEventListener('install', (event) => {
+    // bypass the HTTP cache so that the shell matches the version
+    let requests = SHELL_FILES.map((file) => new Request(file, {cache: 'reload'}))
+    event.waitUntil(caches.open(SHELL_CACHE).then((cache) => cache.addAll(requests)))
+})
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then((names) => Promise.all(
+                names.filter((name) => name.startsWith(SHELL_CACHE_PREFIX) && name !== SHELL_CACHE)
+                    .map((name) => caches.delete(name))))
+            .then(() => self.clients.claim()))
+})
+
+self.addEventListener('fetch', (event) => {
+    let request = event.request
+    if (request.method !== 'GET') {
+        return
+    }
+    let url = new URL(request.url)
+    url.search = ''
+    url.hash = ''
+    if (url.href === self.registration.scope) {
+        url = new URL('./index.html', self.registration.scope)
+    }
+    if (!SHELL_URLS.has(url.href)) {
+        return // not part of the shell, use the network
+    }
+    event.respondWith(
+        caches.open(SHELL_CACHE)
+            .then((cache) => cache.match(url.href))
+            .then((response) => response ? response : fetch(request)))
+})